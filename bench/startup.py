@@ -0,0 +1,55 @@
+"""
+Measures CLI and library startup time.
+
+Runs `python -m parcel <subcommand> --help` for every subcommand, and a
+bare `import parcel`, in fresh interpreters and reports the fastest and
+median wall clock time of each.
+
+    python bench/startup.py [--runs N]
+"""
+
+import sys
+import time
+import argparse
+import subprocess
+from statistics import median
+from os.path import dirname, abspath
+
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+
+def _time(argv, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times), median(times)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', '-n', type=int, default=10)
+    args = parser.parse_args(args)
+
+    sys.path.insert(0, ROOT)
+    from parcel.__main__ import SUBCOMMANDS
+
+    cases = [
+        ('python', [sys.executable, '-c', 'pass']),
+        ('import parcel', [sys.executable, '-c', 'import parcel']),
+    ]
+    cases.extend(
+        (f'parcel {name}', [sys.executable, '-m', 'parcel', name, '--help'])
+        for name in SUBCOMMANDS
+    )
+
+    print(f'{"case":<24}{"min ms":>10}{"median ms":>12}')
+    for name, argv in cases:
+        best, mid = _time(argv, args.runs)
+        print(f'{name:<24}{best * 1000:>10.1f}{mid * 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,8 +1,15 @@
-from pkg_resources import parse_version
-from pkg_resources.extern.packaging.version import Version
-from .parcel import Parcel, Manifest
+from .version import parse_version, Version
 
 
 __all__ = [
     "Parcel", "Manifest", "load", "create", "parse_version", "Version",
 ]
+
+
+def __getattr__(name):
+    # Parcel pulls in nacl, tarfile and json, only import it when used.
+    if name in ('Parcel', 'Manifest'):
+        from . import parcel
+        value = globals()[name] = getattr(parcel, name)
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -4,19 +4,18 @@ import argparse
 import stat
 
 from binascii import hexlify
-from pprint import pprint
 from functools import wraps
 from contextlib import contextmanager
 from os.path import dirname, expanduser, splitext, join as pathjoin
 
-from nacl.signing import SigningKey
-
-from .parcel import Parcel
-
 
+# NOTE: nacl, pprint and .parcel are imported by the subcommands that need
+# them, the CLI is started often and should only pay for what it uses.
 SUBCOMMANDS = {}
 PARCEL_HOME = os.getenv('PARCEL_HOME', '~/.parcel/')
 KEY_PATH = pathjoin(PARCEL_HOME, 'key')
+KEYRING_PATH = pathjoin(PARCEL_HOME, 'keyring.json')
+BUILD_CACHE_PATH = pathjoin(PARCEL_HOME, 'build')
 
 
 def _error(msg, code=1):
@@ -30,6 +29,8 @@ def _save_key(path, key, overwrite=False):
 
 
 def _load_key(path):
+    from nacl.signing import SigningKey
+
     try:
         with open(path, 'rb') as f:
             return SigningKey(f.read())
@@ -39,6 +40,19 @@ def _load_key(path):
                f'generate one.')
 
 
+def _load_keyring(path):
+    "Returns the keyring at path, None if the default one does not exist."
+    from .keyring import Keyring
+
+    try:
+        return Keyring.load(expanduser(path))
+
+    except FileNotFoundError:
+        if path != KEYRING_PATH:
+            _error(f'Keyring file "{path}" does not exist.')
+        return None
+
+
 @contextmanager
 def _create_file(path, chmod=stat.S_IRUSR | stat.S_IWUSR, overwrite=False):
     mode = 'wb' if overwrite else 'xb'
@@ -71,6 +85,8 @@ def keygen(args):
     parser.add_argument('--force', '-f',  action='store_true')
     args = parser.parse_args(args)
 
+    from nacl.signing import SigningKey
+
     path = expanduser(args.path)
     try:
         os.makedirs(dirname(path))
@@ -92,18 +108,45 @@ def build(args):
     parser.add_argument('--key', '-k', default=KEY_PATH, help='Path to load / save key')
     parser.add_argument('--keygen', '-g', action='store_true', help='generate new key')
     parser.add_argument('--force', '-f', action='store_true', help='Overwrite files')
+    parser.add_argument('--format', type=int, choices=(1, 2, 3),
+                        help='Parcel format, 3 adds a table of contents')
+    parser.add_argument('--compression', '-c', default='gzip',
+                        choices=('gzip', 'xz', 'bz2', 'zstd'))
+    parser.add_argument('--level', '-l', type=int,
+                        help='Compression level, defaults per codec')
+    parser.add_argument('--threads', '-t', type=int, default=1,
+                        help='Threads to compress gzip on, 0 for all CPUs')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always build, even if nothing changed')
     args = parser.parse_args(args)
 
+    from .build import BuildCache, build_uuid
+    from .parcel import Parcel
+    from .compression import Compression
+
+    try:
+        compression = Compression(args.compression, args.level, args.threads)
+
+    except AssertionError as e:
+        _error(f'Invalid compression: "{e.args[0]}"')
+
     parcel = Parcel.load_manifest(args.manifest)
+    build_uuid(parcel)
     path = splitext(args.manifest)[0] + '.pcl'
+    kwargs = {'overwrite': args.force, 'compression': compression}
+    if args.format:
+        kwargs['format'] = args.format
 
     if args.keygen:
-        key = parcel.save_parcel(path, overwrite=args.force)
+        key = parcel.save_parcel(path, **kwargs)
         _save_key(args.key, key, overwrite=args.force)
 
     else:
         key = _load_key(expanduser(args.key))
-        parcel.save_parcel(path, key=key, overwrite=args.force)
+        # Only a known key can build the same parcel again.
+        if not args.no_cache:
+            kwargs['build_cache'] = BuildCache(expanduser(BUILD_CACHE_PATH))
+        parcel.save_parcel(path, key=key, **kwargs)
 
 
 @subcommand
@@ -114,10 +157,20 @@ def info(args):
     parser = argparse.ArgumentParser(
         prog='parcel info', description=info.__doc__)
     parser.add_argument('path')
+    parser.add_argument('--keyring', default=KEYRING_PATH,
+                        help='Trusted keys of authors')
     args = parser.parse_args(args)
 
+    from pprint import pprint
+    from .parcel import Parcel
+    from .keyring import UntrustedKey
+
+    keyring = _load_keyring(args.keyring)
     try:
-        parcel = Parcel.load_parcel(args.path, verify=True)
+        parcel = Parcel.load_parcel(args.path, verify=True, keyring=keyring)
+
+    except UntrustedKey as e:
+        _error(f'Failed to load {args.path}: {e}')
 
     except Exception:
         _error(f'Failed to load {args.path}')
@@ -131,49 +184,357 @@ def info(args):
     })
     print('FILES')
     files = {
-        f.name: f.value.getvalue().decode() for f in parcel.files
+        f.name: f.read().decode() for f in parcel.files
     }
     pprint(files)
 
 
+def _audit(prog, doc, args, lint):
+    parser = argparse.ArgumentParser(prog=prog, description=doc)
+    parser.add_argument('paths', nargs='+', metavar='path',
+                        help='Parcel, directory or glob')
+    parser.add_argument('--keyring', default=KEYRING_PATH,
+                        help='Trusted keys of authors')
+    parser.add_argument('--jobs', '-j', type=int,
+                        help='Processes, one per CPU by default')
+    parser.add_argument('--json', action='store_true',
+                        help='Print a JSON line per parcel and a summary')
+    args = parser.parse_args(args)
+
+    import json
+    from .audit import check_parcels, summarize
+
+    keyring = _load_keyring(args.keyring)
+    results = []
+    for result in check_parcels(
+            args.paths, lint=lint, keyring=keyring, workers=args.jobs):
+        results.append(result)
+        if args.json:
+            print(json.dumps(result), flush=True)
+        elif result['ok']:
+            print(f'OK {result["path"]} '
+                  f'({result["name"]}=={result["version"]})', flush=True)
+        else:
+            print(f'FAIL {result["path"]}: {result["stage"]} '
+                  f'{result["error"]}', flush=True)
+
+    summary = summarize(results)
+    if args.json:
+        print(json.dumps({'summary': summary}))
+    else:
+        print(f'{summary["total"]} parcels, {summary["ok"]} ok, '
+              f'{summary["failed"]} failed')
+    if not summary['total']:
+        _error('No parcels found')
+    if summary['failed']:
+        exit(1)
+
+
+@subcommand
+def verify(args):
+    """
+    Verify the signatures of parcels.
+    """
+    _audit('parcel verify', verify.__doc__, args, lint=False)
+
+
 @subcommand
 def lint(args):
     """
-    Lint a parcel.
+    Verify and lint parcels.
     """
     # Parse the service definition and enumerate files.
+    _audit('parcel lint', lint.__doc__, args, lint=True)
+
+
+@subcommand
+def trust(args):
+    """
+    Trust a key to sign the parcels of an author.
+    """
     parser = argparse.ArgumentParser(
-        prog='parcel lint', description=lint.__doc__)
-    parser.add_argument('path')
+        prog='parcel trust', description=trust.__doc__)
+    parser.add_argument('author', help='Email of the author')
+    parser.add_argument('pubkey', help='Hex public key, or a parcel path')
+    parser.add_argument('--keyring', default=KEYRING_PATH)
     args = parser.parse_args(args)
 
+    from binascii import unhexlify, Error
+    from .keyring import Keyring
+
+    path = expanduser(args.keyring)
+    keyring = Keyring.load(path) if os.path.isfile(path) else Keyring()
+    if os.path.isfile(args.pubkey):
+        from .parcel import Parcel
+
+        pubkey = Parcel.load_parcel(args.pubkey, lazy=True).pubkey
+
+    else:
+        try:
+            pubkey = unhexlify(args.pubkey)
+
+        except Error:
+            _error(f'Invalid public key "{args.pubkey}"')
+
     try:
-        parcel = Parcel.load_parcel(args.path, verify=True)
+        keyring.add(args.author, pubkey)
 
     except Exception:
-        _error(f'Failed to load {args.path}')
+        _error(f'Invalid public key "{args.pubkey}"')
+
+    if dirname(path):
+        os.makedirs(dirname(path), exist_ok=True)
+    keyring.save(path)
+
+
+@subcommand
+def index(args):
+    """
+    Update the index of a repository directory.
+    """
+    parser = argparse.ArgumentParser(
+        prog='parcel index', description=index.__doc__)
+    parser.add_argument('path', help='Repository directory')
+    parser.add_argument('--no-verify', action='store_true',
+                        help='Skip signature verification')
+    parser.add_argument('--catalogue', action='store_true',
+                        help='Also write the binary catalogue')
+    args = parser.parse_args(args)
+
+    from .repository import Repository
 
     try:
-        parcel.lint()
+        repository = Repository(args.path)
 
-    except AssertionError as e:
-        _error(f'Linting error: "{e.args[0]}"')
+    except (OSError, ValueError, AssertionError) as e:
+        _error(f'Failed to open repository {args.path}: {e}')
 
-    print('Linting success')
+    indexed, removed = repository.update(verify=not args.no_verify)
+    if args.catalogue:
+        repository.save_catalogue()
+    print(f'{len(repository)} parcels, {indexed} indexed, {removed} removed')
+
+
+@subcommand
+def delta(args):
+    """
+    Write the delta from an old parcel to a new one.
+    """
+    parser = argparse.ArgumentParser(
+        prog='parcel delta', description=delta.__doc__)
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--output', '-o',
+                        help='Defaults to the new parcel with .pcld')
+    parser.add_argument('--force', '-f', action='store_true',
+                        help='Overwrite files')
+    args = parser.parse_args(args)
+
+    from .delta import make_delta, EXTENSION
+
+    path = args.output or splitext(args.new)[0] + EXTENSION
+    if os.path.exists(path) and not args.force:
+        _error(f'"{path}" exists, try --force')
+    try:
+        inserted = make_delta(args.old, args.new, path)
+
+    except Exception as e:
+        _error(f'Failed to make a delta: {e}')
+
+    print(f'{path}: {os.path.getsize(path)} bytes, {inserted} inserted')
+
+
+@subcommand
+def patch(args):
+    """
+    Rebuild a parcel from an old one and a delta.
+    """
+    parser = argparse.ArgumentParser(
+        prog='parcel patch', description=patch.__doc__)
+    parser.add_argument('old')
+    parser.add_argument('delta')
+    parser.add_argument('--output', '-o',
+                        help='Defaults to the delta with .pcl')
+    parser.add_argument('--force', '-f', action='store_true',
+                        help='Overwrite files')
+    parser.add_argument('--keyring', default=KEYRING_PATH,
+                        help='Trusted keys of authors, without one the '
+                             'parcel must be signed like the old one')
+    args = parser.parse_args(args)
+
+    from .delta import apply_delta
+
+    keyring = _load_keyring(args.keyring)
+    path = args.output or splitext(args.delta)[0] + '.pcl'
+    try:
+        apply_delta(args.old, args.delta, path, overwrite=args.force,
+                    keyring=keyring)
+
+    except FileExistsError:
+        _error(f'"{path}" exists, try --force')
+
+    except Exception as e:
+        _error(f'Failed to apply {args.delta}: {e}')
+
+    print(path)
+
+
+@subcommand
+def store(args):
+    """
+    Add parcels to a deduplicated store.
+    """
+    parser = argparse.ArgumentParser(
+        prog='parcel store', description=store.__doc__)
+    parser.add_argument('store', help='Store directory')
+    parser.add_argument('paths', nargs='*', metavar='path')
+    parser.add_argument('--gc', action='store_true',
+                        help='Remove chunks no parcel uses')
+    args = parser.parse_args(args)
+
+    from nacl.exceptions import BadSignatureError
+    from .chunks import ChunkStore
+
+    chunk_store = ChunkStore(args.store)
+    for path in args.paths:
+        try:
+            recipe = chunk_store.add(path)
+
+        except BadSignatureError:
+            _error(f'Failed to store {path}: its signature does not verify')
+
+        except Exception as e:
+            _error(f'Failed to store {path}: {e}')
+
+        print(f'{path}: {len(recipe["chunks"])} chunks, '
+              f'{recipe["written"]} bytes written')
+
+    if args.gc:
+        removed, freed = chunk_store.gc()
+        print(f'{removed} chunks removed, {freed} bytes freed')
+    stats = chunk_store.stats()
+    print(f'{stats["parcels"]} parcels of {stats["size"]} bytes in '
+          f'{stats["chunks"]} chunks of {stats["stored"]} bytes')
+
+
+@subcommand
+def rebuild(args):
+    """
+    Rebuild parcels from a deduplicated store.
+    """
+    parser = argparse.ArgumentParser(
+        prog='parcel rebuild', description=rebuild.__doc__)
+    parser.add_argument('store', help='Store directory')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='Parcels to rebuild, all by default')
+    parser.add_argument('--dest', '-d', default='.',
+                        help='Directory to write to')
+    parser.add_argument('--force', '-f', action='store_true',
+                        help='Overwrite files')
+    args = parser.parse_args(args)
+
+    from .chunks import ChunkStore
+
+    chunk_store = ChunkStore(args.store)
+    os.makedirs(args.dest, exist_ok=True)
+    for name in args.names or chunk_store.names():
+        path = pathjoin(args.dest, name)
+        try:
+            chunk_store.rebuild(name, path, overwrite=args.force)
+
+        except FileExistsError:
+            _error(f'"{path}" exists, try --force')
+
+        except Exception as e:
+            _error(f'Failed to rebuild {name}: {e}')
+
+        print(path)
 
 
 @subcommand
 def download(args):
     """
-    Download a parcel.
+    Download parcels and their requirements from a repository.
     """
+    parser = argparse.ArgumentParser(
+        prog='parcel download', description=download.__doc__)
+    parser.add_argument('url', help='Repository URL or directory')
+    parser.add_argument('specs', nargs='+', metavar='spec',
+                        help='Parcel to install, e.g. "foo>=1.0"')
+    parser.add_argument('--dest', '-d', default='.',
+                        help='Directory to download to')
+    parser.add_argument('--jobs', '-j', type=int, default=4,
+                        help='Concurrent downloads')
+    parser.add_argument('--keyring', default=KEYRING_PATH,
+                        help='Trusted keys of authors')
+    args = parser.parse_args(args)
+
+    from functools import partial
+    from .pallet import Pallet
+    from .repository import entry_manifest
+    from .solver import Solver
+    from .spec import Spec
+    from .transport import (
+        open_transport, plan, fetch_all, verify_entry, TransportError,
+    )
+
+    keyring = _load_keyring(args.keyring)
+
+    with open_transport(args.url, args.jobs) as transport:
+        try:
+            entries = transport.index()
+
+        except (OSError, ValueError, AssertionError, TransportError) as e:
+            _error(f'Failed to read the index of {args.url}: {e}')
+
+        pallet = Pallet()
+        for entry in entries.values():
+            pallet.add_spec(entry_manifest(entry))
+        solution = Solver(pallet=pallet).solve_best(
+            [], [Spec.parse(spec) for spec in args.specs])
+        if solution is None:
+            _error('No parcels satisfy ' + ', '.join(args.specs))
+
+        os.makedirs(args.dest, exist_ok=True)
+        try:
+            # The index is not signed, the parcels are.
+            paths = fetch_all(transport, plan(entries, solution[0]),
+                              args.dest, workers=args.jobs,
+                              check=partial(verify_entry, keyring=keyring))
+
+        except Exception as e:
+            _error(f'Failed to download: {e}')
+
+    for path in paths:
+        print(path)
 
 
 @subcommand
 def upload(args):
     """
-    Upload a parcel.
+    Upload parcels to a repository.
     """
+    parser = argparse.ArgumentParser(
+        prog='parcel upload', description=upload.__doc__)
+    parser.add_argument('url', help='Repository URL or directory')
+    parser.add_argument('paths', nargs='+', metavar='path')
+    parser.add_argument('--jobs', '-j', type=int, default=4,
+                        help='Concurrent uploads')
+    args = parser.parse_args(args)
+
+    from .repository import Repository
+    from .transport import open_transport, upload_all, DirectoryTransport
+
+    with open_transport(args.url, args.jobs) as transport:
+        try:
+            upload_all(transport, args.paths, workers=args.jobs)
+
+        except Exception as e:
+            _error(f'Failed to upload: {e}')
+
+    # HTTP servers index what is uploaded themselves.
+    if isinstance(transport, DirectoryTransport):
+        Repository(transport.path).update()
 
 
 def main(args):
@@ -189,4 +550,5 @@ def main(args):
     SUBCOMMANDS[args.command](sub_args)
 
 
-main(sys.argv)
+if __name__ == '__main__':
+    main(sys.argv)
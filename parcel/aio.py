@@ -0,0 +1,277 @@
+"""
+asyncio API.
+
+Loading, saving and verifying parcels decompress, hash and check signatures,
+which would stall the event loop. These coroutines run them on a bounded
+thread pool instead. zlib, lzma, bz2, hashlib and libsodium release the GIL
+while they work, so other tasks keep running.
+
+Cancelling a coroutine also stops its work on the pool: the files it reads
+and writes are wrapped to raise CancelledError on their next read or write
+once it was cancelled. Work that was not started yet is dropped.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from os.path import basename, join as pathjoin
+from typing import Callable, Iterable, Union, BinaryIO, TYPE_CHECKING
+
+from .keyring import Keyring
+from .transport import (
+    Transport, download, open_transport, _check_name,
+)
+
+if TYPE_CHECKING:
+    from .parcel import Parcel
+
+
+# Threads of the default executor, bounds the CPU-heavy work in flight.
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    "Returns the default executor, created on first use."
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                DEFAULT_WORKERS, thread_name_prefix='parcel')
+        return _executor
+
+
+def set_executor(executor: Executor):
+    "Replaces the default executor, the old one is not shut down."
+    global _executor
+    with _executor_lock:
+        _executor = executor
+
+
+class _Cancellable:
+    "A file that raises CancelledError once cancelled is set."
+
+    def __init__(self, f: BinaryIO, cancelled: threading.Event):
+        self._f = f
+        self._cancelled = cancelled
+
+    def _check(self):
+        if self._cancelled.is_set():
+            raise asyncio.CancelledError()
+
+    def read(self, *args) -> bytes:
+        self._check()
+        return self._f.read(*args)
+
+    def readinto(self, b) -> int:
+        self._check()
+        return self._f.readinto(b)
+
+    def write(self, data: bytes) -> int:
+        self._check()
+        return self._f.write(data)
+
+    def __getattr__(self, name: str):
+        return getattr(self._f, name)
+
+
+class _CancellableTransport:
+    """
+    Forwards to a transport, writing what it gets and reading what it puts
+    through _Cancellable.
+    """
+
+    def __init__(self, transport: Transport, cancelled: threading.Event):
+        self._transport = transport
+        self._cancelled = cancelled
+
+    def close(self):
+        self._transport.close()
+
+    def get(self, name: str, f: BinaryIO, offset: int = 0):
+        self._transport.get(name, _Cancellable(f, self._cancelled), offset)
+
+    def put(self, name: str, f: BinaryIO):
+        self._transport.put(name, _Cancellable(f, self._cancelled))
+
+    def index(self) -> dict[str, dict]:
+        return self._transport.index()
+
+
+async def run(func: Callable, *args, executor: Executor = None):
+    """
+    Runs func(cancelled, *args) on executor, the default one if None.
+    cancelled is a threading.Event set when the coroutine is cancelled.
+    """
+    cancelled = threading.Event()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        executor or get_executor(), partial(func, cancelled, *args))
+    try:
+        return await future
+
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+
+def _load_parcel(cancelled: threading.Event, path: Union[str, BinaryIO],
+                 **kwargs) -> 'Parcel':
+    from .parcel import Parcel
+
+    if not isinstance(path, str):
+        return Parcel.load_parcel(_Cancellable(path, cancelled), **kwargs)
+    with open(path, 'rb') as f:
+        return Parcel.load_parcel(_Cancellable(f, cancelled), **kwargs)
+
+
+async def load_parcel(path: Union[str, BinaryIO], executor: Executor = None,
+                      **kwargs) -> 'Parcel':
+    """
+    Parcel.load_parcel() on executor, it takes the same keyword arguments.
+    The files of a lazy parcel are read from a copy of the message.
+    """
+    return await run(partial(_load_parcel, **kwargs), path,
+                     executor=executor)
+
+
+def _save_parcel(cancelled: threading.Event, parcel: 'Parcel',
+                 path: Union[str, BinaryIO], overwrite: bool = False,
+                 **kwargs):
+    if not isinstance(path, str):
+        return parcel.save_parcel(_Cancellable(path, cancelled), **kwargs)
+
+    with open(path, 'wb' if overwrite else 'xb') as f:
+        try:
+            return parcel.save_parcel(_Cancellable(f, cancelled), **kwargs)
+
+        except BaseException:
+            # Part of a parcel is no parcel.
+            f.close()
+            os.remove(path)
+            raise
+
+
+async def save_parcel(parcel: 'Parcel', path: Union[str, BinaryIO],
+                      executor: Executor = None, **kwargs):
+    """
+    parcel.save_parcel() on executor, it takes the same keyword arguments.
+    A parcel that was cancelled while saved to a path is removed.
+    """
+    return await run(partial(_save_parcel, **kwargs), parcel, path,
+                     executor=executor)
+
+
+async def check_parcel(path: str, lint: bool = False, keyring: Keyring = None,
+                       executor: Executor = None) -> dict:
+    """
+    audit.check_parcel() on executor. Once started, it runs to the end even
+    if cancelled.
+    """
+    from .audit import check_parcel
+
+    return await run(lambda cancelled: check_parcel(path, lint, keyring),
+                     executor=executor)
+
+
+class AsyncRepository:
+    """
+    A client of a remote repository, see transport.open_transport().
+
+    Downloads and uploads run on a pool of connections threads of their
+    own, so they do not hold up loading on the default executor. At most
+    connections are in flight.
+    """
+
+    def __init__(self, url_or_transport: Union[str, Transport],
+                 connections: int = 4, executor: Executor = None):
+        assert connections > 0, f'Invalid connections: {connections}'
+        self.transport = open_transport(url_or_transport, connections) \
+            if isinstance(url_or_transport, str) else url_or_transport
+        self.executor = executor
+        self._io = ThreadPoolExecutor(
+            connections, thread_name_prefix='parcel-io')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        # Waits for the transfers that were cancelled to stop.
+        await asyncio.get_running_loop().run_in_executor(
+            None, partial(self._io.shutdown, cancel_futures=True))
+        self.transport.close()
+
+    async def index(self) -> dict[str, dict]:
+        "Returns the index entries by file name."
+        return await run(lambda cancelled: self.transport.index(),
+                         executor=self._io)
+
+    async def download(self, name: str, directory: str,
+                       digest: str = None,
+                       check: Callable[[str], None] = None) -> str:
+        """
+        Downloads file name to directory and checks its digest and check,
+        see transport.download(). Returns its path. A cancelled download is
+        resumed by the next one.
+        """
+        _check_name(name)
+
+        def get(cancelled: threading.Event) -> str:
+            return download(_CancellableTransport(self.transport, cancelled),
+                            name, pathjoin(directory, name), digest, check)
+
+        return await run(get, executor=self._io)
+
+    async def fetch_all(self, files: Iterable[tuple[str, dict]],
+                        directory: str,
+                        check: Callable[[str, dict], None] = None) -> \
+            list[str]:
+        """
+        Downloads (file name, entry) files concurrently, see
+        transport.plan(). Returns their paths in order. On failure the
+        other downloads are cancelled and the error is raised.
+
+        check is called with the path and entry of each file before it is
+        renamed into place, e.g. transport.verify_entry().
+        """
+        files = list(files)
+        for name, _ in files:
+            _check_name(name)
+        tasks = [
+            asyncio.ensure_future(self.download(
+                name, directory, entry.get('digest'),
+                None if check is None else partial(check, entry=entry)))
+            for name, entry in files
+        ]
+        try:
+            return await asyncio.gather(*tasks)
+
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def load_parcel(self, name: str, directory: str,
+                          digest: str = None, **kwargs) -> 'Parcel':
+        """
+        Downloads and loads parcel name, Parcel.load_parcel() keyword
+        arguments are passed on. Loading runs on the executor.
+        """
+        path = await self.download(name, directory, digest)
+        return await load_parcel(path, executor=self.executor, **kwargs)
+
+    async def upload(self, path: str):
+        "Uploads the file at path, by its base name."
+        def put(cancelled: threading.Event):
+            with open(path, 'rb') as f:
+                self.transport.put(basename(path), _Cancellable(f, cancelled))
+
+        await run(put, executor=self._io)
@@ -0,0 +1,301 @@
+"""
+Parcel container formats.
+
+A parcel is a compressed tar (the outer archive) holding a signed message,
+the inner tar with the manifest and files, plus the signature and the
+public key of the signer.
+
+FORMAT_LEGACY parcels sign the message itself, so it must be held in memory
+to sign and verify it. FORMAT_STREAMING parcels sign a SHA-512 digest of
+the message, computed while streaming, and store a "format" member and the
+signature ahead of the message so they can be read without decompressing
+it.
+
+FORMAT_INDEXED parcels are an uncompressed tar instead, holding a table of
+contents and a data member in which each file is compressed on its own. The
+table of contents records the offset, length, size and SHA-512 digest of
+each file and is what gets signed, so one file can be read and checked with
+a single seek.
+"""
+
+import hashlib
+import json
+import tarfile
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Iterable
+
+from nacl.exceptions import BadSignatureError
+from nacl.signing import SigningKey
+
+from .compression import Compression, GZIP, detect, reader, decompressor
+from .keyring import VerifyCache, verify_key
+from .utils import add_tar_file, spool, SPILL_SIZE
+
+
+FORMAT_LEGACY = 1
+FORMAT_STREAMING = 2
+FORMAT_INDEXED = 3
+FORMATS = (FORMAT_LEGACY, FORMAT_STREAMING, FORMAT_INDEXED)
+DEFAULT_FORMAT = FORMAT_STREAMING
+
+# Distinguishes signed digests from a signed legacy message, and from each
+# other.
+_DIGEST_PREFIXES = {
+    FORMAT_STREAMING: b'parcel-sha512:',
+    FORMAT_INDEXED: b'parcel-toc-sha512:',
+}
+_CHUNK_SIZE = 64 * 1024
+# Uncompressed tar, at offset 257.
+_TAR_MAGIC = b'ustar'
+
+
+class HashingReader:
+    "Hashes everything read through it."
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self.hash = hashlib.sha512()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.hash.update(data)
+        return data
+
+    def drain(self) -> bytes:
+        "Reads to the end and returns the digest."
+        while self.read(_CHUNK_SIZE):
+            pass
+        return self.hash.digest()
+
+
+def message_digest(message: BinaryIO) -> bytes:
+    message.seek(0)
+    return HashingReader(message).drain()
+
+
+def _signed_data(format: int, message: BinaryIO = None,
+                 digest: bytes = None) -> bytes:
+    assert format in FORMATS, f'Invalid parcel format: {format}'
+    if format == FORMAT_LEGACY:
+        message.seek(0)
+        return message.read()
+    if digest is None:
+        digest = message_digest(message)
+    return _DIGEST_PREFIXES[format] + digest
+
+
+def sign(key: SigningKey, format: int, message: BinaryIO) -> bytes:
+    "Returns the signature of message."
+    return key.sign(_signed_data(format, message)).signature
+
+
+def verify(pubkey: bytes, signature: bytes, format: int,
+           message: BinaryIO = None, digest: bytes = None,
+           cache: VerifyCache = None):
+    """
+    Verifies the signature of message, or of its digest when already known.
+    Raises nacl.exceptions.BadSignatureError if it does not match. Given a
+    cache, signatures that verified before are not checked again.
+    """
+    data = _signed_data(format, message, digest)
+    if cache is None:
+        verify_key(pubkey).verify(data, signature)
+    else:
+        cache.verify(pubkey, data, signature)
+
+
+def read_header(outer: tarfile.TarFile) -> tuple[int, bytes, bytes]:
+    "Returns the format, public key and signature of a parcel."
+    format, found = FORMAT_LEGACY, {}
+    for tinfo in outer:
+        if tinfo.name == 'format':
+            format = int(outer.extractfile(tinfo).read())
+            assert format in FORMATS, f'Unsupported parcel format: {format}'
+        elif tinfo.name in ('pubkey', 'signature'):
+            found[tinfo.name] = outer.extractfile(tinfo).read()
+        if len(found) == 2:
+            break
+    return format, found['pubkey'], found['signature']
+
+
+def open_message(outer: tarfile.TarFile) -> BinaryIO:
+    "Returns a stream of the message."
+    for tinfo in outer:
+        if tinfo.name == 'message':
+            return outer.extractfile(tinfo)
+    raise KeyError("filename 'message' not found")
+
+
+class _OuterFile(tarfile.TarFile):
+    "Closes the decompressor it reads from, f is left open."
+
+    def close(self):
+        try:
+            super().close()
+
+        finally:
+            self.fileobj.close()
+
+
+def open_outer(f: BinaryIO) -> tarfile.TarFile:
+    """
+    Opens the outer archive of a parcel, whatever it is compressed with.
+    Closing it closes the decompressor but not f.
+    """
+    z = reader(f)
+    try:
+        return _OuterFile.open(fileobj=z, mode='r:')
+
+    except BaseException:
+        z.close()
+        raise
+
+
+def read_message(f: BinaryIO) -> tuple[str, int, bytes, bytes, BinaryIO]:
+    """
+    Returns the codec, format, public key, signature and a copy of the
+    message of a parcel that is not indexed.
+    """
+    assert not is_indexed(f), 'Indexed parcels have no message'
+    codec = detect(f)
+    outer = open_outer(f)
+    try:
+        format, pubkey, signature = read_header(outer)
+        return codec, format, pubkey, signature, spool(open_message(outer))
+
+    finally:
+        outer.close()
+
+
+def write(f: BinaryIO, format: int, pubkey: bytes, signature: bytes,
+          message: BinaryIO, compression: Compression = None):
+    "Writes the outer archive, streaming message into it."
+    assert format in (FORMAT_LEGACY, FORMAT_STREAMING), \
+        f'Invalid parcel format: {format}'
+    compression = compression or Compression()
+    with compression.writer(f) as z, \
+            tarfile.open(fileobj=z, mode='w|') as outer:
+        if format == FORMAT_LEGACY:
+            add_tar_file(outer, 'message', message)
+            add_tar_file(outer, 'signature', BytesIO(signature))
+            add_tar_file(outer, 'pubkey', BytesIO(pubkey))
+        else:
+            add_tar_file(outer, 'format', BytesIO(str(format).encode()))
+            add_tar_file(outer, 'pubkey', BytesIO(pubkey))
+            add_tar_file(outer, 'signature', BytesIO(signature))
+            add_tar_file(outer, 'message', message)
+
+
+def is_indexed(f: BinaryIO) -> bool:
+    "Tells an indexed parcel from a compressed one, f is left where it was."
+    position = f.tell()
+    head = f.read(257 + len(_TAR_MAGIC))
+    f.seek(position)
+    return head[257:] == _TAR_MAGIC
+
+
+def build_index(members: Iterable[tuple[str, BinaryIO]], data: BinaryIO,
+                compression: Compression = None) -> bytes:
+    """
+    Compresses each (name, fileobj) of members into data and returns the
+    table of contents.
+    """
+    compression = compression or Compression()
+    entries = []
+    for name, fileobj in members:
+        fileobj.seek(0)
+        offset, size, hash = data.tell(), 0, hashlib.sha512()
+        compressor = compression.compressor()
+        while chunk := fileobj.read(_CHUNK_SIZE):
+            size += len(chunk)
+            hash.update(chunk)
+            data.write(compressor.compress(chunk))
+        data.write(compressor.flush())
+        entries.append({
+            'name': name,
+            'offset': offset,
+            'length': data.tell() - offset,
+            'size': size,
+            'sha512': hash.hexdigest(),
+        })
+    return json.dumps({
+        'codec': compression.codec,
+        'members': entries,
+    }).encode('utf8')
+
+
+def write_indexed(f: BinaryIO, pubkey: bytes, signature: bytes, toc: bytes,
+                  data: BinaryIO):
+    "Writes an indexed parcel, data is the output of build_index()."
+    outer = tarfile.open(fileobj=f, mode='w')
+    try:
+        add_tar_file(outer, 'format', BytesIO(str(FORMAT_INDEXED).encode()))
+        add_tar_file(outer, 'pubkey', BytesIO(pubkey))
+        add_tar_file(outer, 'signature', BytesIO(signature))
+        add_tar_file(outer, 'toc.json', BytesIO(toc))
+        add_tar_file(outer, 'data', data)
+
+    finally:
+        outer.close()
+
+
+class Index:
+    """
+    Table of contents of an indexed parcel. Only the headers are read, the
+    data member is skipped over.
+    """
+
+    def __init__(self, f: BinaryIO):
+        header = {}
+        outer = tarfile.open(fileobj=f, mode='r:')
+        for tinfo in outer:
+            if tinfo.name == 'data':
+                self.data_offset = tinfo.offset_data
+                break
+            header[tinfo.name] = outer.extractfile(tinfo).read()
+        else:
+            raise KeyError("filename 'data' not found")
+
+        format = int(header['format'])
+        assert format == FORMAT_INDEXED, f'Not an indexed parcel: {format}'
+        self.pubkey = header['pubkey']
+        self.signature = header['signature']
+        self.toc = header['toc.json']
+        toc = json.loads(self.toc)
+        self.codec = toc.get('codec', GZIP)
+        self.members = {entry['name']: entry for entry in toc['members']}
+
+    def verify(self, cache: VerifyCache = None):
+        "Verifies the signature of the table of contents."
+        verify(self.pubkey, self.signature, FORMAT_INDEXED,
+               digest=hashlib.sha512(self.toc).digest(), cache=cache)
+
+    def read(self, f: BinaryIO, name: str) -> BinaryIO:
+        """
+        Reads the member name from f, which holds the parcel. Raises
+        nacl.exceptions.BadSignatureError if it does not match its digest.
+        """
+        entry = self.members[name]
+        f.seek(self.data_offset + entry['offset'])
+        d = decompressor(self.codec)
+        hash, remaining = hashlib.sha512(), entry['length']
+        out = BytesIO() if entry['size'] <= SPILL_SIZE else \
+            SpooledTemporaryFile(max_size=SPILL_SIZE)
+        while remaining:
+            chunk = f.read(min(remaining, _CHUNK_SIZE))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            data = d.decompress(chunk)
+            hash.update(data)
+            out.write(data)
+        if hasattr(d, 'flush'):
+            data = d.flush()
+            hash.update(data)
+            out.write(data)
+
+        if remaining or hash.hexdigest() != entry['sha512']:
+            raise BadSignatureError(f'{name} does not match its digest')
+        out.seek(0)
+        return out
@@ -1,8 +1,9 @@
-from io import BytesIO
-from typing import Union, Any
-from os.path import (
-    isfile, basename, join as pathjoin, split as pathsplit
-)
+import mmap
+from io import BytesIO, SEEK_END
+from typing import Union, Any, Callable, BinaryIO
+from os.path import isfile, basename, getsize
+
+from .utils import SPILL_SIZE, spool
 
 
 class Option:
@@ -28,23 +29,70 @@ class Setting:
 
 
 class File:
-    def __init__(self, path: str, value: Union[bytes, BytesIO] = None):
+    """
+    A file bundled in a parcel.
+
+    The value is a binary file object, held in memory when small. Files
+    created from a path are read when the value is first accessed; large
+    ones are memory-mapped. Large values from elsewhere are spilled to a
+    temporary file, see utils.SPILL_SIZE.
+    """
+
+    def __init__(self, path: str, value: Union[bytes, BinaryIO] = None,
+                 loader: Callable[[], Union[bytes, BinaryIO]] = None):
         self._value = None
-        if value is None:
+        self._path = None
+        # Called to produce the value on first access.
+        self._loader = loader
+        self.name = basename(path)
+        if value is None and loader is None:
             assert isfile(path), f'Path "{path}" does not exist'
-            self.name = basename(path)
-            with open(path, 'rb') as f:
-                self.value = BytesIO(f.read())
-        else:
-            self.name = basename(path)
+            self._path = path
+        elif value is not None:
             self.value = value
 
     @property
-    def value(self) -> BytesIO:
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    @property
+    def size(self) -> int:
+        if self._value is None and self._path is not None:
+            return getsize(self._path)
+        value = self.value
+        pos = value.tell()
+        value.seek(0, SEEK_END)
+        size = value.tell()
+        value.seek(pos)
+        return size
+
+    @property
+    def value(self) -> BinaryIO:
+        if self._value is None:
+            if self._loader is not None:
+                self.value = self._loader()
+            elif self._path is not None:
+                self._value = _open_path(self._path)
         return self._value
 
     @value.setter
-    def value(self, value: Union[bytes, BytesIO]):
+    def value(self, value: Union[bytes, BinaryIO]):
         if isinstance(value, bytes):
-            value = BytesIO(value)
+            value = spool(BytesIO(value), len(value))
+        self._loader = None
         self._value = value
+
+    def read(self) -> bytes:
+        "Returns the whole value."
+        value = self.value
+        value.seek(0)
+        return value.read()
+
+
+def _open_path(path: str) -> BinaryIO:
+    if getsize(path) <= SPILL_SIZE:
+        with open(path, 'rb') as f:
+            return BytesIO(f.read())
+
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
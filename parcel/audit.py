@@ -0,0 +1,110 @@
+"""
+Bulk verification and linting of parcels.
+
+Parcels are checked on a process pool and results are yielded as they
+complete, so a large mirror can be audited in one run.
+"""
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Generator, Iterable
+
+from .keyring import Keyring
+from .repository import EXTENSION
+
+
+def find_parcels(paths: Iterable[str]) -> list[str]:
+    """
+    Expands directories (recursively) and glob patterns to the parcels in
+    them. Other paths are kept as they are.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(
+                    os.path.join(root, fn) for fn in sorted(files)
+                    if fn.endswith(EXTENSION))
+        elif glob.has_magic(path):
+            found.extend(sorted(glob.glob(path, recursive=True)))
+        else:
+            found.append(path)
+    return list(dict.fromkeys(found))
+
+
+def check_parcel(path: str, lint: bool = False,
+                 keyring: Keyring = None) -> dict:
+    """
+    Loads and verifies the parcel at path, and lints it if lint is True.
+    Returns a result, failures are reported in it rather than raised.
+    """
+    from .parcel import Parcel
+
+    result = {'path': path, 'ok': False, 'stage': 'verify', 'error': None}
+    try:
+        # Verifying reads the whole message, files are only read by lint.
+        parcel = Parcel.load_parcel(
+            path, verify=True, lazy=True, keyring=keyring)
+        result.update({
+            'name': parcel.name,
+            'version': str(parcel.version),
+            'uuid': parcel.uuid,
+        })
+        if lint:
+            result['stage'] = 'lint'
+            parcel.lint()
+
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    else:
+        result['ok'] = True
+        result['stage'] = None
+
+    return result
+
+
+def check_parcels(paths: Iterable[str], lint: bool = False,
+                  keyring: Keyring = None, workers: int = None) \
+        -> Generator[dict, None, None]:
+    """
+    Checks the parcels in paths, see find_parcels(), on workers processes
+    (one per CPU by default). Yields each result as it completes.
+    """
+    paths = find_parcels(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) < 2:
+        for path in paths:
+            yield check_parcel(path, lint, keyring)
+        return
+
+    with ProcessPoolExecutor(min(workers, len(paths))) as executor:
+        pending, paths = set(), iter(paths)
+        while True:
+            # Bounded, so results stream rather than all paths being queued.
+            for path in paths:
+                pending.add(executor.submit(check_parcel, path, lint, keyring))
+                if len(pending) >= workers * 4:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def summarize(results: Iterable[dict]) -> dict:
+    "Returns counts and the failures of results."
+    summary = {'total': 0, 'ok': 0, 'failed': 0, 'failures': []}
+    for result in results:
+        summary['total'] += 1
+        if result['ok']:
+            summary['ok'] += 1
+        else:
+            summary['failed'] += 1
+            summary['failures'].append({
+                key: result[key] for key in ('path', 'stage', 'error')
+            })
+    return summary
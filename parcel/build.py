@@ -0,0 +1,140 @@
+"""
+Build cache.
+
+Archives are reproducible: members are sorted and their timestamps and
+owners fixed, see utils.add_tar_file(), and Ed25519 signatures are
+deterministic. A parcel built again from the same manifest, files and key
+with the same settings is therefore the same file, and BuildCache can hand
+back the one built before rather than packing and signing it again.
+
+That includes the uuid, which is part of the manifest. A manifest without
+one would get a new one on each build, see build_uuid().
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from os.path import join as pathjoin
+from typing import BinaryIO, Iterable, TYPE_CHECKING
+
+from .compression import Compression
+from .utils import build_mtime
+
+if TYPE_CHECKING:
+    from .manifest import Manifest
+
+
+# Part of every digest, bump when the archive layout changes.
+BUILD_VERSION = 1
+_CHUNK_SIZE = 1024 * 1024
+# Namespace of the uuids of manifests without one.
+_UUID_NAMESPACE = uuid.UUID('9b3c1f52-6a0e-4d38-8f51-2b7e6c0d4a19')
+
+
+def build_uuid(manifest: 'Manifest') -> str:
+    """
+    Gives a manifest without a uuid the one of its name and version, the
+    same on every build, and returns it.
+    """
+    if manifest._uuid is None:
+        manifest.uuid = str(uuid.uuid5(
+            _UUID_NAMESPACE, f'{manifest.name}=={manifest.version}'))
+    return manifest.uuid
+
+
+def build_digest(members: Iterable[tuple[str, BinaryIO]], pubkey: bytes,
+                 format: int, compression: Compression = None) -> str:
+    "Returns the hex SHA-512 of everything a parcel is built from."
+    compression = compression or Compression()
+    hash = hashlib.sha512()
+    # Gzip on several threads writes blocks, whatever the number of threads.
+    settings = (BUILD_VERSION, format, compression.codec, compression.level,
+                compression.threads > 1, build_mtime())
+    hash.update(repr(settings).encode('utf8'))
+    hash.update(pubkey)
+    for name, fileobj in members:
+        member = hashlib.sha512()
+        fileobj.seek(0)
+        while chunk := fileobj.read(_CHUNK_SIZE):
+            member.update(chunk)
+        hash.update(hashlib.sha512(name.encode('utf8')).digest())
+        hash.update(member.digest())
+    return hash.hexdigest()
+
+
+class BuildCache:
+    """
+    A directory of built parcels and their signatures, by build digest. At
+    most max_size bytes, the least recently used are evicted first.
+    """
+
+    def __init__(self, path: str, max_size: int = 1024 ** 3):
+        assert max_size > 0, f'Invalid max_size: {max_size}'
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    def _paths(self, digest: str) -> tuple[str, str]:
+        base = pathjoin(self.path, digest)
+        return base + '.pcl', base + '.sig'
+
+    def get(self, digest: str, f: BinaryIO) -> bytes:
+        """
+        Copies the parcel built for digest to f and returns its signature,
+        None if there is none.
+        """
+        parcel_path, signature_path = self._paths(digest)
+        try:
+            with open(signature_path, 'rb') as sf, \
+                    open(parcel_path, 'rb') as pf:
+                signature = sf.read()
+                shutil.copyfileobj(pf, f)
+
+        except FileNotFoundError:
+            return None
+
+        # Most recently used.
+        os.utime(parcel_path)
+        return signature
+
+    def put(self, digest: str, parcel: BinaryIO, signature: bytes):
+        "Adds a built parcel, then evicts entries over max_size."
+        parcel_path, signature_path = self._paths(digest)
+        for path, write in (
+                (signature_path, lambda f: f.write(signature)),
+                (parcel_path, lambda f: shutil.copyfileobj(parcel, f))):
+            fd, tmp = tempfile.mkstemp(prefix='.', dir=self.path)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    write(f)
+                os.replace(tmp, path)
+
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+        self._evict_over(keep=parcel_path)
+
+    def _evict_over(self, keep: str = None):
+        entries = []
+        with os.scandir(self.path) as it:
+            for dirent in it:
+                if dirent.name.endswith('.pcl'):
+                    stat = dirent.stat()
+                    entries.append((stat.st_mtime, stat.st_size, dirent.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            for stale in (path, path[:-len('.pcl')] + '.sig'):
+                try:
+                    os.remove(stale)
+
+                except FileNotFoundError:
+                    pass
+            total -= size
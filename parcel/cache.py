@@ -0,0 +1,192 @@
+"""
+On-disk cache of verified, extracted parcels.
+
+Entries are keyed by the SHA-512 of the parcel file, so a parcel that
+changed is never served from the cache. Each entry holds the manifest and
+files of a parcel that verified, plus the digest of each, which is checked
+when the file is read. The cache is bounded in size, the least recently
+used entries are evicted first.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from binascii import hexlify, unhexlify
+from functools import partial
+from os.path import join as pathjoin
+from typing import Union, BinaryIO, TYPE_CHECKING
+
+from nacl.exceptions import BadSignatureError
+
+from .attrs import File, _open_path
+from .utils import file_digest
+
+if TYPE_CHECKING:
+    from .parcel import Parcel
+
+
+META_NAME = 'meta.json'
+MANIFEST_NAME = 'manifest.json'
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _read_checked(path: str, sha512: str) -> BinaryIO:
+    value = _open_path(path)
+    hash = hashlib.sha512()
+    while chunk := value.read(_CHUNK_SIZE):
+        hash.update(chunk)
+    if hash.hexdigest() != sha512:
+        raise BadSignatureError(f'{path} does not match its digest')
+    value.seek(0)
+    return value
+
+
+class ExtractionCache:
+    """
+    A directory of extracted parcels, at most max_size bytes of files.
+    Safe to share between processes, entries are written to a temporary
+    directory and renamed into place.
+    """
+
+    def __init__(self, path: str, max_size: int = 1024 ** 3):
+        assert max_size > 0, f'Invalid max_size: {max_size}'
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    def _entry(self, digest: str) -> str:
+        return pathjoin(self.path, digest)
+
+    @staticmethod
+    def digest(path: Union[str, BinaryIO]) -> str:
+        "Returns the key of a parcel."
+        return file_digest(path)
+
+    def evict(self, digest: str):
+        shutil.rmtree(self._entry(digest), ignore_errors=True)
+
+    def get(self, digest: str) -> 'Parcel':
+        """
+        Returns the cached parcel, None if it is not cached or the entry is
+        damaged. Files are read from the cache when first accessed.
+        """
+        from .parcel import Parcel
+
+        entry = self._entry(digest)
+        try:
+            f = open(pathjoin(entry, META_NAME), 'rb')
+
+        except FileNotFoundError:
+            return None
+
+        try:
+            with f:
+                meta = json.load(f)
+            # Any other file missing is a damaged entry, put() can only
+            # replace it once evicted.
+            with open(pathjoin(entry, MANIFEST_NAME), 'rb') as f:
+                data = f.read()
+            assert hashlib.sha512(data).hexdigest() == meta['manifest'], \
+                'Manifest does not match its digest'
+            for i, file in enumerate(meta['files']):
+                assert os.path.getsize(pathjoin(entry, str(i))) == \
+                    file['size'], f'Size of {file["name"]} changed'
+
+        except (OSError, ValueError, KeyError, AssertionError):
+            self.evict(digest)
+            return None
+
+        try:
+            # Most recently used.
+            os.utime(pathjoin(entry, META_NAME))
+
+        except FileNotFoundError:
+            # Evicted meanwhile.
+            return None
+
+        files = {
+            file['name']: (pathjoin(entry, str(i)), file['sha512'])
+            for i, file in enumerate(meta['files'])
+        }
+        return Parcel._from_members(
+            unhexlify(meta['pubkey']), unhexlify(meta['signature']),
+            json.loads(data),
+            lambda fn: File(fn, loader=partial(_read_checked, *files[fn])))
+
+    def put(self, digest: str, parcel: 'Parcel'):
+        "Adds a verified parcel, then evicts entries over max_size."
+        tmp = tempfile.mkdtemp(prefix='.', dir=self.path)
+        try:
+            manifest = json.dumps(parcel.manifest).encode('utf8')
+            with open(pathjoin(tmp, MANIFEST_NAME), 'wb') as f:
+                f.write(manifest)
+
+            files, size = [], 0
+            for i, file in enumerate(parcel.files):
+                value, hash = file.value, hashlib.sha512()
+                value.seek(0)
+                with open(pathjoin(tmp, str(i)), 'wb') as f:
+                    while chunk := value.read(_CHUNK_SIZE):
+                        hash.update(chunk)
+                        f.write(chunk)
+                    files.append({
+                        'name': file.name,
+                        'size': f.tell(),
+                        'sha512': hash.hexdigest(),
+                    })
+                    size += f.tell()
+
+            with open(pathjoin(tmp, META_NAME), 'w') as f:
+                json.dump({
+                    'pubkey': hexlify(parcel.pubkey).decode(),
+                    'signature': hexlify(parcel.signature).decode(),
+                    'manifest': hashlib.sha512(manifest).hexdigest(),
+                    'files': files,
+                    'size': size + len(manifest),
+                }, f)
+
+            os.rename(tmp, self._entry(digest))
+
+        except OSError:
+            # Already cached by someone else.
+            if not os.path.isdir(self._entry(digest)):
+                raise
+
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self._evict_over(keep=digest)
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        "Returns (last used, size, digest) of each entry."
+        entries = []
+        with os.scandir(self.path) as it:
+            for dirent in it:
+                if dirent.name.startswith('.'):
+                    continue
+                meta = pathjoin(dirent.path, META_NAME)
+                try:
+                    with open(meta, 'rb') as f:
+                        size = json.load(f)['size']
+                    entries.append((os.stat(meta).st_mtime, size, dirent.name))
+
+                except (OSError, ValueError, KeyError):
+                    continue
+        return entries
+
+    def _evict_over(self, keep: str = None):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, digest in entries:
+            if total <= self.max_size:
+                break
+            if digest == keep:
+                continue
+            self.evict(digest)
+            total -= size
+
+    def size(self) -> int:
+        "Returns the size of the cached files."
+        return sum(size for _, size, _ in self._entries())
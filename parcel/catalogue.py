@@ -0,0 +1,231 @@
+"""
+Binary, memory mapped catalogues of specs.
+
+A catalogue holds what the solver needs of each spec in flat tables, read
+in place from a mmap. Nothing is loaded up front, Specs and Versions are
+only built for the names a solve touches, so opening one is near-instant
+and memory use does not depend on its size.
+
+Layout, all integers are little endian uint32:
+
+    header       magic, version and the count of each table below
+    strings      offsets (count + 1), then the UTF-8 blob padded to 4 bytes
+    names        (name, first spec, count) sorted by name
+    specs        (name index, version, uuid, rank start, rank stop,
+                 first requires, requires count, first conflicts,
+                 conflicts count), grouped by name in version order
+    constraints  (name, operator, version)
+
+Names, versions and uuids are indexes into strings, NONE when missing. Spec
+ids are 1 + the index of the spec, so the versions of a name have
+consecutive ids.
+"""
+
+import mmap
+import struct
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Generator, Union, BinaryIO
+
+from . import parse_version
+from .pallet import Pallet
+from .spec import Spec
+from .utils import path_or_file
+
+
+MAGIC = b'PCAT'
+CATALOGUE_VERSION = 1
+NONE = 0xFFFFFFFF
+# Operators by code, in constraints.
+OPERS = (None, '==', '!=', '<=', '>=', '>', '<')
+
+_HEADER = struct.Struct('<4sIIIII')
+_U32 = struct.Struct('<I')
+_NAME = struct.Struct('<III')
+_SPEC = struct.Struct('<IIIIIIIII')
+_CONSTRAINT = struct.Struct('<III')
+# Bounds the Specs and parsed versions kept for the names in use.
+_CACHE_SIZE = 4096
+
+
+class _CatalogueSpec(Spec):
+    __slots__ = ('_requires', '_conflicts')
+
+    def __init__(self, name: str, version: str, uuid: str,
+                 requires: list[Spec], conflicts: list[Spec]):
+        super().__init__(name, version, oper='==', uuid=uuid)
+        self._requires = requires
+        self._conflicts = conflicts
+
+    @property
+    def requires(self) -> list[Spec]:
+        return self._requires
+
+    @property
+    def conflicts(self) -> list[Spec]:
+        return self._conflicts
+
+
+def save_catalogue(pallet: Pallet, path: Union[str, BinaryIO]):
+    "Writes the specs of pallet as a catalogue."
+    strings, blob, offsets = {}, bytearray(), [0]
+
+    def intern(value: str) -> int:
+        if value is None:
+            return NONE
+        i = strings.get(value)
+        if i is None:
+            i = strings[value] = len(offsets) - 1
+            blob.extend(value.encode('utf8'))
+            offsets.append(len(blob))
+        return i
+
+    names = sorted(pallet.names(), key=lambda name: name.encode('utf8'))
+    name_rows, spec_rows, constraint_rows = [], [], []
+    for name_index, name in enumerate(names):
+        ids = pallet.versions(name)
+        name_rows.append((intern(name), len(spec_rows), len(ids)))
+        for id in ids:
+            spec = pallet.get(id)
+            row = [name_index, intern(str(spec.version)), intern(spec.uuid)]
+            row.extend(pallet.ranks(spec))
+            for constraints in (spec.requires, spec.conflicts):
+                row.extend((len(constraint_rows), len(constraints)))
+                constraint_rows.extend(
+                    (intern(c.name), OPERS.index(c.oper),
+                     NONE if c.version is None else intern(str(c.version)))
+                    for c in constraints)
+            spec_rows.append(row)
+
+    blob.extend(b'\0' * (-len(blob) % 4))
+    with path_or_file(path, 'wb') as f:
+        f.write(_HEADER.pack(
+            MAGIC, CATALOGUE_VERSION, len(offsets) - 1, len(name_rows),
+            len(spec_rows), len(constraint_rows)))
+        f.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        f.write(blob)
+        for table, row_struct in ((name_rows, _NAME), (spec_rows, _SPEC),
+                                  (constraint_rows, _CONSTRAINT)):
+            for row in table:
+                f.write(row_struct.pack(*row))
+
+
+class _Versions:
+    "Parsed versions of a name, for bisect, parsing only what is compared."
+
+    def __init__(self, catalogue: 'CataloguePallet', first: int, count: int):
+        self.catalogue = catalogue
+        self.first = first
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int):
+        row = self.catalogue._spec_row(self.first + i)
+        return parse_version(self.catalogue._string(row[1]))
+
+
+class CataloguePallet(Pallet):
+    """
+    A read-only Pallet over a catalogue written by save_catalogue(). Pass
+    it to Solver(pallet=...).
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_strings, n_names, n_specs, n_constraints = \
+            _HEADER.unpack_from(self._mmap)
+        assert magic == MAGIC, 'Not a catalogue'
+        assert version == CATALOGUE_VERSION, \
+            f'Unsupported catalogue version: {version}'
+        self._count = n_specs
+        self._n_names = n_names
+        self._offsets = _HEADER.size
+        self._blob = self._offsets + (n_strings + 1) * _U32.size
+        blob_size = _U32.unpack_from(
+            self._mmap, self._offsets + n_strings * _U32.size)[0]
+        self._names_at = self._blob + blob_size + (-blob_size % 4)
+        self._specs_at = self._names_at + n_names * _NAME.size
+        self._constraints_at = self._specs_at + n_specs * _SPEC.size
+        self._name = lru_cache(maxsize=_CACHE_SIZE)(self._find_name)
+        self.get = lru_cache(maxsize=_CACHE_SIZE)(self._get)
+
+    def close(self):
+        self._mmap.close()
+
+    def _bytes(self, i: int) -> bytes:
+        start, stop = struct.unpack_from(
+            '<II', self._mmap, self._offsets + i * _U32.size)
+        return self._mmap[self._blob + start:self._blob + stop]
+
+    def _string(self, i: int) -> str:
+        return self._bytes(i).decode('utf8')
+
+    def _name_row(self, i: int) -> tuple[int, int, int]:
+        return _NAME.unpack_from(self._mmap, self._names_at + i * _NAME.size)
+
+    def _spec_row(self, i: int) -> tuple:
+        return _SPEC.unpack_from(self._mmap, self._specs_at + i * _SPEC.size)
+
+    def _find_name(self, name: str) -> tuple[int, int]:
+        "Returns the (first, count) specs of name, by binary search."
+        key, lo, hi = name.encode('utf8'), 0, self._n_names
+        while lo < hi:
+            mid = (lo + hi) // 2
+            string, first, count = self._name_row(mid)
+            found = self._bytes(string)
+            if found == key:
+                return first, count
+            if found < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return 0, 0
+
+    def _constraints(self, first: int, count: int) -> list[Spec]:
+        specs = []
+        for i in range(first, first + count):
+            name, oper, version = _CONSTRAINT.unpack_from(
+                self._mmap, self._constraints_at + i * _CONSTRAINT.size)
+            specs.append(Spec(
+                self._string(name),
+                None if version == NONE else self._string(version),
+                oper=OPERS[oper]))
+        return specs
+
+    def _get(self, id: int) -> Spec:
+        assert 0 < id <= self._count, f'Invalid id: {id}'
+        name, version, uuid, _, _, rf, rc, cf, cc = self._spec_row(id - 1)
+        return _CatalogueSpec(
+            self._string(self._name_row(name)[0]), self._string(version),
+            None if uuid == NONE else self._string(uuid),
+            self._constraints(rf, rc), self._constraints(cf, cc))
+
+    def add_spec(self, spec: Spec):
+        raise AssertionError('Catalogues are read-only')
+
+    def all(self) -> Generator[tuple[int, Spec], None, None]:
+        for id in range(1, self._count + 1):
+            yield id, self.get(id)
+
+    def names(self) -> list[str]:
+        return [
+            self._string(self._name_row(i)[0]) for i in range(self._n_names)
+        ]
+
+    def versions(self, name: str) -> range:
+        first, count = self._name(name)
+        return range(first + 1, first + count + 1)
+
+    def rank(self, id: int) -> int:
+        return self._spec_row(id - 1)[3]
+
+    def ranks(self, spec: Spec) -> tuple[int, int]:
+        first, count = self._name(spec.name)
+        versions = _Versions(self, first, count)
+        return (bisect_left(versions, spec.version),
+                bisect_right(versions, spec.version))
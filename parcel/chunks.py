@@ -0,0 +1,324 @@
+"""
+Deduplicated storage of parcels.
+
+A ChunkStore keeps the message of each parcel, the uncompressed inner tar,
+as content-defined chunks stored once however many parcels hold them, plus
+a recipe per parcel listing its chunks. A file shared by several releases
+is stored once, and adding a release only stores the chunks that changed.
+
+Chunk boundaries are found with a gear hash, as in FastCDC: a boundary is
+where the hash of the bytes before it has enough low zero bits. Boundaries
+only depend on the bytes around them, so an insertion only changes the
+chunks it falls in rather than shifting every chunk after it. Chunks are
+between MIN_CHUNK and MAX_CHUNK bytes, AVERAGE_CHUNK on average.
+
+Layout of the store directory:
+
+    chunks/<ab>/<sha512>   chunks compressed on their own, by digest
+    recipes/<name>.json    format, pubkey, signature, codec and level of
+                           the parcel, the SHA-512 of its message and its
+                           chunks in order
+
+Parcels are rebuilt from their chunks and signatures, which verify like the
+original. Indexed parcels are not supported, their files are compressed.
+"""
+
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+from binascii import hexlify, unhexlify
+from os.path import basename, join as pathjoin
+from tempfile import SpooledTemporaryFile
+from typing import Union, BinaryIO, Generator, TYPE_CHECKING
+
+from nacl.exceptions import BadSignatureError
+
+from . import archive
+from .attrs import File
+from .compression import Compression, detect, decompressor
+from .keyring import Keyring, VerifyCache, VERIFY_CACHE
+from .utils import path_or_file, SPILL_SIZE
+
+if TYPE_CHECKING:
+    from .parcel import Parcel
+
+
+MIN_CHUNK = 2 * 1024
+AVERAGE_CHUNK = 8 * 1024
+MAX_CHUNK = 64 * 1024
+RECIPE_VERSION = 1
+
+# Fixed, so a parcel is cut the same way in every store.
+_GEAR = tuple(
+    int.from_bytes(hashlib.sha512(bytes([i])).digest()[:8], 'little')
+    for i in range(256)
+)
+_MASK_64 = (1 << 64) - 1
+# Normalized chunking: harder to cut before the average, easier after.
+_MASK_SMALL = (1 << 15) - 1
+_MASK_LARGE = (1 << 11) - 1
+_READ_SIZE = 1024 * 1024
+
+
+def _cut(data: bytes, start: int, end: int) -> int:
+    "Returns where the chunk starting at start ends, at most end."
+    if end - start <= MIN_CHUNK:
+        return end
+    normal = min(start + AVERAGE_CHUNK, end)
+    stop = min(start + MAX_CHUNK, end)
+    gear, h, i = _GEAR, 0, start + MIN_CHUNK
+    # The hash only depends on the last 64 bytes.
+    for j in range(max(start, i - 64), i):
+        h = ((h << 1) + gear[data[j]]) & _MASK_64
+    while i < normal:
+        h = ((h << 1) + gear[data[i]]) & _MASK_64
+        i += 1
+        if not h & _MASK_SMALL:
+            return i
+    while i < stop:
+        h = ((h << 1) + gear[data[i]]) & _MASK_64
+        i += 1
+        if not h & _MASK_LARGE:
+            return i
+    return stop
+
+
+def chunks(f: BinaryIO) -> Generator[bytes, None, None]:
+    "Yields the content-defined chunks of f, from where it is."
+    data = b''
+    while True:
+        more = f.read(_READ_SIZE)
+        data += more
+        start = 0
+        # Without more data, the last chunk ends at the end.
+        while len(data) - start >= (MAX_CHUNK if more else 1):
+            end = _cut(data, start, len(data))
+            yield data[start:end]
+            start = end
+        data = data[start:]
+        if not more:
+            return
+
+
+def _check_name(name: str):
+    assert name and basename(name) == name and not name.startswith('.'), \
+        f'Invalid parcel name: {name}'
+
+
+class ChunkStore:
+    """
+    A directory of deduplicated parcels, by name. Chunks are compressed
+    with compression, gzip by default, and written once.
+    """
+
+    def __init__(self, path: str, compression: Compression = None):
+        self.path = path
+        self.compression = compression or Compression()
+        self.chunks_path = pathjoin(path, 'chunks')
+        self.recipes_path = pathjoin(path, 'recipes')
+        os.makedirs(self.chunks_path, exist_ok=True)
+        os.makedirs(self.recipes_path, exist_ok=True)
+
+    def _chunk_path(self, digest: str) -> str:
+        return pathjoin(self.chunks_path, digest[:2], digest)
+
+    def _recipe_path(self, name: str) -> str:
+        _check_name(name)
+        return pathjoin(self.recipes_path, name + '.json')
+
+    def _write(self, path: str, data: bytes):
+        "Writes path atomically, so readers never see part of it."
+        fd, tmp = tempfile.mkstemp(prefix='.', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _put_chunk(self, chunk: bytes) -> tuple[str, int]:
+        "Stores chunk, returns its digest and the bytes written."
+        digest = hashlib.sha512(chunk).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        compressor = self.compression.compressor()
+        data = compressor.compress(chunk) + compressor.flush()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write(path, data)
+        return digest, len(data)
+
+    def _get_chunk(self, digest: str) -> bytes:
+        with open(self._chunk_path(digest), 'rb') as f:
+            codec = detect(f)
+            assert codec is not None, f'Unknown compression of {digest}'
+            data = decompressor(codec).decompress(f.read())
+        if hashlib.sha512(data).hexdigest() != digest:
+            raise BadSignatureError(f'Chunk {digest} does not match')
+        return data
+
+    def add(self, path: Union[str, BinaryIO], name: str = None,
+            verify: bool = True) -> dict:
+        """
+        Stores the parcel at path as name, its file name by default. Returns
+        the recipe, with the bytes of new chunks written. Raises
+        nacl.exceptions.BadSignatureError if it does not verify, nothing is
+        stored then.
+        """
+        if name is None:
+            name = basename(path)
+        recipe_path = self._recipe_path(name)
+        with path_or_file(path) as f:
+            assert not archive.is_indexed(f), \
+                'Indexed parcels are not supported'
+            codec, format, pubkey, signature, message = \
+                archive.read_message(f)
+
+        digests, size, written = [], 0, 0
+        with message:
+            digest = archive.message_digest(message)
+            if verify:
+                archive.verify(pubkey, signature, format, message,
+                               digest=digest)
+            message.seek(0)
+            for chunk in chunks(message):
+                chunk_digest, stored = self._put_chunk(chunk)
+                digests.append(chunk_digest)
+                size += len(chunk)
+                written += stored
+
+        recipe = {
+            'version': RECIPE_VERSION,
+            'format': format,
+            'pubkey': hexlify(pubkey).decode(),
+            'signature': hexlify(signature).decode(),
+            'codec': codec,
+            # Not recorded in the parcel, assume the default.
+            'level': Compression(codec).level,
+            'sha512': hexlify(digest).decode(),
+            'size': size,
+            'chunks': digests,
+        }
+        self._write(recipe_path, json.dumps(recipe).encode('utf8'))
+        return dict(recipe, written=written)
+
+    def names(self) -> list[str]:
+        return sorted(
+            fn[:-len('.json')] for fn in os.listdir(self.recipes_path)
+            if fn.endswith('.json') and not fn.startswith('.'))
+
+    def __contains__(self, name: str) -> bool:
+        return os.path.exists(self._recipe_path(name))
+
+    def recipe(self, name: str) -> dict:
+        with open(self._recipe_path(name), 'rb') as f:
+            recipe = json.load(f)
+        assert recipe.get('version') == RECIPE_VERSION, \
+            f'Unsupported recipe version: {recipe.get("version")}'
+        return recipe
+
+    def remove(self, name: str):
+        "Removes a parcel, its chunks stay until gc()."
+        os.remove(self._recipe_path(name))
+
+    def _message(self, recipe: dict, message: BinaryIO) -> bytes:
+        "Writes the message of recipe, returns its digest."
+        hash = hashlib.sha512()
+        for digest in recipe['chunks']:
+            chunk = self._get_chunk(digest)
+            hash.update(chunk)
+            message.write(chunk)
+        if hash.hexdigest() != recipe['sha512']:
+            raise BadSignatureError('Rebuilt message does not match')
+        message.seek(0)
+        return hash.digest()
+
+    def rebuild(self, name: str, path: Union[str, BinaryIO],
+                overwrite: bool = False):
+        """
+        Writes parcel name to path, checking its signature. Compressed like
+        the original, it is the same file when both were compressed by the
+        same library.
+        """
+        recipe = self.recipe(name)
+        pubkey = unhexlify(recipe['pubkey'])
+        signature = unhexlify(recipe['signature'])
+        with SpooledTemporaryFile(max_size=SPILL_SIZE) as message:
+            digest = self._message(recipe, message)
+            archive.verify(pubkey, signature, recipe['format'], message,
+                           digest=digest)
+            message.seek(0)
+            with path_or_file(path, 'wb' if overwrite else 'xb') as f:
+                archive.write(
+                    f, recipe['format'], pubkey, signature, message,
+                    Compression(recipe['codec'], recipe['level']))
+
+    def load_parcel(self, name: str, verify: bool = True,
+                    verify_cache: VerifyCache = VERIFY_CACHE,
+                    keyring: Keyring = None) -> 'Parcel':
+        "Returns parcel name, without compressing it again."
+        from .parcel import Parcel, _read_members
+
+        recipe = self.recipe(name)
+        pubkey = unhexlify(recipe['pubkey'])
+        signature = unhexlify(recipe['signature'])
+        with SpooledTemporaryFile(max_size=SPILL_SIZE) as message:
+            digest = self._message(recipe, message)
+            if verify:
+                archive.verify(pubkey, signature, recipe['format'], message,
+                               digest=digest, cache=verify_cache)
+            message.seek(0)
+            with tarfile.open(fileobj=message, mode='r:') as inner:
+                members = _read_members(inner)
+
+        manifest = json.load(members.pop('manifest.json'))
+        parcel = Parcel._from_members(
+            pubkey, signature, manifest,
+            lambda fn: File(fn, value=members[fn]))
+        if verify and keyring is not None:
+            keyring.check(parcel.author, parcel.pubkey)
+        return parcel
+
+    def gc(self) -> tuple[int, int]:
+        """
+        Removes the chunks no parcel uses. Returns the number of chunks and
+        bytes removed.
+        """
+        used = set()
+        for name in self.names():
+            used.update(self.recipe(name)['chunks'])
+
+        removed, freed = 0, 0
+        for dirpath, _, filenames in os.walk(self.chunks_path):
+            for fn in filenames:
+                # Dot files are being written.
+                if fn in used or fn.startswith('.'):
+                    continue
+                path = pathjoin(dirpath, fn)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+        return removed, freed
+
+    def stats(self) -> dict:
+        "Returns the number of parcels and chunks, and their sizes."
+        parcels, size = 0, 0
+        for name in self.names():
+            parcels += 1
+            size += self.recipe(name)['size']
+        chunks, stored = 0, 0
+        for dirpath, _, filenames in os.walk(self.chunks_path):
+            for fn in filenames:
+                if not fn.startswith('.'):
+                    chunks += 1
+                    stored += os.path.getsize(pathjoin(dirpath, fn))
+        return {
+            'parcels': parcels,
+            'size': size,
+            'chunks': chunks,
+            'stored': stored,
+        }
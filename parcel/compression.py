@@ -0,0 +1,187 @@
+"""
+Compression of parcel archives.
+
+Gzipped parcels can be compressed on several threads. The tar stream is cut
+into blocks which are compressed as separate gzip members and concatenated,
+which gzip readers, including tarfile, read as one stream.
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+
+from .utils import build_mtime
+
+try:
+    # Python 3.14+
+    from compression import zstd
+
+except ImportError:
+    zstd = None
+
+
+GZIP = 'gzip'
+XZ = 'xz'
+BZ2 = 'bz2'
+ZSTD = 'zstd'
+CODECS = (GZIP, XZ, BZ2) + ((ZSTD,) if zstd else ())
+
+# Input of each gzip member when compressing on several threads.
+BLOCK_SIZE = 1024 * 1024
+
+_MAGIC = {
+    GZIP: b'\x1f\x8b',
+    BZ2: b'BZh',
+    XZ: b'\xfd7zXZ\x00',
+    ZSTD: b'\x28\xb5\x2f\xfd',
+}
+# Matches tarfile, which writes w:gz and w:bz2 at level 9.
+_DEFAULT_LEVELS = {GZIP: 9, BZ2: 9, XZ: 6, ZSTD: 3}
+
+
+class _ParallelGzipWriter:
+    "Compresses blocks of what is written as gzip members, on a pool."
+
+    def __init__(self, f: BinaryIO, level: int, threads: int,
+                 block_size: int = BLOCK_SIZE):
+        self.f = f
+        self.level = level
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.written = False
+        self.pending = deque()
+        # Bounds memory, at most this many blocks wait to be written.
+        self.limit = 2 * threads
+        self.executor = ThreadPoolExecutor(threads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _submit(self, block: bytes):
+        # zlib releases the GIL while compressing.
+        self.pending.append(self.executor.submit(
+            gzip.compress, block, self.level, mtime=build_mtime()))
+        self.written = True
+        while len(self.pending) > self.limit:
+            self.f.write(self.pending.popleft().result())
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def close(self):
+        if self.executor is None:
+            return
+        try:
+            if self.buffer or not self.written:
+                self._submit(bytes(self.buffer))
+                self.buffer.clear()
+            while self.pending:
+                self.f.write(self.pending.popleft().result())
+
+        finally:
+            self.executor.shutdown()
+            self.executor = None
+
+
+class Compression:
+    """
+    Codec, level and number of threads to compress parcels with. threads=0
+    uses a thread per CPU for gzip, other codecs compress on one.
+    """
+
+    def __init__(self, codec: str = GZIP, level: int = None,
+                 threads: int = 1):
+        assert codec in CODECS, f'Unsupported codec: {codec}'
+        assert threads >= 0, f'Invalid threads: {threads}'
+        if threads == 0:
+            threads = (os.cpu_count() or 1) if codec == GZIP else 1
+        assert codec == GZIP or threads == 1, \
+            f'{codec} compresses on a single thread'
+        self.codec = codec
+        self.level = _DEFAULT_LEVELS[codec] if level is None else level
+        self.threads = threads
+
+    def __repr__(self):
+        return f'<Compression: {self.codec} level={self.level} ' \
+               f'threads={self.threads}>'
+
+    def writer(self, f: BinaryIO) -> BinaryIO:
+        """
+        Returns a file that compresses what is written to it into f. Closing
+        it finishes the stream, but leaves f open.
+        """
+        if self.codec == GZIP:
+            if self.threads > 1:
+                return _ParallelGzipWriter(f, self.level, self.threads)
+            # No file name or time in the header, builds are reproducible.
+            return gzip.GzipFile(filename='', fileobj=f, mode='wb',
+                                 compresslevel=self.level,
+                                 mtime=build_mtime())
+        if self.codec == BZ2:
+            return bz2.BZ2File(f, 'wb', compresslevel=self.level)
+        if self.codec == XZ:
+            return lzma.LZMAFile(f, 'wb', preset=self.level)
+        return zstd.ZstdFile(f, 'wb', level=self.level)
+
+    def compressor(self):
+        "Returns a compressor for a single member."
+        if self.codec == GZIP:
+            return zlib.compressobj(self.level, wbits=16 + zlib.MAX_WBITS)
+        if self.codec == BZ2:
+            return bz2.BZ2Compressor(self.level)
+        if self.codec == XZ:
+            return lzma.LZMACompressor(preset=self.level)
+        return zstd.ZstdCompressor(self.level)
+
+
+def _check(codec: str):
+    assert codec in CODECS, f'Unsupported codec: {codec}'
+
+
+def detect(f: BinaryIO) -> str:
+    "Returns the codec f is compressed with, or None. f is left as it was."
+    position = f.tell()
+    head = f.read(max(len(magic) for magic in _MAGIC.values()))
+    f.seek(position)
+    for codec, magic in _MAGIC.items():
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def reader(f: BinaryIO) -> BinaryIO:
+    "Returns a file that decompresses f, whatever the codec."
+    codec = detect(f)
+    assert codec is not None, 'Unknown compression'
+    _check(codec)
+    if codec == GZIP:
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    if codec == BZ2:
+        return bz2.BZ2File(f, 'rb')
+    if codec == XZ:
+        return lzma.LZMAFile(f, 'rb')
+    return zstd.ZstdFile(f, 'rb')
+
+
+def decompressor(codec: str):
+    "Returns a decompressor for a single member."
+    _check(codec)
+    if codec == GZIP:
+        return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    if codec == BZ2:
+        return bz2.BZ2Decompressor()
+    if codec == XZ:
+        return lzma.LZMADecompressor()
+    return zstd.ZstdDecompressor()
@@ -0,0 +1,310 @@
+"""
+Binary deltas between parcels.
+
+A delta turns the message of an old parcel into the message of a new one,
+and carries the signature of the new one. Applying it rebuilds the new
+parcel from a local copy of the old one and checks that signature, so
+only what changed is transferred.
+
+Deltas are computed on the message, the uncompressed inner tar, rather than
+on the parcel file: compression spreads a one-line change over the rest of
+the stream. Tar pads every header and file to BLOCK_SIZE, so a file that
+grew or shrank only shifts the files after it by whole blocks. Blocks of
+the new message are matched against those of the old one at block offsets,
+which finds most of it cheaply. Only what is left, the files that changed,
+is searched at every offset with a rolling checksum like rsync.
+
+A delta is a compressed stream, by default xz, of:
+
+    magic, version   "PDLT" and a uint32
+    header           uint32 length, then JSON: format, pubkey, signature,
+                     codec and level of the new parcel, and the SHA-512 of
+                     the old ("source") and new ("target") messages
+    operations       "C" offset, length: copy from the old message
+                     "I" length, data: insert data
+                     "E": end
+
+Integers are little endian uint64 unless noted otherwise. Only streaming
+and legacy parcels are supported, the files of indexed ones are already
+compressed on their own.
+"""
+
+import hashlib
+import json
+import struct
+import tarfile
+import zlib
+from binascii import hexlify, unhexlify
+from tempfile import SpooledTemporaryFile
+from typing import Union, BinaryIO
+
+from nacl.exceptions import BadSignatureError
+
+from . import archive, compression
+from .compression import Compression, XZ
+from .keyring import Keyring
+from .utils import path_or_file, read_tar_file, SPILL_SIZE
+
+
+MAGIC = b'PDLT'
+DELTA_VERSION = 1
+EXTENSION = '.pcld'
+# Tar record size.
+BLOCK_SIZE = 512
+
+_PREAMBLE = struct.Struct('<4sI')
+_U32 = struct.Struct('<I')
+_COPY = struct.Struct('<QQ')
+_INSERT = struct.Struct('<Q')
+_CHUNK_SIZE = 1024 * 1024
+# Adler-32 modulus.
+_ADLER = 65521
+
+
+def _block_key(block: bytes) -> bytes:
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def _read_message(path: Union[str, BinaryIO]) -> tuple:
+    with path_or_file(path) as f:
+        assert not archive.is_indexed(f), \
+            'Deltas of indexed parcels are not supported'
+        return archive.read_message(f)
+
+
+class _Blocks:
+    "Block keys of the old message, by index, by key and by checksum."
+
+    def __init__(self, message: BinaryIO, block_size: int):
+        self.block_size = block_size
+        self.keys, self.offsets, self.checksums = [], {}, {}
+        message.seek(0)
+        while block := message.read(block_size):
+            key = _block_key(block)
+            self.offsets.setdefault(key, len(self.keys) * block_size)
+            if len(block) == block_size:
+                self.checksums.setdefault(
+                    zlib.adler32(block), []).append(len(self.keys))
+            self.keys.append(key)
+
+    def find(self, key: bytes, after: int = None) -> int:
+        """
+        Returns the offset of a block, preferring the one at after so copies
+        run on. None if there is none.
+        """
+        if after is not None and after % self.block_size == 0:
+            i = after // self.block_size
+            if i < len(self.keys) and self.keys[i] == key:
+                return after
+        return self.offsets.get(key)
+
+    def search(self, data: bytes):
+        """
+        Yields the copies and inserts making up data, matching blocks at any
+        offset with a rolling Adler-32 like rsync.
+        """
+        size, start, i = self.block_size, 0, 0
+        checksum = zlib.adler32(data[:size])
+        a, b = checksum & 0xffff, checksum >> 16
+        while i + size <= len(data):
+            found = None
+            for index in self.checksums.get((b << 16) | a, ()):
+                if self.keys[index] == _block_key(data[i:i + size]):
+                    found = index
+                    break
+
+            if found is not None:
+                if start < i:
+                    yield data[start:i]
+                yield found * size, size
+                i = start = i + size
+                checksum = zlib.adler32(data[i:i + size])
+                a, b = checksum & 0xffff, checksum >> 16
+                continue
+
+            if i + size == len(data):
+                break
+            out, into = data[i], data[i + size]
+            a = (a - out + into) % _ADLER
+            b = (b - size * out + a - 1) % _ADLER
+            i += 1
+
+        if start < len(data):
+            yield data[start:]
+
+
+def _matches(old: BinaryIO, new: BinaryIO, block_size: int):
+    """
+    Yields the copies and inserts making up new, matching blocks of new at
+    block offsets, then what is left at any offset.
+    """
+    blocks = _Blocks(old, block_size)
+    after, unmatched = None, bytearray()
+    new.seek(0)
+    while block := new.read(block_size):
+        offset = blocks.find(_block_key(block), after)
+        if offset is None:
+            unmatched += block
+            after = None
+            continue
+
+        if unmatched:
+            yield from blocks.search(bytes(unmatched))
+            unmatched.clear()
+        yield offset, len(block)
+        after = offset + len(block)
+
+    if unmatched:
+        yield from blocks.search(bytes(unmatched))
+
+
+def _operations(old: BinaryIO, new: BinaryIO, block_size: int):
+    "Yields the (offset, length) copies and the bytes inserted, merged."
+    copy, literal = None, bytearray()
+    for op in _matches(old, new, block_size):
+        if not isinstance(op, tuple):
+            if copy is not None:
+                yield copy
+                copy = None
+            literal += op
+            continue
+
+        if literal:
+            yield bytes(literal)
+            literal.clear()
+        if copy is not None and sum(copy) == op[0]:
+            copy = (copy[0], copy[1] + op[1])
+        else:
+            if copy is not None:
+                yield copy
+            copy = op
+
+    if copy is not None:
+        yield copy
+    if literal:
+        yield bytes(literal)
+
+
+def make_delta(old: Union[str, BinaryIO], new: Union[str, BinaryIO],
+               out: Union[str, BinaryIO], level: int = None,
+               block_size: int = BLOCK_SIZE):
+    """
+    Writes the delta from parcel old to parcel new to out, compressed with
+    xz at level. Returns the number of bytes inserted rather than copied.
+    """
+    _, _, _, _, old_message = _read_message(old)
+    codec, format, pubkey, signature, new_message = _read_message(new)
+    header = json.dumps({
+        'format': format,
+        'pubkey': hexlify(pubkey).decode(),
+        'signature': hexlify(signature).decode(),
+        # The level is not recorded in the parcel, assume the default.
+        'codec': codec,
+        'level': Compression(codec).level,
+        'source': hexlify(archive.message_digest(old_message)).decode(),
+        'target': hexlify(archive.message_digest(new_message)).decode(),
+    }).encode('utf8')
+
+    inserted = 0
+    with path_or_file(out, 'wb') as f, \
+            Compression(XZ, level).writer(f) as z:
+        z.write(_PREAMBLE.pack(MAGIC, DELTA_VERSION))
+        z.write(_U32.pack(len(header)))
+        z.write(header)
+        for op in _operations(old_message, new_message, block_size):
+            if isinstance(op, tuple):
+                z.write(b'C' + _COPY.pack(*op))
+            else:
+                z.write(b'I' + _INSERT.pack(len(op)))
+                z.write(op)
+                inserted += len(op)
+        z.write(b'E')
+    return inserted
+
+
+def _read_exactly(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    assert len(data) == size, 'Truncated delta'
+    return data
+
+
+def read_header(f: BinaryIO) -> dict:
+    "Reads the header of a delta from its decompressed stream."
+    magic, version = _PREAMBLE.unpack(_read_exactly(f, _PREAMBLE.size))
+    assert magic == MAGIC, 'Not a delta'
+    assert version == DELTA_VERSION, f'Unsupported delta version: {version}'
+    size = _U32.unpack(_read_exactly(f, _U32.size))[0]
+    return json.loads(_read_exactly(f, size))
+
+
+def _apply(old: BinaryIO, z: BinaryIO, message: BinaryIO):
+    while True:
+        op = _read_exactly(z, 1)
+        if op == b'E':
+            return
+        if op == b'C':
+            offset, length = _COPY.unpack(_read_exactly(z, _COPY.size))
+            old.seek(offset)
+            source = old
+        else:
+            assert op == b'I', f'Invalid delta operation: {op}'
+            length = _INSERT.unpack(_read_exactly(z, _INSERT.size))[0]
+            source = z
+        while length:
+            chunk = _read_exactly(source, min(length, _CHUNK_SIZE))
+            message.write(chunk)
+            length -= len(chunk)
+
+
+def _check_signer(message: BinaryIO, pubkey: bytes, old_pubkey: bytes,
+                  keyring: Keyring = None):
+    if keyring is None:
+        if pubkey != old_pubkey:
+            raise BadSignatureError(
+                'The parcel is not signed by the key of the old one')
+        return
+
+    message.seek(0)
+    with tarfile.open(fileobj=message, mode='r:') as inner:
+        manifest = json.loads(read_tar_file(inner, 'manifest.json'))
+    keyring.check(manifest.get('author'), pubkey)
+
+
+def apply_delta(old: Union[str, BinaryIO], delta: Union[str, BinaryIO],
+                path: Union[str, BinaryIO], overwrite: bool = False,
+                keyring: Keyring = None) -> dict:
+    """
+    Rebuilds the new parcel from parcel old and delta into path, and
+    verifies its signature. Raises AssertionError if the delta is not from
+    old and nacl.exceptions.BadSignatureError if the result does not
+    verify. Returns the header of the delta.
+
+    The key is taken from the delta, so the result must also be signed by
+    the key of old, or given a keyring, by a key trusted for its author.
+    Nothing is written otherwise.
+
+    The parcel is compressed like the original, it is the same file when
+    both were compressed by the same library.
+    """
+    _, _, old_pubkey, _, old_message = _read_message(old)
+    with path_or_file(delta) as f, compression.reader(f) as z, \
+            SpooledTemporaryFile(max_size=SPILL_SIZE) as message:
+        header = read_header(z)
+        assert archive.message_digest(old_message) == \
+            unhexlify(header['source']), 'The delta is not from this parcel'
+        _apply(old_message, z, message)
+
+        digest = archive.message_digest(message)
+        if digest != unhexlify(header['target']):
+            raise BadSignatureError('Rebuilt message does not match')
+        format = header['format']
+        pubkey = unhexlify(header['pubkey'])
+        signature = unhexlify(header['signature'])
+        archive.verify(pubkey, signature, format, message, digest=digest)
+        _check_signer(message, pubkey, old_pubkey, keyring)
+
+        message.seek(0)
+        with path_or_file(path, 'wb' if overwrite else 'xb') as out:
+            archive.write(out, format, pubkey, signature, message,
+                          Compression(header['codec'], header['level']))
+    return header
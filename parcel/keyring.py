@@ -0,0 +1,126 @@
+"""
+Signature verification cache and keyring of trusted public keys.
+"""
+
+import hashlib
+import json
+import threading
+from binascii import hexlify, unhexlify
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Union, TextIO
+
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+from .utils import path_or_file
+
+
+class UntrustedKey(BadSignatureError):
+    pass
+
+
+@lru_cache(maxsize=256)
+def verify_key(pubkey: bytes) -> VerifyKey:
+    "Returns a VerifyKey for pubkey, reused across parcels by the same key."
+    return VerifyKey(pubkey)
+
+
+class VerifyCache:
+    """
+    Remembers signatures that verified, keyed by public key, digest of the
+    signed data and signature. Holds at most size entries, the least
+    recently used are evicted first.
+    """
+
+    def __init__(self, size: int = 1024):
+        assert size > 0, f'Invalid size: {size}'
+        self.size = size
+        self._verified = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._verified)
+
+    def __contains__(self, key: tuple[bytes, bytes, bytes]) -> bool:
+        return key in self._verified
+
+    def clear(self):
+        with self._lock:
+            self._verified.clear()
+
+    def verify(self, pubkey: bytes, data: bytes, signature: bytes):
+        """
+        Verifies the signature of data unless it verified before. Raises
+        nacl.exceptions.BadSignatureError if it does not match.
+        """
+        key = (pubkey, hashlib.sha512(data).digest(), signature)
+        with self._lock:
+            if key in self._verified:
+                self._verified.move_to_end(key)
+                return
+
+        verify_key(pubkey).verify(data, signature)
+        with self._lock:
+            self._verified[key] = None
+            while len(self._verified) > self.size:
+                self._verified.popitem(last=False)
+
+
+# Shared by every load_parcel() that is not given a cache.
+VERIFY_CACHE = VerifyCache()
+
+
+class Keyring:
+    "Maps author emails to the public keys trusted to sign their parcels."
+
+    def __init__(self, keys: dict[str, list[bytes]] = None):
+        self._keys = {}
+        for author, pubkeys in (keys or {}).items():
+            for pubkey in pubkeys:
+                self.add(author, pubkey)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @staticmethod
+    def _normalize(author: str) -> str:
+        return author.strip().lower()
+
+    def add(self, author: str, pubkey: bytes):
+        # Fails early on a malformed key, and preloads it.
+        verify_key(pubkey)
+        keys = self._keys.setdefault(self._normalize(author), [])
+        if pubkey not in keys:
+            keys.append(pubkey)
+
+    def keys(self, author: str) -> list[bytes]:
+        return self._keys.get(self._normalize(author), [])
+
+    def trusts(self, author: str, pubkey: bytes) -> bool:
+        return bool(author) and pubkey in self.keys(author)
+
+    def check(self, author: str, pubkey: bytes):
+        "Raises UntrustedKey unless author trusts pubkey."
+        if not self.trusts(author, pubkey):
+            raise UntrustedKey(
+                f'Key {hexlify(pubkey).decode()} is not trusted for '
+                f'author {author!r}')
+
+    @classmethod
+    def load(cls, path: Union[str, TextIO]) -> 'Keyring':
+        "Loads a JSON object mapping author emails to hex public keys."
+        with path_or_file(path) as f:
+            keys = json.load(f)
+        return cls({
+            author: [unhexlify(pubkey) for pubkey in pubkeys]
+            for author, pubkeys in keys.items()
+        })
+
+    def save(self, path: Union[str, TextIO]):
+        keys = {
+            author: [hexlify(pubkey).decode() for pubkey in pubkeys]
+            for author, pubkeys in self._keys.items()
+        }
+        with path_or_file(path, 'w') as f:
+            json.dump(keys, f, indent=2)
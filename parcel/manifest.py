@@ -2,8 +2,6 @@ import json
 from typing import Union, TextIO
 from os.path import dirname, basename, isfile, join as pathjoin
 
-import yaml
-
 from . import Version
 from .attrs import File, Setting, Option
 from .spec import Spec
@@ -87,6 +85,14 @@ class Manifest(Spec):
     def description(self, value: str):
         self._manifest['description'] = value
 
+    @property
+    def author(self) -> str:
+        return self._manifest.get('author')
+
+    @author.setter
+    def author(self, value: str):
+        self._manifest['author'] = value
+
     @property
     def service_definition(self) -> File:
         return self._manifest.get('service_definition')
@@ -172,8 +178,10 @@ class Manifest(Spec):
                 return file
 
     def parse_service_definition(self) -> dict:
+        import yaml
+
         return yaml.load(
-            self.get_file(self.service_definition).value,
+            self.get_file(self.service_definition).read(),
             Loader=yaml.SafeLoader)
 
     def lint(self):
@@ -187,11 +195,10 @@ class Manifest(Spec):
         """
         sd_name = self.service_definition
 
-        if not sd_name:
-            _error('No service definition')
+        assert sd_name, 'No service definition'
 
         assert self.get_file(sd_name), \
-            'Service definition file "{sd_name}" missing'
+            f'Service definition file "{sd_name}" missing'
 
         sd = self.parse_service_definition()
         # pprint(sd)
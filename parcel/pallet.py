@@ -1,3 +1,4 @@
+from bisect import bisect_left, bisect_right
 from typing import Generator
 
 from .spec import Spec
@@ -5,14 +6,41 @@ from .spec import Spec
 
 class Pallet:
     def __init__(self):
+        # Incremented whenever the pallet changes.
+        self.generation = 0
         self._count = 0
         self._specs = {}
         self._names = {}
+        # Per name, versions in ascending order and the matching ids.
+        self._versions = {}
+        self._ids = {}
+        # Per name, the (start, stop) rank of each version. Built on demand
+        # and dropped when a version is added.
+        self._ranks = {}
+
+    def __len__(self) -> int:
+        return self._count
 
     def add_spec(self, spec: Spec):
+        self.generation += 1
         self._count += 1
         self._specs[self._count] = spec
-        self._names.setdefault(spec.name, {})[str(spec.version)] = self._count
+        names = self._names.setdefault(spec.name, {})
+        versions = self._versions.setdefault(spec.name, [])
+        ids = self._ids.setdefault(spec.name, [])
+        key = str(spec.version)
+        if key in names:
+            # Same version added again, the newest id replaces the old one.
+            i = ids.index(names[key])
+            ids[i] = self._count
+
+        else:
+            i = bisect_right(versions, spec.version)
+            versions.insert(i, spec.version)
+            ids.insert(i, self._count)
+
+        names[key] = self._count
+        self._ranks.pop(spec.name, None)
 
     def get(self, id: int) -> Spec:
         return self._specs[id]
@@ -20,15 +48,80 @@ class Pallet:
     def all(self) -> Generator[Spec, None, None]:
         yield from self._specs.items()
 
-    def search(self, spec: Spec) -> \
-            Generator[tuple[int, Spec], None, None]:
-        try:
-            ids = self._names[spec.name].values()
+    def names(self) -> list[str]:
+        return list(self._ids.keys())
+
+    def versions(self, name: str) -> list[int]:
+        "Returns ids of all versions of name, ordered by version."
+        return self._ids.get(name, [])
+
+    def _rank_table(self, name: str) -> dict:
+        table = self._ranks.get(name)
+        if table is None:
+            table = self._ranks[name] = {}
+            for i, version in enumerate(self._versions[name]):
+                start, _ = table.get(version, (i, i))
+                table[version] = (start, i + 1)
+        return table
+
+    def rank(self, id: int) -> int:
+        "Returns the integer rank of a spec among versions of its name."
+        spec = self._specs[id]
+        return self._rank_table(spec.name)[spec.version][0]
 
-        except KeyError:
-            return
+    def ranks(self, spec: Spec) -> tuple[int, int]:
+        """
+        Returns the (start, stop) ranks of versions of spec.name equal to
+        spec.version. start == stop if there are none.
+        """
+        ranks = self._rank_table(spec.name).get(spec.version)
+        if ranks is None:
+            # Not in the pallet, fall back to comparing versions.
+            i = bisect_left(self._versions[spec.name], spec.version)
+            ranks = (i, i)
+        return ranks
 
-        for id in ids:
-            other = self._specs[id]
-            if other.satisfies(spec):
-                yield id, other
+    def ranges(self, spec: Spec) -> list[tuple[int, int]]:
+        """
+        Returns the (start, stop) slices of `versions(spec.name)` that
+        satisfy spec.
+        """
+        count = len(self.versions(spec.name))
+        if not count:
+            return []
+
+        if spec.oper is None and spec.version is None:
+            # Name only match.
+            return [(0, count)]
+
+        # Every operator is answered from the ranks of the version.
+        oper = spec.oper
+        start, stop = self.ranks(spec)
+        if oper == '==':
+            ranges = [(start, stop)]
+        elif oper == '>=':
+            ranges = [(start, count)]
+        elif oper == '<=':
+            ranges = [(0, stop)]
+        elif oper == '>':
+            ranges = [(stop, count)]
+        elif oper == '<':
+            ranges = [(0, start)]
+        elif oper == '!=':
+            ranges = [(0, start), (stop, count)]
+        else:
+            raise AssertionError(f'Invalid operator: {oper}')
+
+        return [(start, stop) for start, stop in ranges if start < stop]
+
+    def search_ids(self, spec: Spec) -> list[int]:
+        ids = self.versions(spec.name)
+        found = []
+        for start, stop in self.ranges(spec):
+            found.extend(ids[start:stop])
+        return found
+
+    def search(self, spec: Spec) -> \
+            Generator[tuple[int, Spec], None, None]:
+        for id in self.search_ids(spec):
+            yield id, self.get(id)
@@ -1,16 +1,141 @@
 "Parcel package and metadata handling."
 
 import json
+import os
+import shutil
 import tarfile
-from os.path import isdir
-from typing import Union, TextIO
+import tempfile
+import threading
+from contextlib import ExitStack
+from functools import partial
+from os.path import isdir, join as pathjoin
+from tempfile import SpooledTemporaryFile
+from typing import Union, TextIO, BinaryIO, Callable
 from io import BytesIO
 
-from nacl.signing import SigningKey, VerifyKey
+from nacl.exceptions import BadSignatureError
+from nacl.signing import SigningKey
 
-from .utils import add_tar_file, read_tar_file, path_or_file
+from . import archive
+from .utils import (
+    add_tar_file, chmod_default, read_tar_file, path_or_file, spool,
+    SPILL_SIZE,
+)
 from .attrs import File
+from .build import BuildCache, build_digest
+from .cache import ExtractionCache
+from .compression import Compression
+from .keyring import Keyring, VerifyCache, VERIFY_CACHE
 from .manifest import Manifest
+from .template import Template, encode_value
+
+
+class _Archive:
+    """
+    Reads members of the signed inner archive of a parcel, either from a copy
+    of the message or by reading it again from path. Given their digests,
+    members read from path are checked against them.
+
+    The copy is indexed once. Reading from path goes on from the last member
+    read, so reading every file in order decompresses the archive once.
+    """
+
+    def __init__(self, path: Union[str, TextIO], message: BinaryIO = None,
+                 digests: dict[str, bytes] = None):
+        self.path = path
+        self.message = message
+        self.digests = digests
+        self._inner = None
+        self._stack = None
+        self._lock = threading.Lock()
+
+    def _reopen(self) -> tarfile.TarFile:
+        self.close()
+        if self.message is not None:
+            self.message.seek(0)
+            self._inner = tarfile.open(fileobj=self.message, mode='r:')
+            return self._inner
+
+        with ExitStack() as stack:
+            f = stack.enter_context(open(self.path, 'rb'))
+            outer = stack.enter_context(archive.open_outer(f))
+            self._inner = stack.enter_context(tarfile.open(
+                fileobj=archive.open_message(outer), mode='r|'))
+            self._stack = stack.pop_all()
+        return self._inner
+
+    def _find(self, name: str) -> tarfile.TarInfo:
+        if self.message is not None:
+            return (self._inner or self._reopen()).getmember(name)
+
+        # A stream only goes forward, start again once past name.
+        for inner in (self._inner, None):
+            inner = inner or self._reopen()
+            while (tinfo := inner.next()) is not None:
+                if tinfo.name == name:
+                    return tinfo
+            self.close()
+        raise KeyError(f'filename {name!r} not found')
+
+    def read(self, name: str) -> BinaryIO:
+        """
+        Returns a copy of member name. Raises
+        nacl.exceptions.BadSignatureError if it does not match its digest.
+        """
+        with self._lock:
+            tinfo = self._find(name)
+            reader = archive.HashingReader(self._inner.extractfile(tinfo))
+            value = spool(reader, tinfo.size)
+        if self.digests is not None and \
+           self.digests.get(name) != reader.hash.digest():
+            raise BadSignatureError(f'{name} does not match its digest')
+        return value
+
+    def close(self):
+        if self._stack is not None:
+            self._stack.close()
+        self._inner = self._stack = None
+
+
+class _IndexedArchive:
+    """
+    Reads members of an indexed parcel from path, or from a copy of it.
+    """
+
+    def __init__(self, index: archive.Index, path: Union[str, TextIO],
+                 copy: BinaryIO = None):
+        self.index = index
+        self.path = path
+        self.copy = copy
+
+    def read(self, name: str) -> BinaryIO:
+        if self.copy is not None:
+            return self.index.read(self.copy, name)
+        with open(self.path, 'rb') as f:
+            return self.index.read(f, name)
+
+
+def _digest_members(inner: tarfile.TarFile) -> tuple[dict[str, bytes], bytes]:
+    "Returns the SHA-512 of each file of inner, and the manifest."
+    digests, manifest = {}, None
+    for tinfo in inner:
+        if not tinfo.isfile():
+            continue
+        reader = archive.HashingReader(inner.extractfile(tinfo))
+        if tinfo.name == 'manifest.json':
+            manifest = reader.read()
+        reader.drain()
+        digests[tinfo.name] = reader.hash.digest()
+    if manifest is None:
+        raise KeyError("filename 'manifest.json' not found")
+    return digests, manifest
+
+
+def _read_members(inner: tarfile.TarFile) -> dict[str, BinaryIO]:
+    return {
+        tinfo.name: spool(inner.extractfile(tinfo), tinfo.size)
+        for tinfo in inner if tinfo.isfile()
+    }
 
 
 class Parcel(Manifest):
@@ -19,92 +144,340 @@ class Parcel(Manifest):
     def __init__(self, **kwargs):
         self.signature = kwargs.pop('signature', None)
         self.pubkey = kwargs.pop('pubkey', None)
+        # Compiled files by name, with the File and value they were
+        # compiled from.
+        self._templates = {}
         super().__init__(**kwargs)
 
     @staticmethod
-    def load_parcel(path: Union[str, TextIO], verify: bool = True) -> 'Parcel':
+    def _from_members(pubkey: bytes, signature: bytes, manifest: dict,
+                      file: Callable[[str], File]) -> 'Parcel':
+        kwargs = {
+            'pubkey': pubkey,
+            'signature': signature,
+            'manifest': manifest,
+        }
+        files = {fn: file(fn) for fn in manifest.get('files') or []}
+        sd = manifest.pop('service_definition', None)
+        if sd:
+            kwargs['service_definition'] = files.get(sd) or file(sd)
+        if files:
+            kwargs['files'] = list(files.values())
+        return Parcel(**kwargs)
+
+    @staticmethod
+    def load_parcel(path: Union[str, TextIO], verify: bool = True,
+                    lazy: bool = False,
+                    verify_cache: VerifyCache = VERIFY_CACHE,
+                    keyring: Keyring = None,
+                    cache: ExtractionCache = None) -> 'Parcel':
+        """
+        Loads a parcel, verifying its signature unless verify is False.
+
+        Parcels in the streaming format are read in a single pass, with
+        large files spooled to temporary files, so memory use does not
+        depend on the parcel size. Legacy parcels hold the message in
+        memory.
+
+        With lazy=True only the manifest is read up front, each file is read
+        from the archive when its value is first accessed. Loading lazily
+        from a path keeps nothing else in memory, but a verified load still
+        reads the whole message once to check it, and each file read is
+        checked against the digest it had then. Files read in order of name
+        are read in one pass.
+
+        Indexed parcels sign their table of contents instead, so a lazy
+        load only reads the manifest, and each file is checked against its
+        digest when read.
+
+        Signatures that verified before are remembered by verify_cache, pass
+        None to check every time. Given a keyring, the parcel must also be
+        signed by a key trusted for its author.
+
+        Given an extraction cache, a parcel that verified before is served
+        from it, with its files read from the cache on first access. Only
+        verified parcels are added to it.
+        """
+        if cache is not None:
+            parcel = Parcel._load_cached(path, verify, verify_cache, cache)
+        else:
+            parcel = Parcel._load_parcel(path, verify, lazy, verify_cache)
+        if verify and keyring is not None:
+            keyring.check(parcel.author, parcel.pubkey)
+        return parcel
+
+    @staticmethod
+    async def aload_parcel(path: Union[str, TextIO],
+                           **kwargs) -> 'Parcel':
+        """
+        Loads a parcel on a thread pool, see load_parcel() and aio. Takes
+        the same keyword arguments plus the executor to run on.
+        """
+        from . import aio
+
+        return await aio.load_parcel(path, **kwargs)
+
+    @staticmethod
+    def _load_cached(path: Union[str, TextIO], verify: bool,
+                     verify_cache: VerifyCache,
+                     cache: ExtractionCache) -> 'Parcel':
+        digest = cache.digest(path)
+        parcel = cache.get(digest)
+        if parcel is None:
+            parcel = Parcel._load_parcel(path, verify, False, verify_cache)
+            if verify:
+                cache.put(digest, parcel)
+        return parcel
+
+    @staticmethod
+    def _load_parcel(path: Union[str, TextIO], verify: bool, lazy: bool,
+                     verify_cache: VerifyCache) -> 'Parcel':
         with path_or_file(path) as f:
-            outer = tarfile.open(fileobj=f, mode='r:gz')
+            if archive.is_indexed(f):
+                return Parcel._load_indexed(
+                    path, f, verify, lazy, verify_cache)
+
+            outer = archive.open_outer(f)
             try:
-                pubkey = outer.extractfile('pubkey').read()
-                message = outer.extractfile('message').read()
-                signature = outer.extractfile('signature').read()
+                format, pubkey, signature = archive.read_header(outer)
+                if lazy:
+                    return Parcel._load_lazy(
+                        path, outer, format, pubkey, signature, verify,
+                        verify_cache)
+
+                if format == archive.FORMAT_LEGACY:
+                    message = BytesIO(read_tar_file(outer, 'message'))
+                    if verify:
+                        archive.verify(pubkey, signature, format, message,
+                                       cache=verify_cache)
+                    message.seek(0)
+                    with tarfile.open(fileobj=message, mode='r:') as inner:
+                        members = _read_members(inner)
+
+                else:
+                    reader = archive.HashingReader(archive.open_message(outer))
+                    with tarfile.open(fileobj=reader, mode='r|') as inner:
+                        members = _read_members(inner)
+                    digest = reader.drain()
+                    if verify:
+                        archive.verify(pubkey, signature, format,
+                                       digest=digest, cache=verify_cache)
 
             finally:
                 outer.close()
 
+        manifest = json.load(members.pop('manifest.json'))
+        return Parcel._from_members(
+            pubkey, signature, manifest,
+            lambda fn: File(fn, value=members[fn]))
+
+    @staticmethod
+    def _load_lazy(path: Union[str, TextIO], outer: tarfile.TarFile,
+                   format: int, pubkey: bytes, signature: bytes,
+                   verify: bool, verify_cache: VerifyCache) -> 'Parcel':
+        message = digests = None
+        if not isinstance(path, str) or \
+           (verify and format == archive.FORMAT_LEGACY):
+            # Can not come back to a file object later, and legacy parcels
+            # are verified from memory anyway, keep a copy.
+            message = spool(archive.open_message(outer))
             if verify:
-                key = VerifyKey(pubkey)
-                key.verify(message, signature)
+                archive.verify(pubkey, signature, format, message,
+                               cache=verify_cache)
+            source = _Archive(path, message)
+            manifest = source.read('manifest.json').read()
 
-            inner = tarfile.open(fileobj=BytesIO(message), mode='r')
-            try:
-                manifest = json.loads(read_tar_file(inner, 'manifest.json'))
-                kwargs = {
-                    'pubkey': pubkey,
-                    'signature': signature,
-                    'manifest': manifest,
-                }
-                sd = manifest.pop('service_definition', None)
-                if sd:
-                    kwargs['service_definition'] = \
-                        File(sd, value=read_tar_file(inner, sd))
-                files = manifest.get('files')
-                if files:
-                    kwargs['files'] = [
-                        File(fn, value=read_tar_file(inner, fn))
-                        for fn in files
-                    ]
-                return Parcel(**kwargs)
+        elif verify:
+            # The file may change once verified, files read from it again
+            # are checked against the digests of those that were.
+            reader = archive.HashingReader(archive.open_message(outer))
+            with tarfile.open(fileobj=reader, mode='r|') as inner:
+                digests, manifest = _digest_members(inner)
+            archive.verify(pubkey, signature, format, digest=reader.drain(),
+                           cache=verify_cache)
+            source = _Archive(path, digests=digests)
 
-            finally:
-                inner.close()
+        else:
+            with tarfile.open(fileobj=archive.open_message(outer),
+                              mode='r|') as inner:
+                manifest = read_tar_file(inner, 'manifest.json')
+            source = _Archive(path)
+
+        return Parcel._from_members(
+            pubkey, signature, json.loads(manifest),
+            lambda fn: File(fn, loader=partial(source.read, fn)))
+
+    @staticmethod
+    def _load_indexed(path: Union[str, TextIO], f: BinaryIO, verify: bool,
+                      lazy: bool, verify_cache: VerifyCache) -> 'Parcel':
+        start = f.tell()
+        index = archive.Index(f)
+        if verify:
+            index.verify(verify_cache)
+
+        if not lazy:
+            members = {name: index.read(f, name) for name in index.members}
+            manifest = json.load(members.pop('manifest.json'))
+            return Parcel._from_members(
+                index.pubkey, index.signature, manifest,
+                lambda fn: File(fn, value=members[fn]))
+
+        if isinstance(path, str):
+            source = _IndexedArchive(index, path)
+        else:
+            # Can not come back to a file object later, keep a copy.
+            f.seek(start)
+            copy = spool(f)
+            source = _IndexedArchive(archive.Index(copy), path, copy)
+        manifest = json.load(source.read('manifest.json'))
+        return Parcel._from_members(
+            index.pubkey, index.signature, manifest,
+            lambda fn: File(fn, loader=partial(source.read, fn)))
 
     def save_parcel(self, path: Union[str, TextIO], key: bytes = None,
-                    overwrite: bool = False) -> SigningKey:
-        iio = BytesIO()
-        inner = tarfile.open(fileobj=iio, mode='w')
-        try:
-            add_tar_file(
-                inner,
-                'manifest.json',
-                BytesIO(json.dumps(self.manifest).encode('utf8'))
-            )
-
-            for file in self.files:
-                add_tar_file(inner, file.name, file.value)
-
-        finally:
-            inner.close()
-
-        iio.seek(0)
+                    overwrite: bool = False,
+                    format: int = archive.DEFAULT_FORMAT,
+                    compression: Compression = None,
+                    build_cache: BuildCache = None) -> SigningKey:
+        """
+        Signs and saves the parcel, returns the signing key.
+
+        The inner archive is spooled to a temporary file when large and
+        streamed into the parcel. A key is generated if none is given.
+        compression defaults to gzip at level 9 on a single thread.
+
+        The archive only depends on the manifest, files, key and settings.
+        Given a build cache and a key, a parcel that was built before from
+        the same inputs is copied from it rather than packed and signed.
+        """
+        members = [(
+            'manifest.json',
+            BytesIO(json.dumps(self.manifest, sort_keys=True).encode('utf8'))
+        )]
+        members.extend(sorted(
+            ((file.name, file.value) for file in self.files),
+            key=lambda member: member[0]))
+
         if key is None:
             key = SigningKey.generate()
-
-        signed = key.sign(iio.getvalue())
         self.pubkey = key.verify_key.encode()
-        self.signature = signed.signature
-
         mode = 'xb' if not overwrite else 'wb'
+
         with path_or_file(path, mode) as f:
-            outer = tarfile.open(fileobj=f, mode='w:gz')
+            if build_cache is None:
+                self._write_parcel(f, key, members, format, compression)
+                return key
+
+            digest = build_digest(members, self.pubkey, format, compression)
+            signature = build_cache.get(digest, f)
+            if signature is not None:
+                self.signature = signature
+                return key
+
+            with SpooledTemporaryFile(max_size=SPILL_SIZE) as out:
+                self._write_parcel(out, key, members, format, compression)
+                out.seek(0)
+                shutil.copyfileobj(out, f)
+                out.seek(0)
+                build_cache.put(digest, out, self.signature)
+
+        return key
+
+    async def asave_parcel(self, path: Union[str, TextIO],
+                           **kwargs) -> SigningKey:
+        """
+        Signs and saves the parcel on a thread pool, see save_parcel() and
+        aio. Takes the same keyword arguments plus the executor to run on.
+        """
+        from . import aio
+
+        return await aio.save_parcel(self, path, **kwargs)
+
+    def _write_parcel(self, f: BinaryIO, key: SigningKey,
+                      members: list[tuple[str, BinaryIO]], format: int,
+                      compression: Compression):
+        with SpooledTemporaryFile(max_size=SPILL_SIZE) as spooled:
+            if format == archive.FORMAT_INDEXED:
+                toc = archive.build_index(members, spooled, compression)
+                self.signature = archive.sign(key, format, BytesIO(toc))
+                archive.write_indexed(
+                    f, self.pubkey, self.signature, toc, spooled)
+                return
+
+            inner = tarfile.open(fileobj=spooled, mode='w')
             try:
-                add_tar_file(outer, 'message', BytesIO(signed.message))
-                add_tar_file(outer, 'signature', BytesIO(signed.signature))
-                add_tar_file(outer, 'pubkey', BytesIO(self.pubkey))
+                for name, fileobj in members:
+                    add_tar_file(inner, name, fileobj)
 
             finally:
-                outer.close()
+                inner.close()
 
-        return key
+            self.signature = archive.sign(key, format, spooled)
+            archive.write(f, format, self.pubkey, self.signature, spooled,
+                          compression)
 
     def configure(self, options: dict, settings: dict):
-        assert set(options.keys()) == set(self.options.keys()), \
-            "Incomplete options"
-        assert set(settings) == set(self.settings.keys()),  \
-            "Incomplete settings"
-        self._option_values = options
-        self._settings_values = settings
-
-    def generate(self, path: Union[str, TextIO]):
+        """
+        Sets the values of options, by name, the default of those missing,
+        and of settings, which must all be given.
+        """
+        names = {option.name for option in self.options}
+        assert set(options) <= names, \
+            f'Unknown options: {sorted(set(options) - names)}'
+        assert set(settings) == {setting.name for setting in self.settings}, \
+            'Incomplete settings'
+        for option in self.options:
+            option.value = options.get(option.name, option.default)
+            assert option.value is not None, \
+                f'No value for option "{option.name}"'
+        for setting in self.settings:
+            setting.value = settings[setting.name]
+
+    def templates(self) -> dict[str, Template]:
+        """
+        Returns the service definition and files compiled for substitution,
+        by name. Each is compiled once, unless the File or its value is
+        replaced.
+        """
+        templates = {}
+        for file in self.files:
+            compiled = self._templates.get(file.name)
+            value = file.value
+            if compiled is None or compiled[0] is not file or \
+               compiled[1] is not value:
+                compiled = (file, value, Template(file.read()))
+            templates[file.name] = compiled
+        self._templates = templates
+        return {
+            name: template for name, (_, _, template) in templates.items()
+        }
+
+    def generate(self, path: str) -> list[str]:
+        """
+        Writes the service definition and files to directory path, with
+        the values of options and settings substituted, see configure() and
+        template. Each file is replaced atomically, with the mode open()
+        would give it so containers running as other users can read it.
+        Returns their paths.
+        """
         assert isdir(path), 'Must output to a directory'
+        values = {}
+        for value in self.options + self.settings:
+            assert value.value is not None, 'Not configured'
+            values[value.name] = encode_value(value.value)
+
+        paths = []
+        for name, template in self.templates().items():
+            fd, tmp = tempfile.mkstemp(prefix='.', dir=path)
+            try:
+                chmod_default(fd)
+                with os.fdopen(fd, 'wb') as f:
+                    template.render(values, f)
+                os.replace(tmp, pathjoin(path, name))
+
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+            paths.append(pathjoin(path, name))
+        return paths
@@ -0,0 +1,170 @@
+"""
+Local parcel repositories.
+
+A repository is a directory of .pcl files with an index of their metadata,
+so a Pallet or Solver can be loaded without opening any parcel. The index
+is updated incrementally, a parcel is only read again when its mtime or size
+changed. It can also be written as a binary catalogue, which is mapped
+rather than loaded.
+"""
+
+import json
+import logging
+import os
+from binascii import hexlify
+from os.path import join as pathjoin
+from typing import Generator
+
+from .catalogue import CataloguePallet, save_catalogue
+from .manifest import Manifest
+from .pallet import Pallet
+from .solver import Solver
+from .utils import file_digest
+
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+INDEX_NAME = 'index.json'
+CATALOGUE_NAME = 'catalogue.bin'
+INDEX_VERSION = 1
+EXTENSION = '.pcl'
+
+
+def entry_manifest(entry: dict) -> Manifest:
+    "Returns a Manifest of the metadata in an index entry."
+    return Manifest({
+        'name': entry['name'],
+        'version': entry['version'],
+        'uuid': entry['uuid'],
+        'requires': entry['requires'],
+        'conflicts': entry['conflicts'],
+    })
+
+
+class Repository:
+    """
+    A directory of parcels and the index of their name, version, uuid,
+    requires, conflicts, author, pubkey and digest, per file name.
+    """
+
+    def __init__(self, path: str, index_name: str = INDEX_NAME):
+        self.path = path
+        self.index_path = pathjoin(path, index_name)
+        self.catalogue_path = pathjoin(path, CATALOGUE_NAME)
+        self._entries = {}
+        try:
+            with open(self.index_path, 'rb') as f:
+                index = json.load(f)
+
+        except FileNotFoundError:
+            pass
+
+        else:
+            assert index.get('version') == INDEX_VERSION, \
+                f'Unsupported index version: {index.get("version")}'
+            self._entries = index['parcels']
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def entries(self) -> dict[str, dict]:
+        "Returns the index entries by file name."
+        return self._entries
+
+    def filename(self, name: str) -> str:
+        return pathjoin(self.path, name)
+
+    @staticmethod
+    def _entry(path: str, stat: os.stat_result, verify: bool) -> dict:
+        from .parcel import Parcel
+
+        # Only the manifest is needed, files are left in the archive.
+        parcel = Parcel.load_parcel(path, verify=verify, lazy=True)
+        return {
+            'name': parcel.name,
+            'version': str(parcel.version),
+            'uuid': parcel.uuid,
+            'requires': [str(s) for s in parcel.requires],
+            'conflicts': [str(s) for s in parcel.conflicts],
+            'author': parcel.author,
+            'pubkey': hexlify(parcel.pubkey).decode(),
+            'digest': file_digest(path),
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+        }
+
+    def update(self, verify: bool = True) -> tuple[int, int]:
+        """
+        Indexes parcels that were added or changed and drops those that were
+        removed, then saves the index. Parcels that fail to load are left
+        out. Returns the number of (indexed, removed) entries.
+        """
+        entries, indexed = {}, 0
+        with os.scandir(self.path) as it:
+            for dirent in it:
+                if not dirent.name.endswith(EXTENSION) or \
+                   not dirent.is_file():
+                    continue
+                stat = dirent.stat()
+                entry = self._entries.get(dirent.name)
+                if entry is not None and entry['mtime'] == stat.st_mtime_ns \
+                   and entry['size'] == stat.st_size:
+                    entries[dirent.name] = entry
+                    continue
+
+                try:
+                    entries[dirent.name] = self._entry(
+                        dirent.path, stat, verify)
+
+                except Exception as e:
+                    LOGGER.warning('Failed to index %s: %s', dirent.path, e)
+                    continue
+
+                indexed += 1
+
+        removed = len(set(self._entries) - set(entries))
+        self._entries = entries
+        if indexed or removed or not os.path.exists(self.index_path):
+            self.save()
+        return indexed, removed
+
+    def save(self):
+        "Writes the index, replacing the old one atomically."
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'parcels': self._entries,
+            }, f, separators=(',', ':'))
+        os.replace(tmp, self.index_path)
+
+    def manifests(self) -> Generator[Manifest, None, None]:
+        "Yields a Manifest of the metadata of each indexed parcel."
+        for entry in self._entries.values():
+            yield entry_manifest(entry)
+
+    def load_pallet(self, pallet: Pallet = None) -> Pallet:
+        pallet = Pallet() if pallet is None else pallet
+        for manifest in self.manifests():
+            pallet.add_spec(manifest)
+        return pallet
+
+    def load_solver(self, solver: Solver = None) -> Solver:
+        solver = Solver() if solver is None else solver
+        # Recompiles everything once, rather than a name per add_spec().
+        self.load_pallet(solver.pallet)
+        return solver
+
+    def save_catalogue(self):
+        "Writes the index as a binary catalogue, see load_catalogue()."
+        tmp = self.catalogue_path + '.tmp'
+        save_catalogue(self.load_pallet(), tmp)
+        os.replace(tmp, self.catalogue_path)
+
+    def load_catalogue(self) -> CataloguePallet:
+        """
+        Opens the catalogue written by save_catalogue(), a Pallet that only
+        reads the names in use.
+        """
+        return CataloguePallet(self.catalogue_path)
@@ -2,7 +2,8 @@
 
 import itertools
 import logging
-from typing import Generator
+import time
+from typing import Generator, Union
 
 import pycosat
 
@@ -13,29 +14,327 @@ from .spec import Spec
 LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(logging.NullHandler())
 
+# "Only one version of a package" encodings.
+AMO_PAIRWISE = 'pairwise'
+AMO_SEQUENTIAL = 'sequential'
+AMO_ENCODINGS = (AMO_PAIRWISE, AMO_SEQUENTIAL)
 
-class Solver:
-    def __init__(self):
-        self.pallet = Pallet()
-
-    def _packages_cnf(self) -> Generator[list[int], None, None]:
-        for id, spec in self.pallet.all():
-            # Only one version of each package can be installed at a time.
-            query = Spec(spec.name, spec.version, oper='!=')
-            for sid, s in self.pallet.search(query):
-                if id == sid:
-                    continue
+# Version range encodings.
+RANGES_DIRECT = 'direct'
+RANGES_ORDER = 'order'
+RANGES_ENCODINGS = (RANGES_DIRECT, RANGES_ORDER)
+
+# Costs minimized by Solver.solve_best().
+OBJECTIVE_CHANGES = 'changes'
+OBJECTIVE_NEWEST = 'newest'
+OBJECTIVES = (OBJECTIVE_CHANGES, OBJECTIVE_NEWEST)
+
+# First auxiliary variable, well clear of any pallet id.
+_AUX = 1 << 40
+
+
+class _Encoder:
+    """
+    Allocates variables and expresses version constraints as clauses.
+
+    Pallet ids are used as variables directly, auxiliary variables are
+    allocated from _AUX upwards so the pallet can keep growing. Solver
+    renumbers both densely before solving.
+
+    Both the sequential at-most-one and the order range encodings are built
+    on a "ladder" per package name. Given the ids of a name ordered by
+    version, v[0]..v[n-1], ladder variable o[k] is true iff any of
+    v[k]..v[n-1] is installed. o[n-1] is v[n-1] itself. The ladder is fully
+    defined by the version variables, so it does not add models.
+    """
+
+    def __init__(self, pallet: Pallet, amo: str, ranges: str):
+        self.pallet = pallet
+        self.amo = amo
+        self.ranges = ranges
+        self._aux = _AUX
+        self._ladders = {}
+        self._definitions = {}
+
+    def var(self) -> int:
+        self._aux += 1
+        return self._aux
+
+    def invalidate(self, name: str):
+        "Forgets the ladder of name, its versions have changed."
+        self._ladders.pop(name, None)
+        self._definitions.pop(name, None)
+
+    def definitions(self, name: str) -> list[list[int]]:
+        "Returns the clauses defining the ladder of name, if it was built."
+        return self._definitions.get(name, [])
+
+    def ladder(self, name: str) -> list[int]:
+        if name in self._ladders:
+            return self._ladders[name]
+        ids = self.pallet.versions(name)
+        o = list(ids)
+        definitions = []
+        for k in range(len(ids) - 2, -1, -1):
+            o[k] = self.var()
+            # o[k] <-> v[k] | o[k + 1]
+            definitions.append([-ids[k], o[k]])
+            definitions.append([-o[k + 1], o[k]])
+            definitions.append([-o[k], ids[k], o[k + 1]])
+            if self.amo == AMO_SEQUENTIAL:
+                # A newer version excludes this one.
+                definitions.append([-ids[k], -o[k + 1]])
+        self._ladders[name] = o
+        self._definitions[name] = definitions
+        return o
+
+    def at_most_one(self, name: str) -> Generator[list[int], None, None]:
+        "Only one version of each package can be installed at a time."
+        if self.amo == AMO_SEQUENTIAL:
+            self.ladder(name)
+            return
+
+        ids = self.pallet.versions(name)
+        for i, id in enumerate(ids):
+            for sid in ids[i + 1:]:
                 yield [-id, -sid]
-            # Handle conflicts, if any.
-            for c in spec.conflicts:
-                state = [-id]
-                state.extend([-id for id, _ in self.pallet.search(c)])
-                yield state
-            # Handle requires, if any.
-            for r in spec.requires:
-                state = [-id]
-                state.extend([id for id, _ in self.pallet.search(r)])
-                yield state
+
+    def _order(self, spec: Spec) -> bool:
+        return self.ranges == RANGES_ORDER and \
+            len(self.pallet.versions(spec.name)) > 1
+
+    def within(self, spec: Spec) -> Generator[list[int], None, None]:
+        """
+        Yields clauses that together hold iff a version matching spec is
+        installed.
+        """
+        if not self._order(spec):
+            yield self.pallet.search_ids(spec)
+            return
+
+        o = self.ladder(spec.name)
+        ranges = self.pallet.ranges(spec)
+        if len(ranges) == 1:
+            start, stop = ranges[0]
+            yield [o[start]]
+            if stop < len(o):
+                yield [-o[stop]]
+            return
+
+        # Some version is installed, but none in the gaps between ranges.
+        yield [o[0]]
+        start = 0
+        for stop, resume in ranges + [(len(o), None)]:
+            yield from _not_in_range(o, start, stop)
+            start = resume
+
+    def outside(self, spec: Spec) -> Generator[list[int], None, None]:
+        """
+        Yields clauses that together hold iff no version matching spec is
+        installed.
+        """
+        if not self._order(spec):
+            for id in self.pallet.search_ids(spec):
+                yield [-id]
+            return
+
+        o = self.ladder(spec.name)
+        for start, stop in self.pallet.ranges(spec):
+            yield from _not_in_range(o, start, stop)
+
+
+def _not_in_range(o: list[int], start: int, stop: int) -> \
+        Generator[list[int], None, None]:
+    # Relies on at most one version being installed.
+    if start >= stop:
+        return
+    if stop < len(o):
+        yield [-o[start], o[stop]]
+    else:
+        yield [-o[start]]
+
+
+def _implies(id: int, clauses: Generator[list[int], None, None]) -> \
+        Generator[list[int], None, None]:
+    for clause in clauses:
+        yield [-id] + clause
+
+
+class BudgetExceeded(Exception):
+    """
+    A solve ran out of time or propagations before it could finish.
+
+    `reason` is "timeout" or "prop_limit". For `Solver.solve_best`, `best`
+    holds the cheapest solution found so far, if any.
+    """
+
+    def __init__(self, reason: str, best: tuple = None):
+        super().__init__(f'Solver budget exceeded: {reason}')
+        self.reason = reason
+        self.best = best
+
+
+class _Budget:
+    def __init__(self, timeout: float = None, prop_limit: int = None):
+        self.deadline = None if timeout is None else \
+            time.monotonic() + timeout
+        self.prop_limit = prop_limit or 0
+
+    def check(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise BudgetExceeded('timeout')
+
+    def solve(self, cnf: list[list[int]], variables: int) -> \
+            Union[list[int], None]:
+        sol = pycosat.solve(cnf, vars=variables, prop_limit=self.prop_limit)
+        if sol == 'UNKNOWN':
+            raise BudgetExceeded('prop_limit')
+        return sol if sol != 'UNSAT' else None
+
+    def itersolve(self, cnf: list[list[int]], variables: int) -> \
+            Generator[list[int], None, None]:
+        if not self.prop_limit:
+            for sol in pycosat.itersolve(cnf, vars=variables):
+                self.check()
+                yield sol
+            return
+
+        # itersolve() stops silently at the propagation limit, so block
+        # solutions by hand to tell running out from running dry.
+        cnf = list(cnf)
+        while True:
+            sol = self.solve(cnf, variables)
+            if sol is None:
+                return
+            self.check()
+            yield sol
+            cnf.append([-v for v in sol])
+
+
+def _at_most(lits: list[int], k: int, variables: int) -> list[list[int]]:
+    """
+    Sequential counter encoding of "at most k of lits are true". s[i][j]
+    means at least j + 1 of the first i + 1 lits are true. Auxiliary
+    variables are numbered after variables.
+    """
+    if k == 0:
+        return [[-lit] for lit in lits]
+
+    def s(i, j):
+        return variables + i * k + j + 1
+
+    clauses = []
+    for i, lit in enumerate(lits):
+        clauses.append([-lit, s(i, 0)])
+        if i == 0:
+            continue
+        for j in range(k):
+            clauses.append([-s(i - 1, j), s(i, j)])
+            if j > 0:
+                clauses.append([-lit, -s(i - 1, j - 1), s(i, j)])
+        # Overflow.
+        clauses.append([-lit, -s(i - 1, k - 1)])
+    return clauses
+
+
+def _renumber(cnf: list[list[int]], ids: list[int]) -> \
+        tuple[list[list[int]], int]:
+    """
+    Renumbers variables so ids become 1..len(ids) and auxiliary variables
+    follow them. Leaves no gaps, which the solver would treat as free
+    variables and enumerate.
+    """
+    mapping = {id: i for i, id in enumerate(ids, 1)}
+    renumbered = []
+    for clause in cnf:
+        new = []
+        for lit in clause:
+            var = mapping.get(abs(lit))
+            if var is None:
+                var = mapping[abs(lit)] = len(mapping) + 1
+            new.append(var if lit > 0 else -var)
+        renumbered.append(new)
+    return renumbered, len(mapping)
+
+
+class Solver:
+    """
+    Compiles the clauses of the pallet once and keeps them between solves.
+    Adding a spec through `add_spec` only recompiles the clauses that
+    depend on the versions of its name, adding to the pallet directly
+    recompiles everything. Only the names a solve reaches are compiled, so
+    a lazy pallet such as a CataloguePallet is only read that far.
+    """
+
+    def __init__(self, amo: str = AMO_PAIRWISE, ranges: str = RANGES_DIRECT,
+                 pallet: Pallet = None):
+        assert amo in AMO_ENCODINGS, f'Invalid amo encoding: {amo}'
+        assert ranges in RANGES_ENCODINGS, \
+            f'Invalid ranges encoding: {ranges}'
+        self.pallet = Pallet() if pallet is None else pallet
+        self.amo = amo
+        self.ranges = ranges
+        self.stats = {}
+        self._reset()
+
+    def _reset(self):
+        self._encoder = _Encoder(self.pallet, self.amo, self.ranges)
+        self._generation = self.pallet.generation
+        # Requires and conflicts clauses per pallet id.
+        self._clauses = {}
+        # At most one clauses per name.
+        self._amo = {}
+        # Ids of specs whose constraints mention a name, built by the first
+        # add_spec().
+        self._mentions = None
+
+    def _mention(self, id: int, spec: Spec):
+        for other in spec.requires + spec.conflicts:
+            self._mentions.setdefault(other.name, set()).add(id)
+
+    def _check_compiled(self):
+        if self._generation != self.pallet.generation or \
+           self._encoder.amo != self.amo or \
+           self._encoder.ranges != self.ranges:
+            LOGGER.debug('Pallet or encoding changed, recompiling')
+            self._reset()
+
+    def _cone(self, specs: list[Spec]) -> list[str]:
+        """
+        Returns the names reachable from specs through requires and
+        conflicts. Nothing outside of them can affect the solution.
+        """
+        names = list(dict.fromkeys(spec.name for spec in specs))
+        seen = set(names)
+        for name in names:
+            for id in self.pallet.versions(name):
+                spec = self.pallet.get(id)
+                for other in spec.requires + spec.conflicts:
+                    if other.name not in seen:
+                        seen.add(other.name)
+                        names.append(other.name)
+        return names
+
+    def _spec_cnf(self, id: int) -> Generator[list[int], None, None]:
+        spec = self.pallet.get(id)
+        # Handle conflicts, if any.
+        for c in spec.conflicts:
+            yield from _implies(id, self._encoder.outside(c))
+        # Handle requires, if any.
+        for r in spec.requires:
+            yield from _implies(id, self._encoder.within(r))
+
+    def _packages_cnf(self, names: list[str]) -> \
+            Generator[list[int], None, None]:
+        for name in names:
+            if name not in self._amo:
+                self._amo[name] = list(self._encoder.at_most_one(name))
+            yield from self._amo[name]
+            for id in self.pallet.versions(name):
+                if id not in self._clauses:
+                    self.stats['compiled'] += 1
+                    self._clauses[id] = list(self._spec_cnf(id))
+                yield from self._clauses[id]
 
     def _installed_cnf(self, installed: list[Spec]) -> \
             Generator[list[int], None, None]:
@@ -43,16 +342,22 @@ class Solver:
         # version is >= the installed version.
         for spec in installed:
             query = Spec(spec.name, spec.version, oper='>=')
-            yield [id for id, _ in self.pallet.search(query)]
+            yield from self._encoder.within(query)
 
     def _selected_cnf(self, selected: list[Spec]) -> \
             Generator[list[int], None, None]:
         for spec in selected:
-            yield [id for id, _ in self.pallet.search(spec)]
+            yield from self._encoder.within(spec)
 
     def _print_exp(self, exp: list[int], pre: str = ''):
+        # Formatting looks up every spec, skip it unless it is logged.
+        if not LOGGER.isEnabledFor(logging.DEBUG):
+            return
+
         def _format(id):
             sign = '+' if id > 0 else '-'
+            if abs(id) > len(self.pallet):
+                return f'{sign}_{abs(id)}'
             spec = self.pallet.get(abs(id))
             return f'{sign}{spec.name}-{spec.version}'
 
@@ -63,11 +368,167 @@ class Solver:
             self._print_exp(o, pre='Repo ')
             yield o
 
-    def add_spec(self, *args, **kwargs):
+    def add_spec(self, spec: Spec):
         "Adds spec to list of available parcels"
-        return self.pallet.add_spec(*args, **kwargs)
+        self._check_compiled()
+        if self._mentions is None:
+            self._mentions = {}
+            for id, other in self.pallet.all():
+                self._mention(id, other)
+        self.pallet.add_spec(spec)
+        self._generation = self.pallet.generation
+        # Only clauses referring to versions of this name are affected.
+        self._encoder.invalidate(spec.name)
+        self._amo.pop(spec.name, None)
+        for id in self._mentions.get(spec.name, ()):
+            self._clauses.pop(id, None)
+        self._mention(len(self.pallet), spec)
+
+    def encode(self, installed: list[Spec], selected: list[Spec]) -> \
+            tuple[list[list[int]], list[int]]:
+        """
+        Builds the CNF for a solve and records its size in `stats`.
 
-    def solve(self, installed: list[Spec], selected: list[Spec]) -> \
+        Only the packages reachable from installed and selected are encoded,
+        and their variables are numbered densely. Returns the CNF and the
+        pallet ids of variables 1..n, any further variables are auxiliary.
+        """
+        self._check_compiled()
+        self.stats = {'compiled': 0}
+        names = self._cone(installed + selected)
+        cnf = []
+        cnf.extend(self._packages_cnf(names))
+        cnf.extend(self._installed_cnf(installed))
+        cnf.extend(self._selected_cnf(selected))
+        for name in names:
+            cnf.extend(self._encoder.definitions(name))
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            cnf = list(self._debug(cnf))
+
+        ids = []
+        for name in names:
+            ids.extend(self.pallet.versions(name))
+        cnf, variables = _renumber(cnf, ids)
+        self.stats.update({
+            'packages': len(ids),
+            'variables': variables,
+            'clauses': len(cnf),
+            'literals': sum(map(len, cnf)),
+        })
+        LOGGER.debug('Encoded %(packages)i packages (%(compiled)i compiled), '
+                     '%(variables)i variables, %(clauses)i clauses, '
+                     '%(literals)i literals', self.stats)
+        return cnf, ids
+
+    def _removable(self, installed: list[Spec]) -> set[int]:
+        removable = set()
+        for i in installed:
+            removable.update(self.pallet.search_ids(i))
+        return removable
+
+    def _decode(self, sol: list[int], ids: list[int], removable: set[int]) \
+            -> tuple[list[Spec], list[Spec]]:
+        sol = [
+            ids[v - 1] if v > 0 else -ids[-v - 1]
+            for v in sol if abs(v) <= len(ids)
+        ]
+        self._print_exp(sol, pre='Solv ')
+        return (
+            [
+                self.pallet.get(id) for id in sol if id > 0
+            ],
+            [
+                self.pallet.get(abs(id))
+                for id in sol if id < 0 and abs(id) in removable
+            ],
+        )
+
+    def _costs(self, objective: str, ids: list[int], removable: set[int],
+               variables: int) -> tuple[list[int], list[list[int]], int]:
+        """
+        Returns the literals counting towards the cost of a solution, the
+        clauses defining them and the new variable count.
+        """
+        if objective == OBJECTIVE_CHANGES:
+            # Removing an installed package or installing a new one.
+            return [
+                -v if id in removable else v
+                for v, id in enumerate(ids, 1)
+            ], [], variables
+
+        # Each newer version of a package that is not installed costs one.
+        # Versions of a name are adjacent in ids and ordered oldest first,
+        # p[k] is true if any of the oldest k + 1 versions is installed.
+        lits, clauses = [], []
+        for _, group in itertools.groupby(
+                enumerate(ids, 1), key=lambda i: self.pallet.get(i[1]).name):
+            vs = [v for v, _ in group]
+            prev = None
+            for v in vs[:-1]:
+                variables += 1
+                clauses.append([-v, variables])
+                if prev is not None:
+                    clauses.append([-prev, variables])
+                lits.append(variables)
+                prev = variables
+        return lits, clauses, variables
+
+    def solve_best(self, installed: list[Spec], selected: list[Spec],
+                   objective: str = OBJECTIVE_CHANGES, timeout: float = None,
+                   prop_limit: int = None) -> \
+            Union[tuple[list[Spec], list[Spec]], None]:
+        """
+        Finds the solution with the lowest cost.
+
+        With objective="changes" the cost is the number of packages installed
+        or removed, with objective="newest" it is the number of newer
+        versions available for the installed packages.
+
+        Each solution found tightens the formula to require a cheaper one
+        until none exists. Returns an (install, remove) tuple like `solve`
+        or None if there is no solution.
+
+        timeout and prop_limit bound the search like for `solve`, the
+        BudgetExceeded raised carries the best solution found so far.
+        """
+        assert objective in OBJECTIVES, f'Invalid objective: {objective}'
+        budget = _Budget(timeout, prop_limit)
+        cnf, ids = self.encode(installed, selected)
+        removable = self._removable(installed)
+        lits, definitions, variables = self._costs(
+            objective, ids, removable, self.stats['variables'])
+        cnf.extend(definitions)
+
+        best, bound = None, []
+        self.stats['iterations'] = 0
+        while True:
+            self.stats['iterations'] += 1
+            try:
+                budget.check()
+                sol = budget.solve(cnf + bound, variables)
+
+            except BudgetExceeded as e:
+                if best is not None:
+                    e.best = self._decode(best, ids, removable)
+                raise
+
+            if sol is None:
+                break
+            best, assigned = sol, set(sol)
+            cost = sum(1 for lit in lits if lit in assigned)
+            self.stats['cost'] = cost
+            LOGGER.debug('Found solution with cost %i', cost)
+            if cost == 0:
+                break
+            bound = _at_most(lits, cost - 1, variables)
+
+        if best is None:
+            return None
+        return self._decode(best, ids, removable)
+
+    def solve(self, installed: list[Spec], selected: list[Spec],
+              max_solutions: int = None, timeout: float = None,
+              prop_limit: int = None) -> \
             Generator[tuple[list[Spec], list[Spec]], None, None]:
         """
         Solves package installation dependencies.
@@ -80,24 +541,17 @@ class Solver:
 
         Where isntall is a list of specs to install, and remove is a list of
         specs to remove.
+
+        The work can be bounded: at most max_solutions are generated, and
+        BudgetExceeded is raised once timeout seconds have passed or a
+        single solver call needs more than prop_limit propagations. The
+        timeout is checked between solver calls, use prop_limit to bound
+        each call.
         """
-        cnf = itertools.chain(
-            self._packages_cnf(),
-            self._installed_cnf(installed),
-            self._selected_cnf(selected)
-        )
-        ids = []
-        for i in installed:
-            ids.extend([id for id, _ in self.pallet.search(i)])
-        cnf = self._debug(cnf)
-        for sol in pycosat.itersolve(cnf):
-            self._print_exp(sol, pre='Solv ')
-            yield (
-                [
-                    self.pallet.get(id) for id in sol if id > 0
-                ],
-                [
-                    self.pallet.get(abs(id))
-                    for id in sol if id < 0 and abs(id) in ids
-                ],
-            )
+        budget = _Budget(timeout, prop_limit)
+        cnf, ids = self.encode(installed, selected)
+        budget.check()
+        removable = self._removable(installed)
+        sols = budget.itersolve(cnf, self.stats['variables'])
+        for sol in itertools.islice(sols, max_solutions):
+            yield self._decode(sol, ids, removable)
@@ -1,11 +1,13 @@
+from functools import lru_cache
 from typing import Union
 from uuid import uuid4
 
 from . import parse_version, Version
 
 
-def _split_spec(spec: str) -> list[str]:
-    for oper in ('==', '<=', '>=', '=', '>', '<'):
+@lru_cache(maxsize=4096)
+def _split_spec(spec: str) -> tuple[str, str, Version]:
+    for oper in ('==', '!=', '<=', '>=', '=', '>', '<'):
         if oper in spec:
             spec, _, vers = spec.rpartition(oper)
             # NOTE: we allow = or ==, but convert to ==.
@@ -16,10 +18,12 @@ def _split_spec(spec: str) -> list[str]:
 
 
 class Spec:
+    __slots__ = ('name', 'oper', '_version', '_uuid')
+
     def __init__(self, name: str, version: str, oper: str = None,
                  uuid: str = None):
         self._version = None
-        self.uuid = uuid or str(uuid4())
+        self._uuid = uuid
         self.name = name
         self.version = version
         self.oper = oper
@@ -36,8 +40,13 @@ class Spec:
         return str(self)
 
     def __eq__(self, other: 'Spec') -> bool:
+        if not isinstance(other, Spec):
+            return NotImplemented
         return self.name == other.name and self.oper == other.oper and \
-               self.version == other.oper
+            self.version == other.version
+
+    def __hash__(self) -> int:
+        return hash((self.name, self.oper, self.version))
 
     def __lt__(self, other: 'Spec') -> bool:
         assert self.oper == other.oper == '==', \
@@ -69,9 +78,23 @@ class Spec:
 
     @staticmethod
     def parse(spec: str) -> 'Spec':
+        # Parsing is cached, but each call returns a new Spec as they are
+        # mutable.
         name, oper, version = _split_spec(spec)
         return Spec(name, version, oper=oper)
 
+    @property
+    def uuid(self) -> str:
+        # Generated on first use, most specs (queries, requires) never need
+        # one.
+        if self._uuid is None:
+            self._uuid = str(uuid4())
+        return self._uuid
+
+    @uuid.setter
+    def uuid(self, value: str):
+        self._uuid = value
+
     @property
     def version(self) -> Version:
         return self._version
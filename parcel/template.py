@@ -0,0 +1,64 @@
+"""
+Variable substitution in service definitions and config files.
+
+${NAME} is replaced by the value of the option or setting NAME, and $$ by a
+single $. Variables that are neither are left as they are, for docker or
+the service to substitute.
+
+A file is compiled once into a plan, the literal runs between variables,
+then rendered against values by writing each run and value to the output
+in turn. Rendering does not search the file again, nor build it in memory,
+so regenerating every file when an option changes is cheap.
+"""
+
+import re
+from typing import Any, BinaryIO
+
+
+# A name is anything up to the closing brace, settings have dots and
+# dashes, e.g. ${other-service.OTHER_SETTING}.
+_PATTERN = re.compile(rb'\$(?:\{([^${}\s]+)\}|\$)')
+
+
+def encode_value(value: Any) -> bytes:
+    "Returns how a value is written, booleans as in YAML and JSON."
+    if isinstance(value, bool):
+        return b'true' if value else b'false'
+    if value is None:
+        return b''
+    return str(value).encode('utf8')
+
+
+class Template:
+    """
+    A compiled file. Its plan is a list of (literal, name, text) where name
+    is the variable written after literal, None at the end and for $$, and
+    text is what is written when it has no value.
+    """
+
+    __slots__ = ('plan', 'names')
+
+    def __init__(self, data: bytes):
+        view, plan, start = memoryview(data), [], 0
+        for match in _PATTERN.finditer(data):
+            name = match.group(1)
+            if name is None:
+                # $$, keep the first $.
+                plan.append((view[start:match.start() + 1], None, None))
+            else:
+                plan.append((view[start:match.start()], name.decode('utf8'),
+                             match.group(0)))
+            start = match.end()
+        plan.append((view[start:], None, None))
+        self.plan = plan
+        self.names = frozenset(name for _, name, _ in plan if name)
+
+    def render(self, values: dict[str, bytes], f: BinaryIO):
+        "Writes the file to f, values are by name, see encode_value()."
+        write = f.write
+        for literal, name, text in self.plan:
+            if literal:
+                write(literal)
+            if name is not None:
+                value = values.get(name)
+                write(text if value is None else value)
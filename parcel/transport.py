@@ -0,0 +1,390 @@
+"""
+Transports to remote repositories.
+
+A transport reads the index and parcels of a repository, see
+repository.Repository, and uploads parcels to it. It is either a plain
+directory or an HTTP server serving one, that accepts PUT to upload.
+
+HTTP connections are kept alive and pooled, so fetching many parcels does
+not reconnect for each. Downloads are written to a .part file and resumed
+from it with a Range request, then checked against the digest of the index
+before being renamed into place. fetch_all() downloads the parcels of an
+install plan concurrently.
+
+The index is not signed, a mirror serving a changed parcel can change its
+digest too. Pass verify_entry() as the check of fetch_all() to verify the
+signature of each parcel, by a key trusted for its author given a keyring,
+before it is renamed into place.
+"""
+
+import abc
+import http.client
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from os.path import basename, join as pathjoin
+from typing import BinaryIO, Callable, Iterable
+from urllib.parse import quote, urlsplit
+
+from nacl.exceptions import BadSignatureError
+
+from .keyring import Keyring
+from .repository import INDEX_NAME, INDEX_VERSION
+from .spec import Spec
+from .utils import chmod_default, file_digest
+
+
+PART_SUFFIX = '.part'
+_CHUNK_SIZE = 1024 * 1024
+
+
+class TransportError(Exception):
+    "A request failed."
+
+
+def _check_name(name: str):
+    # Names come from remote indexes, they must stay in the repository.
+    assert name and basename(name) == name and name not in ('.', '..'), \
+        f'Invalid file name: {name}'
+
+
+class Transport(abc.ABC):
+    "Reads and writes the files of a repository."
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    @abc.abstractmethod
+    def get(self, name: str, f: BinaryIO, offset: int = 0):
+        """
+        Writes file name to f from offset on, f is positioned at offset.
+        When the transport can not resume, f is truncated and all of the file
+        is written.
+        """
+
+    @abc.abstractmethod
+    def put(self, name: str, f: BinaryIO):
+        "Writes f as file name."
+
+    def index(self) -> dict[str, dict]:
+        "Returns the index entries by file name."
+        with tempfile.TemporaryFile() as f:
+            self.get(INDEX_NAME, f)
+            f.seek(0)
+            index = json.load(f)
+        assert index.get('version') == INDEX_VERSION, \
+            f'Unsupported index version: {index.get("version")}'
+        return index['parcels']
+
+
+class DirectoryTransport(Transport):
+    "A repository directory."
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __repr__(self):
+        return f'<DirectoryTransport: {self.path}>'
+
+    def get(self, name: str, f: BinaryIO, offset: int = 0):
+        _check_name(name)
+        try:
+            with open(pathjoin(self.path, name), 'rb') as src:
+                src.seek(offset)
+                shutil.copyfileobj(src, f, _CHUNK_SIZE)
+
+        except FileNotFoundError:
+            raise TransportError(f'{name} does not exist in {self.path}')
+
+    def put(self, name: str, f: BinaryIO):
+        _check_name(name)
+        fd, tmp = tempfile.mkstemp(prefix='.', dir=self.path)
+        try:
+            # Served by whoever serves the repository.
+            chmod_default(fd)
+            with os.fdopen(fd, 'wb') as dst:
+                shutil.copyfileobj(f, dst, _CHUNK_SIZE)
+            os.replace(tmp, pathjoin(self.path, name))
+
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+class HTTPTransport(Transport):
+    """
+    A repository served over HTTP(S), with at most connections open. They
+    are kept alive and shared between threads.
+    """
+
+    def __init__(self, url: str, connections: int = 4, timeout: float = 60):
+        assert connections > 0, f'Invalid connections: {connections}'
+        parts = urlsplit(url)
+        assert parts.scheme in ('http', 'https'), f'Invalid URL: {url}'
+        self.url = url
+        self.timeout = timeout
+        self._scheme = parts.scheme
+        self._host = parts.netloc
+        self._path = parts.path.rstrip('/') + '/'
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(connections)
+
+    def __repr__(self):
+        return f'<HTTPTransport: {self.url}>'
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self._scheme == 'https':
+            return http.client.HTTPSConnection(
+                self._host, timeout=self.timeout)
+        return http.client.HTTPConnection(self._host, timeout=self.timeout)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+
+            except queue.Empty:
+                break
+
+    @contextmanager
+    def _request(self, method: str, name: str, body: BinaryIO = None,
+                 headers: dict = None):
+        "Yields the response, the connection is pooled once it was read."
+        _check_name(name)
+        path = self._path + quote(name)
+        with self._slots:
+            for attempt in range(2):
+                try:
+                    if attempt:
+                        raise queue.Empty()
+                    conn, reused = self._idle.get_nowait(), True
+
+                except queue.Empty:
+                    conn, reused = self._connect(), False
+
+                try:
+                    if body is not None:
+                        body.seek(0)
+                    conn.request(method, path, body, headers or {})
+                    response = conn.getresponse()
+
+                except (http.client.RemoteDisconnected, ConnectionError):
+                    conn.close()
+                    # The server closed an idle connection, use a new one.
+                    if reused:
+                        continue
+                    raise
+
+                except BaseException:
+                    conn.close()
+                    raise
+
+                break
+
+            try:
+                yield response
+                # The rest must be read to send the next request.
+                response.read()
+
+            except BaseException:
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def _error(self, method: str, name: str,
+               response: http.client.HTTPResponse) -> TransportError:
+        return TransportError(
+            f'{method} {self.url.rstrip("/")}/{name}: '
+            f'{response.status} {response.reason}')
+
+    def get(self, name: str, f: BinaryIO, offset: int = 0):
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        with self._request('GET', name, headers=headers) as response:
+            if response.status == 206:
+                content_range = response.getheader('Content-Range', '')
+                if not content_range.startswith(f'bytes {offset}-'):
+                    raise TransportError(
+                        f'Unexpected Content-Range: {content_range}')
+
+            elif response.status == 200:
+                # The server ignored the Range, start again.
+                f.seek(0)
+                f.truncate()
+
+            elif response.status == 416 and offset:
+                # Nothing past offset, the digest tells if it is complete.
+                return
+
+            else:
+                raise self._error('GET', name, response)
+
+            while chunk := response.read(_CHUNK_SIZE):
+                f.write(chunk)
+
+    def put(self, name: str, f: BinaryIO):
+        size = f.seek(0, os.SEEK_END)
+        headers = {
+            'Content-Length': str(size),
+            'Content-Type': 'application/octet-stream',
+        }
+        with self._request('PUT', name, f, headers) as response:
+            if response.status not in (200, 201, 204):
+                raise self._error('PUT', name, response)
+
+
+def open_transport(url: str, connections: int = 4) -> Transport:
+    "Returns the transport of an http(s) or file URL, or of a directory."
+    parts = urlsplit(url)
+    if parts.scheme in ('http', 'https'):
+        return HTTPTransport(url, connections)
+    if parts.scheme == 'file':
+        return DirectoryTransport(parts.path)
+    return DirectoryTransport(url)
+
+
+def verify_entry(path: str, entry: dict, keyring: Keyring = None):
+    """
+    Verifies the parcel at path and that it is the one of its index entry.
+    Given a keyring, it must be signed by a key trusted for its author.
+    Raises nacl.exceptions.BadSignatureError otherwise.
+    """
+    from .parcel import Parcel
+
+    parcel = Parcel.load_parcel(path, lazy=True, keyring=keyring)
+    if (parcel.name, str(parcel.version), parcel.uuid) != \
+       (entry.get('name'), entry.get('version'), entry.get('uuid')):
+        raise BadSignatureError(
+            f'{parcel} is not the parcel of its index entry')
+
+
+def download(transport: Transport, name: str, path: str,
+             digest: str = None,
+             check: Callable[[str], None] = None) -> str:
+    """
+    Downloads file name to path and checks its SHA-512 against digest, if
+    given. An interrupted download is resumed from path + ".part". Nothing
+    is downloaded if path already matches digest. Returns path.
+
+    check is called with the path of the file before it is renamed into
+    place, and raises if it must not be, see verify_entry().
+    """
+    _check_name(name)
+    if digest is not None and os.path.isfile(path) and \
+       file_digest(path) == digest:
+        if check is not None:
+            check(path)
+        return path
+
+    part = path + PART_SUFFIX
+    with open(part, 'ab+') as f:
+        offset = f.tell()
+        while True:
+            f.seek(offset)
+            f.truncate()
+            transport.get(name, f, offset)
+            f.seek(0)
+            if digest is None or file_digest(f) == digest:
+                break
+            if offset:
+                # What was resumed may be of an older file.
+                offset = 0
+                continue
+            f.close()
+            os.remove(part)
+            raise BadSignatureError(f'{name} does not match its digest')
+
+    if check is not None:
+        try:
+            check(part)
+
+        except BaseException:
+            os.remove(part)
+            raise
+
+    os.replace(part, path)
+    return path
+
+
+def plan(entries: dict[str, dict], specs: Iterable[Spec]) -> \
+        list[tuple[str, dict]]:
+    """
+    Returns the (file name, entry) of the index entries of specs, the
+    install list of a solution.
+    """
+    files = {
+        (entry['name'], entry['version'], entry['uuid']): (name, entry)
+        for name, entry in entries.items()
+    }
+    found = []
+    for spec in specs:
+        key = (spec.name, str(spec.version), spec.uuid)
+        assert key in files, f'{spec} is not in the index'
+        found.append(files[key])
+    return found
+
+
+def fetch_all(transport: Transport, files: Iterable[tuple[str, dict]],
+              directory: str, workers: int = 4,
+              check: Callable[[str, dict], None] = None) -> list[str]:
+    """
+    Downloads (file name, entry) files, see plan(), to directory on workers
+    threads. Returns their paths, in order. On failure the downloads not
+    started are cancelled and the error is raised.
+
+    check is called with the path and entry of each file before it is
+    renamed into place, e.g. verify_entry().
+    """
+    files = list(files)
+    for name, _ in files:
+        _check_name(name)
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(
+                download, transport, name, pathjoin(directory, name),
+                entry.get('digest'),
+                None if check is None else partial(check, entry=entry))
+            for name, entry in files
+        ]
+        try:
+            return [future.result() for future in futures]
+
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def upload_all(transport: Transport, paths: Iterable[str],
+               workers: int = 4):
+    "Uploads the files at paths, by their base name, on workers threads."
+
+    def upload(path: str):
+        with open(path, 'rb') as f:
+            transport.put(basename(path), f)
+
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(upload, path) for path in paths]
+        try:
+            for future in futures:
+                future.result()
+
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
@@ -1,9 +1,33 @@
-import time
+import hashlib
+import os
+import shutil
 import tarfile
-from typing import Union, TextIO
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import Union, TextIO, BinaryIO
 from contextlib import contextmanager
 
-from . import parse_version
+
+# Values larger than this are kept in temporary files rather than memory.
+SPILL_SIZE = 4 * 1024 * 1024
+
+
+def _umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Read once, setting it to read it is process wide.
+_UMASK = _umask()
+
+
+def chmod_default(fd: int):
+    """
+    Gives a file the mode open() would have, tempfile.mkstemp() creates
+    them readable by their owner only.
+    """
+    os.fchmod(fd, 0o666 & ~_UMASK)
 
 
 @contextmanager
@@ -18,16 +42,68 @@ def path_or_file(path: Union[str, TextIO], mode: str = 'rb'):
             f.close()
 
 
+def spool(fileobj: BinaryIO, size: int = None) -> BinaryIO:
+    """
+    Copies fileobj into a BytesIO, or a temporary file if it is larger than
+    SPILL_SIZE or of unknown size.
+    """
+    if size is not None and size <= SPILL_SIZE:
+        return BytesIO(fileobj.read())
+    spooled = SpooledTemporaryFile(max_size=SPILL_SIZE)
+    shutil.copyfileobj(fileobj, spooled)
+    spooled.seek(0)
+    return spooled
+
+
+def file_digest(path: Union[str, BinaryIO]) -> str:
+    "Returns the hex SHA-512 of a file, a file object is left where it was."
+    hash = hashlib.sha512()
+    with path_or_file(path) as f:
+        position = f.tell()
+        while chunk := f.read(1024 * 1024):
+            hash.update(chunk)
+        f.seek(position)
+    return hash.hexdigest()
+
+
+def build_mtime() -> int:
+    """
+    Returns the timestamp of archive members, SOURCE_DATE_EPOCH if set. It
+    is fixed so that the same inputs build the same archive.
+    """
+    return int(os.environ.get('SOURCE_DATE_EPOCH', 0))
+
+
 def add_tar_file(tf, name, fileobj, mtime=None):
     if mtime is None:
-        mtime = time.time()
+        mtime = build_mtime()
     tinfo = tarfile.TarInfo(name)
     tinfo.type = tarfile.REGTYPE
     tinfo.mtime = mtime
-    tinfo.size = fileobj.getbuffer().nbytes
+    # Normalized, nothing of the build host ends up in the archive.
+    tinfo.mode = 0o644
+    tinfo.uid = tinfo.gid = 0
+    tinfo.uname = tinfo.gname = ''
+    # NOTE: mmap.seek() does not return the position.
+    fileobj.seek(0, os.SEEK_END)
+    tinfo.size = fileobj.tell()
     fileobj.seek(0)
     tf.addfile(tinfo, fileobj=fileobj)
 
 
+def _find_tar_file(tf, name):
+    # Scan instead of tf.getmember(name), which reads every header first.
+    # On a stream that means decompressing the whole archive.
+    for tinfo in tf:
+        if tinfo.name == name:
+            return tinfo
+    raise KeyError(f'filename {name!r} not found')
+
+
 def read_tar_file(tf, name):
-    return tf.extractfile(name).read()
+    return tf.extractfile(_find_tar_file(tf, name)).read()
+
+
+def spool_tar_file(tf, name):
+    tinfo = _find_tar_file(tf, name)
+    return spool(tf.extractfile(tinfo), tinfo.size)
@@ -0,0 +1,207 @@
+"""
+Lightweight PEP 440 versions.
+
+Orders and normalizes versions the same way as packaging.version, without
+the import cost of pkg_resources.
+
+Strings that are not PEP 440 versions, e.g. "latest" or "1.0-foo", parse
+as a LegacyVersion like pkg_resources.parse_version() did. They sort
+before every PEP 440 version, and among themselves as setuptools did.
+"""
+
+import re
+from functools import lru_cache
+
+
+_PATTERN = re.compile(r'''
+    ^\s*v?
+    (?:(?P<epoch>[0-9]+)!)?
+    (?P<release>[0-9]+(?:\.[0-9]+)*)
+    (?:[-_.]?(?P<pre_l>alpha|beta|preview|pre|rc|a|b|c)[-_.]?
+        (?P<pre_n>[0-9]+)?)?
+    (?:-(?P<post_n1>[0-9]+)|[-_.]?(?P<post_l>post|rev|r)[-_.]?
+        (?P<post_n2>[0-9]+)?)?
+    (?:[-_.]?(?P<dev_l>dev)[-_.]?(?P<dev_n>[0-9]+)?)?
+    (?:\+(?P<local>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?
+    \s*$
+''', re.VERBOSE | re.IGNORECASE)
+
+_PRE_LABELS = {
+    'a': 'a', 'alpha': 'a', 'b': 'b', 'beta': 'b', 'c': 'rc', 'rc': 'rc',
+    'pre': 'rc', 'preview': 'rc',
+}
+
+_LEGACY_PART = re.compile(r'(\d+|[a-z]+|\.|-)')
+_LEGACY_REPLACE = {
+    'pre': 'c', 'preview': 'c', '-': 'final-', 'rc': 'c', 'dev': '@',
+}
+
+# Stand-ins for packaging's -Infinity / Infinity in sort keys.
+_LOW, _HIGH = (-1, '', 0), (1, '', 0)
+
+
+class InvalidVersion(ValueError):
+    pass
+
+
+class Version:
+    __slots__ = ('epoch', 'release', 'pre', 'post', 'dev', 'local', '_key')
+
+    def __init__(self, version: str):
+        match = _PATTERN.match(version)
+        if not match:
+            raise InvalidVersion(f'Invalid version: {version!r}')
+
+        self.epoch = int(match['epoch'] or 0)
+        self.release = tuple(int(i) for i in match['release'].split('.'))
+        self.pre = None
+        if match['pre_l']:
+            self.pre = (_PRE_LABELS[match['pre_l'].lower()],
+                        int(match['pre_n'] or 0))
+        self.post = None
+        if match['post_n1'] or match['post_l']:
+            self.post = int(match['post_n1'] or match['post_n2'] or 0)
+        self.dev = None
+        if match['dev_l']:
+            self.dev = int(match['dev_n'] or 0)
+        self.local = None
+        if match['local']:
+            self.local = tuple(
+                int(part) if part.isdigit() else part.lower()
+                for part in re.split(r'[-_.]', match['local'])
+            )
+        self._key = self._cmpkey()
+
+    def _cmpkey(self) -> tuple:
+        release = list(self.release)
+        while len(release) > 1 and release[-1] == 0:
+            release.pop()
+
+        if self.pre is None and self.post is None and self.dev is not None:
+            # 1.0.dev0 sorts before 1.0a0.
+            pre = _LOW
+        elif self.pre is None:
+            pre = _HIGH
+        else:
+            pre = (0,) + self.pre
+        post = (-1, 0) if self.post is None else (0, self.post)
+        dev = (1, 0) if self.dev is None else (0, self.dev)
+        # Numeric local segments sort after alphanumeric ones.
+        local = () if self.local is None else tuple(
+            (1, part, '') if isinstance(part, int) else (0, 0, part)
+            for part in self.local
+        )
+        return (self.epoch, tuple(release), pre, post, dev, local)
+
+    def __str__(self) -> str:
+        parts = []
+        if self.epoch:
+            parts.append(f'{self.epoch}!')
+        parts.append('.'.join(map(str, self.release)))
+        if self.pre is not None:
+            parts.append(f'{self.pre[0]}{self.pre[1]}')
+        if self.post is not None:
+            parts.append(f'.post{self.post}')
+        if self.dev is not None:
+            parts.append(f'.dev{self.dev}')
+        if self.local is not None:
+            parts.append('+' + '.'.join(map(str, self.local)))
+        return ''.join(parts)
+
+    def __repr__(self) -> str:
+        return f"<Version('{self}')>"
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __eq__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key == other._key
+
+    def __ne__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key != other._key
+
+    def __lt__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key < other._key
+
+    def __le__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key <= other._key
+
+    def __gt__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key > other._key
+
+    def __ge__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key >= other._key
+
+    @property
+    def is_prerelease(self) -> bool:
+        return self.pre is not None or self.dev is not None
+
+
+def _legacy_parts(version: str):
+    for part in _LEGACY_PART.split(version.lower()):
+        part = _LEGACY_REPLACE.get(part, part)
+        if not part or part == '.':
+            continue
+        if part[:1] in '0123456789':
+            # Pad numbers so they sort numerically as strings.
+            yield part.zfill(8)
+        else:
+            yield '*' + part
+    yield '*final'
+
+
+class LegacyVersion(Version):
+    "A version that is not PEP 440, kept as it was written."
+
+    __slots__ = ('_version',)
+
+    def __init__(self, version: str):
+        self._version = version
+        self.epoch = -1
+        self.release = ()
+        self.pre = self.post = self.dev = self.local = None
+        parts = []
+        for part in _legacy_parts(version):
+            if part.startswith('*'):
+                # Pre-release labels sort before the final release.
+                if part < '*final':
+                    while parts and parts[-1] == '*final-':
+                        parts.pop()
+                while parts and parts[-1] == '00000000':
+                    parts.pop()
+            parts.append(part)
+        # Epoch -1 sorts before every PEP 440 version.
+        self._key = (-1, tuple(parts))
+
+    def __str__(self) -> str:
+        return self._version
+
+    def __repr__(self) -> str:
+        return f"<LegacyVersion('{self}')>"
+
+    @property
+    def is_prerelease(self) -> bool:
+        return False
+
+
+# Versions are immutable, the same strings are parsed over and over.
+@lru_cache(maxsize=4096)
+def parse_version(version: str) -> Version:
+    "Returns the Version of a string, a LegacyVersion if it is not PEP 440."
+    try:
+        return Version(version)
+
+    except InvalidVersion:
+        return LegacyVersion(version)
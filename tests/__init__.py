@@ -1,4 +1,18 @@
 from .test_create import *
 from .test_load import *
 from .test_spec import *
+from .test_version import *
+from .test_pallet import *
 from .test_solver import *
+from .test_compression import *
+from .test_keyring import *
+from .test_repository import *
+from .test_catalogue import *
+from .test_cache import *
+from .test_audit import *
+from .test_build import *
+from .test_transport import *
+from .test_delta import *
+from .test_chunks import *
+from .test_aio import *
+from .test_template import *
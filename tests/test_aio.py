@@ -0,0 +1,175 @@
+import asyncio
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import Mock
+from os.path import join as pathjoin
+
+from parcel import aio
+from parcel.attrs import File
+from parcel.parcel import Parcel
+from parcel.repository import Repository
+from parcel.keyring import Keyring, UntrustedKey
+from parcel.transport import (
+    DirectoryTransport, TransportError, PART_SUFFIX, verify_entry,
+)
+
+
+class _BlockingFile(BytesIO):
+    "Blocks its first read until released."
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.reads = 0
+
+    def read(self, *args) -> bytes:
+        self.reads += 1
+        if not self.started.is_set():
+            self.started.set()
+            self.release.wait()
+        return super().read(*args)
+
+
+class AioTestCase(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.executor = ThreadPoolExecutor(1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.tmp.cleanup()
+
+    async def _drain(self):
+        "Waits for the executor to finish what it was running."
+        await asyncio.get_running_loop().run_in_executor(
+            self.executor, lambda: None)
+
+    async def test_round_trip(self):
+        parcel = Parcel(name='foo', version='1.0')
+        path = pathjoin(self.tmp.name, 'foo-1.0.pcl')
+        await parcel.asave_parcel(path)
+        loaded = await Parcel.aload_parcel(path, lazy=True)
+        self.assertEqual(parcel.uuid, loaded.uuid)
+        result = await aio.check_parcel(path)
+        self.assertTrue(result['ok'])
+
+    async def test_cancel_load(self):
+        parcel = Parcel(name='foo', version='1.0')
+        bio = BytesIO()
+        parcel.save_parcel(bio)
+        f = _BlockingFile(bio.getvalue())
+
+        task = asyncio.ensure_future(
+            aio.load_parcel(f, executor=self.executor))
+        await asyncio.get_running_loop().run_in_executor(None, f.started.wait)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        f.release.set()
+        await self._drain()
+        # Stopped at the next read.
+        self.assertEqual(1, f.reads)
+
+    async def test_cancel_save(self):
+        parcel = Parcel(name='foo', version='1.0')
+        value = _BlockingFile(b'x' * 1024)
+        parcel.add_file(File('foo.cfg', value=value))
+        path = pathjoin(self.tmp.name, 'foo-1.0.pcl')
+
+        task = asyncio.ensure_future(
+            parcel.asave_parcel(path, executor=self.executor))
+        await asyncio.get_running_loop().run_in_executor(
+            None, value.started.wait)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        value.release.set()
+        await self._drain()
+        self.assertFalse(os.path.exists(path))
+
+
+class AsyncRepositoryTestCase(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathjoin(self.tmp.name, 'repo')
+        self.dest = pathjoin(self.tmp.name, 'dest')
+        os.makedirs(self.root)
+        os.makedirs(self.dest)
+        for name in ('foo', 'bar'):
+            parcel = Parcel(name=name, version='1.0')
+            parcel.author = f'{name}@example.com'
+            parcel.save_parcel(pathjoin(self.root, f'{name}-1.0.pcl'))
+        Repository(self.root).update()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def test_fetch(self):
+        async with aio.AsyncRepository(self.root) as repository:
+            entries = await repository.index()
+            paths = await repository.fetch_all(entries.items(), self.dest)
+            self.assertEqual(['bar-1.0.pcl', 'foo-1.0.pcl'],
+                             sorted(os.path.basename(p) for p in paths))
+            parcel = await repository.load_parcel(
+                'foo-1.0.pcl', self.dest, entries['foo-1.0.pcl']['digest'])
+            self.assertEqual('foo', parcel.name)
+
+    async def test_fetch_missing(self):
+        async with aio.AsyncRepository(self.root) as repository:
+            entries = dict(await repository.index())
+            entries['missing.pcl'] = {}
+            with self.assertRaises(TransportError):
+                await repository.fetch_all(entries.items(), self.dest)
+
+    async def test_fetch_untrusted(self):
+        # Replaced by one signed with another key, and indexed again.
+        path = pathjoin(self.root, 'foo-1.0.pcl')
+        parcel = Parcel.load_parcel(path)
+        keyring = Keyring()
+        keyring.add('foo@example.com', parcel.pubkey)
+        parcel.save_parcel(path, overwrite=True)
+        Repository(self.root).update()
+
+        async with aio.AsyncRepository(self.root) as repository:
+            entries = await repository.index()
+            with self.assertRaises(UntrustedKey):
+                await repository.fetch_all(
+                    entries.items(), self.dest,
+                    check=partial(verify_entry, keyring=keyring))
+        self.assertNotIn('foo-1.0.pcl', os.listdir(self.dest))
+        self.assertFalse(any(name.endswith(PART_SUFFIX)
+                             for name in os.listdir(self.dest)))
+
+    async def test_upload(self):
+        path = pathjoin(self.dest, 'baz-1.0.pcl')
+        Parcel(name='baz', version='1.0').save_parcel(path)
+        async with aio.AsyncRepository(DirectoryTransport(self.root)) \
+                as repository:
+            await repository.upload(path)
+        self.assertTrue(os.path.exists(pathjoin(self.root, 'baz-1.0.pcl')))
+
+
+class CancellableTransportTestCase(TestCase):
+    def test_forwards(self):
+        transport = Mock(spec=DirectoryTransport)
+        cancelled = threading.Event()
+        wrapper = aio._CancellableTransport(transport, cancelled)
+        self.assertIs(transport.index.return_value, wrapper.index())
+        wrapper.put('foo-1.0.pcl', BytesIO(b'foo'))
+        wrapper.get('foo-1.0.pcl', BytesIO())
+        wrapper.close()
+        transport.close.assert_called_once_with()
+
+        # Transfers stop once cancelled.
+        cancelled.set()
+        for call in (transport.put.call_args, transport.get.call_args):
+            name, f = call.args[:2]
+            self.assertEqual('foo-1.0.pcl', name)
+            with self.assertRaises(asyncio.CancelledError):
+                f.read()
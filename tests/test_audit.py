@@ -0,0 +1,74 @@
+import os
+import tempfile
+from unittest import TestCase
+from os.path import join as pathjoin, dirname
+
+from parcel.audit import check_parcels, find_parcels, summarize
+from parcel.parcel import Parcel
+
+
+EXAMPLE_PCL = pathjoin(dirname(__file__), 'example.pcl')
+
+
+class AuditTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+        os.makedirs(pathjoin(self.path, 'sub'))
+        with open(EXAMPLE_PCL, 'rb') as f:
+            data = f.read()
+        with open(pathjoin(self.path, 'example.pcl'), 'wb') as f:
+            f.write(data)
+        # Valid, but without a service definition.
+        Parcel(name='bare', version='1.0').save_parcel(
+            pathjoin(self.path, 'sub', 'bare.pcl'))
+        with open(pathjoin(self.path, 'sub', 'broken.pcl'), 'wb') as f:
+            f.write(data[:len(data) // 2])
+        with open(pathjoin(self.path, 'sub', 'other.txt'), 'wb') as f:
+            f.write(b'not a parcel')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_find_parcels(self):
+        expected = [
+            pathjoin(self.path, 'example.pcl'),
+            pathjoin(self.path, 'sub', 'bare.pcl'),
+            pathjoin(self.path, 'sub', 'broken.pcl'),
+        ]
+        self.assertEqual(expected, find_parcels([self.path]))
+        self.assertEqual(
+            expected[1:], find_parcels([pathjoin(self.path, '*', '*.pcl')]))
+        self.assertEqual(
+            expected,
+            find_parcels([self.path, pathjoin(self.path, '**', '*.pcl')]))
+
+    def _results(self, lint, workers):
+        results = list(check_parcels(
+            [self.path], lint=lint, workers=workers))
+        return {
+            os.path.basename(r['path']): (r['ok'], r['stage'])
+            for r in results
+        }, summarize(results)
+
+    def test_verify(self):
+        for workers in (1, 2):
+            results, summary = self._results(False, workers)
+            self.assertEqual({
+                'example.pcl': (True, None),
+                'bare.pcl': (True, None),
+                'broken.pcl': (False, 'verify'),
+            }, results)
+            self.assertEqual((3, 2, 1), (
+                summary['total'], summary['ok'], summary['failed']))
+
+    def test_lint(self):
+        results, summary = self._results(True, 2)
+        self.assertEqual({
+            'example.pcl': (True, None),
+            'bare.pcl': (False, 'lint'),
+            'broken.pcl': (False, 'verify'),
+        }, results)
+        failure = next(
+            f for f in summary['failures'] if f['stage'] == 'lint')
+        self.assertIn('No service definition', failure['error'])
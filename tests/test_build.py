@@ -0,0 +1,135 @@
+import json
+import os
+import tempfile
+from io import BytesIO
+from unittest import TestCase
+from unittest.mock import patch
+from os.path import join as pathjoin, dirname
+
+from nacl.signing import SigningKey
+from parameterized import parameterized
+
+from parcel import archive
+from parcel.__main__ import main
+from parcel.build import BuildCache
+from parcel.compression import Compression
+from parcel.parcel import Parcel
+
+
+EXAMPLE_YML = pathjoin(dirname(__file__), 'example.yml')
+EXAMPLE_CFG = pathjoin(dirname(__file__), 'example.cfg')
+
+
+class ReproducibleBuildTestCase(TestCase):
+    def setUp(self):
+        self.key = SigningKey.generate()
+        self.parcel = Parcel(name='example', version='1.0.8',
+                             service_definition=EXAMPLE_YML)
+        self.parcel.add_file(EXAMPLE_CFG)
+
+    def _save(self, **kwargs) -> bytes:
+        bio = BytesIO()
+        self.parcel.save_parcel(bio, key=self.key, **kwargs)
+        return bio.getvalue()
+
+    @parameterized.expand([(format,) for format in archive.FORMATS])
+    def test_same_bytes(self, format):
+        self.assertEqual(self._save(format=format), self._save(format=format))
+
+    def test_parallel_gzip(self):
+        compression = Compression(threads=2)
+        self.assertEqual(self._save(compression=compression),
+                         self._save(compression=compression))
+
+    def test_source_date_epoch(self):
+        with patch.dict(os.environ, {'SOURCE_DATE_EPOCH': '1700000000'}):
+            data = self._save()
+            self.assertEqual(data, self._save())
+        self.assertNotEqual(data, self._save())
+
+        loaded = Parcel.load_parcel(BytesIO(data))
+        self.assertEqual(self.parcel.uuid, loaded.uuid)
+
+
+class BuildCacheTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = BuildCache(pathjoin(self.tmp.name, 'build'))
+        self.key = SigningKey.generate()
+        self.parcel = self._parcel('1.0.8')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _parcel(version):
+        parcel = Parcel(name='example', version=version,
+                        service_definition=EXAMPLE_YML,
+                        uuid='0f6d4b4e-1b8c-4e0c-9d43-3c5f2bb4c2a1')
+        parcel.add_file(EXAMPLE_CFG)
+        return parcel
+
+    def _save(self, **kwargs) -> bytes:
+        bio = BytesIO()
+        self.parcel.save_parcel(bio, key=self.key, build_cache=self.cache,
+                                **kwargs)
+        return bio.getvalue()
+
+    def test_hit(self):
+        data = self._save()
+        signature = self.parcel.signature
+        with patch.object(archive, 'sign') as sign:
+            self.assertEqual(data, self._save())
+            sign.assert_not_called()
+        self.assertEqual(signature, self.parcel.signature)
+        Parcel.load_parcel(BytesIO(data))
+
+    def test_changed(self):
+        self._save()
+        self.parcel = self._parcel('1.0.9')
+        with patch.object(archive, 'sign', wraps=archive.sign) as sign:
+            data = self._save()
+            sign.assert_called_once()
+        self.assertEqual('1.0.9',
+                         str(Parcel.load_parcel(BytesIO(data)).version))
+
+    def test_settings(self):
+        self._save()
+        with patch.object(archive, 'sign', wraps=archive.sign) as sign:
+            self._save(format=archive.FORMAT_INDEXED)
+            self._save(compression=Compression(level=1))
+            self.assertEqual(2, sign.call_count)
+
+    def test_overwrite(self):
+        path = pathjoin(self.tmp.name, 'example.pcl')
+        self.parcel.save_parcel(path, key=self.key, build_cache=self.cache)
+        with self.assertRaises(FileExistsError):
+            self.parcel.save_parcel(path, key=self.key,
+                                    build_cache=self.cache)
+
+    def test_evict(self):
+        data = self._save()
+        self.cache.max_size = len(data) + 1
+        self.parcel = self._parcel('1.0.9')
+        self._save()
+        self.assertEqual(2, len(os.listdir(self.cache.path)))
+
+    def test_manifest_without_uuid(self):
+        manifest = pathjoin(self.tmp.name, 'example.json')
+        with open(manifest, 'w') as f:
+            json.dump({'name': 'example', 'version': '1.0.8'}, f)
+        key = pathjoin(self.tmp.name, 'key')
+        with open(key, 'wb') as f:
+            f.write(self.key.encode())
+
+        path = pathjoin(self.tmp.name, 'example.pcl')
+        built = []
+        with patch('parcel.__main__.BUILD_CACHE_PATH', self.cache.path), \
+                patch.object(archive, 'sign', wraps=archive.sign) as sign:
+            for _ in range(2):
+                main(['parcel', 'build', manifest, '--key', key, '--force'])
+                with open(path, 'rb') as f:
+                    built.append(f.read())
+            sign.assert_called_once()
+        self.assertEqual(built[0], built[1])
+        self.assertIsNotNone(Parcel.load_parcel(path).uuid)
@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+from io import BytesIO
+from unittest import TestCase
+from unittest.mock import patch
+from os.path import join as pathjoin, dirname
+
+from nacl.exceptions import BadSignatureError
+
+from parcel.cache import ExtractionCache
+from parcel.parcel import Parcel
+
+
+EXAMPLE_YML = pathjoin(dirname(__file__), 'example.yml')
+EXAMPLE_CFG = pathjoin(dirname(__file__), 'example.cfg')
+
+
+class ExtractionCacheTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ExtractionCache(pathjoin(self.tmp.name, 'cache'))
+        self.parcel = Parcel(name='example', version='1.0.8',
+                             service_definition=EXAMPLE_YML)
+        self.parcel.add_file(EXAMPLE_CFG)
+        self.path = pathjoin(self.tmp.name, 'example.pcl')
+        self.parcel.save_parcel(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _load(self, path=None):
+        return Parcel.load_parcel(path or self.path, cache=self.cache)
+
+    def test_hit(self):
+        loaded = self._load()
+        self.assertEqual(1, len(os.listdir(self.cache.path)))
+
+        with patch.object(Parcel, '_load_parcel') as load:
+            cached = self._load()
+            load.assert_not_called()
+        self.assertEqual(self.parcel.uuid, cached.uuid)
+        self.assertEqual(loaded.pubkey, cached.pubkey)
+        self.assertEqual(loaded.signature, cached.signature)
+        self.assertEqual('example.yml', cached.service_definition)
+        self.assertFalse(any(f.loaded for f in cached.files))
+        self.assertEqual(
+            self.parcel.get_file('example.cfg').read(),
+            cached.get_file('example.cfg').read())
+
+    def test_not_verified(self):
+        Parcel.load_parcel(self.path, verify=False, cache=self.cache)
+        self.assertEqual(0, self.cache.size())
+
+    def test_changed_parcel(self):
+        self._load()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        # The same parcel signed again is another entry.
+        self.parcel.save_parcel(self.path, overwrite=True)
+        self._load()
+        self.assertEqual(2, len(os.listdir(self.cache.path)))
+        self.assertEqual(self.parcel.uuid, self._load(BytesIO(data)).uuid)
+
+    def test_integrity(self):
+        self._load()
+        digest = self.cache.digest(self.path)
+        entry = pathjoin(self.cache.path, digest)
+        with open(pathjoin(entry, 'meta.json')) as f:
+            names = [file['name'] for file in json.load(f)['files']]
+        name = str(names.index('example.cfg'))
+        with open(pathjoin(entry, name), 'r+b') as f:
+            f.write(b'#')
+
+        # Same size, caught when read.
+        with self.assertRaises(BadSignatureError):
+            self._load().get_file('example.cfg').read()
+
+        # Truncated, the entry is dropped and the parcel extracted again.
+        with open(pathjoin(entry, name), 'wb') as f:
+            f.write(b'')
+        self.assertEqual(
+            self.parcel.get_file('example.cfg').read(),
+            self._load().get_file('example.cfg').read())
+
+    def test_eviction(self):
+        self._load()
+        size = self.cache.size()
+        self.cache.max_size = size * 2
+        paths = []
+        for version in ('1.0.9', '1.1.0'):
+            self.parcel.version = version
+            paths.append(pathjoin(self.tmp.name, f'{version}.pcl'))
+            self.parcel.save_parcel(paths[-1])
+
+        self._load(paths[0])
+        # The first was used longest ago, so it is evicted.
+        os.utime(
+            pathjoin(self.cache.path, self.cache.digest(paths[0]),
+                     'meta.json'), (0, 0))
+        self._load()
+        self._load(paths[1])
+        self.assertLessEqual(self.cache.size(), size * 2)
+        self.assertEqual(
+            {self.cache.digest(self.path), self.cache.digest(paths[1])},
+            set(os.listdir(self.cache.path)))
+
+    def test_evicted_meanwhile(self):
+        self._load()
+        digest = self.cache.digest(self.path)
+        os_utime = os.utime
+
+        def utime(path, *args):
+            # Another process evicts the entry once it was read.
+            self.cache.evict(digest)
+            return os_utime(path, *args)
+
+        with patch('parcel.cache.os.utime', side_effect=utime):
+            self.assertIsNone(self.cache.get(digest))
+
+    def test_missing_file(self):
+        self._load()
+        digest = self.cache.digest(self.path)
+        os.remove(pathjoin(self.cache.path, digest, '0'))
+
+        # The damaged entry is dropped, and the parcel cached again.
+        self.assertIsNone(self.cache.get(digest))
+        self._load()
+        self.assertIsNotNone(self.cache.get(digest))
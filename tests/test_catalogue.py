@@ -0,0 +1,93 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock
+
+from parameterized import parameterized
+
+from parcel.catalogue import CataloguePallet, save_catalogue
+from parcel.manifest import Manifest
+from parcel.pallet import Pallet
+from parcel.solver import Solver
+from parcel.spec import Spec
+
+from .test_solver import ENCODINGS, PACKAGES, _catalogue, _solutions
+
+
+QUERIES = [
+    'app', 'app==2.0', 'app!=2.0', 'app>=2.5', 'app<3.0', 'app>1.0',
+    'app<=0.5', 'lib==2', 'lib!=9.0', 'tool>=4.0', 'missing', 'missing>1.0',
+]
+
+
+class CatalogueTestCase(TestCase):
+    def setUp(self):
+        self.pallet = Pallet()
+        for manifest in _catalogue(4) + PACKAGES:
+            self.pallet.add_spec(manifest)
+        # Same version spelled differently.
+        self.pallet.add_spec(Manifest({'name': 'lib', 'version': '2.0.0'}))
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        save_catalogue(self.pallet, self.path)
+        self.catalogue = CataloguePallet(self.path)
+
+    def tearDown(self):
+        self.catalogue.close()
+        os.remove(self.path)
+
+    def test_pallet(self):
+        self.assertEqual(len(self.pallet), len(self.catalogue))
+        self.assertEqual(sorted(self.pallet.names()),
+                         sorted(self.catalogue.names()))
+        for name in self.pallet.names():
+            self.assertEqual(
+                [str(self.pallet.get(id))
+                 for id in self.pallet.versions(name)],
+                [str(self.catalogue.get(id))
+                 for id in self.catalogue.versions(name)])
+            for id in self.catalogue.versions(name):
+                spec = self.catalogue.get(id)
+                self.assertEqual(
+                    self.pallet.ranks(spec), self.catalogue.ranks(spec))
+
+        foo = self.catalogue.get(self.catalogue.versions('foo')[0])
+        self.assertEqual(['bar==1.0'], [str(s) for s in foo.requires])
+        quux = self.catalogue.get(self.catalogue.versions('quux')[0])
+        self.assertEqual(['foo', 'bar'], [str(s) for s in quux.conflicts])
+
+    @parameterized.expand([(query,) for query in QUERIES])
+    def test_ranges(self, query):
+        spec = Spec.parse(query)
+        self.assertEqual(self.pallet.ranges(spec),
+                         self.catalogue.ranges(spec))
+        self.assertEqual(
+            [str(self.pallet.get(id)) for id in self.pallet.search_ids(spec)],
+            [str(self.catalogue.get(id))
+             for id in self.catalogue.search_ids(spec)])
+        found = list(self.catalogue.search(spec))
+        self.assertEqual(self.catalogue.search_ids(spec),
+                         [id for id, _ in found])
+        self.assertEqual([str(s) for _, s in self.pallet.search(spec)],
+                         [str(s) for _, s in found])
+
+    def test_read_only(self):
+        with self.assertRaises(AssertionError):
+            self.catalogue.add_spec(Spec.parse('foo==1.0'))
+
+    @parameterized.expand(ENCODINGS)
+    def test_solver(self, amo, ranges):
+        installed = [self.pallet.get(self.pallet.versions('lib')[0])]
+        selected = [Spec.parse('app==3.0')]
+        expected = _solutions(
+            Solver(amo, ranges, pallet=self.pallet), installed, selected)
+        self.assertNotEqual(0, len(expected))
+
+        # Only the names the solve reaches are read.
+        get = self.catalogue.get = Mock(wraps=self.catalogue.get)
+        self.assertEqual(expected, _solutions(
+            Solver(amo, ranges, pallet=self.catalogue), installed, selected))
+        ids = {call.args[0] for call in get.call_args_list}
+        self.assertEqual(
+            {'app', 'lib', 'tool'},
+            {self.catalogue.get(id).name for id in ids})
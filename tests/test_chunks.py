@@ -0,0 +1,131 @@
+import os
+import tempfile
+from contextlib import redirect_stderr
+from io import BytesIO, StringIO
+from unittest import TestCase
+from os.path import join as pathjoin
+
+from nacl.exceptions import BadSignatureError
+from nacl.signing import SigningKey
+from parameterized import parameterized
+
+from parcel import archive
+from parcel.__main__ import main
+from parcel.chunks import ChunkStore, chunks, MIN_CHUNK, MAX_CHUNK
+from parcel.parcel import Parcel
+
+
+UUID = '2d7e7d06-6f0d-4b4e-8a57-0d5e4f6a9c11'
+
+
+class ChunksTestCase(TestCase):
+    def test_sizes(self):
+        data = os.urandom(512 * 1024)
+        found = list(chunks(BytesIO(data)))
+        self.assertEqual(data, b''.join(found))
+        self.assertTrue(all(MIN_CHUNK <= len(c) <= MAX_CHUNK
+                            for c in found[:-1]))
+
+    def test_insertion(self):
+        data = os.urandom(512 * 1024)
+        before = list(chunks(BytesIO(data)))
+        after = list(chunks(BytesIO(data[:1000] + b'x' + data[1000:])))
+        # Only the chunk the byte went into changed.
+        self.assertEqual(len(before) - 1, len(set(before) & set(after)))
+
+
+class ChunkStoreTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ChunkStore(pathjoin(self.tmp.name, 'store'))
+        self.key = SigningKey.generate()
+        self.data = os.urandom(256 * 1024)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _save(self, version, extra=b'', format=archive.DEFAULT_FORMAT):
+        parcel = Parcel(name='foo', version=version, uuid=UUID)
+        path = pathjoin(self.tmp.name, 'foo.bin')
+        with open(path, 'wb') as f:
+            f.write(self.data + extra)
+        parcel.add_file(path)
+        path = pathjoin(self.tmp.name, f'foo-{version}.pcl')
+        parcel.save_parcel(path, key=self.key, format=format)
+        return path
+
+    @parameterized.expand([(archive.FORMAT_LEGACY,),
+                           (archive.FORMAT_STREAMING,)])
+    def test_rebuild(self, format):
+        path = self._save('1.0', format=format)
+        self.store.add(path)
+        self.assertEqual(['foo-1.0.pcl'], self.store.names())
+
+        rebuilt = pathjoin(self.tmp.name, 'rebuilt.pcl')
+        self.store.rebuild('foo-1.0.pcl', rebuilt)
+        with open(path, 'rb') as a, open(rebuilt, 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+        parcel = self.store.load_parcel('foo-1.0.pcl')
+        self.assertEqual(UUID, parcel.uuid)
+        self.assertEqual(self.data, parcel.get_file('foo.bin').read())
+
+    def test_dedup(self):
+        first = self.store.add(self._save('1.0'))
+        second = self.store.add(self._save('1.1', b'more'))
+        # The file is stored once, only the chunks around the change again.
+        self.assertLess(second['written'] * 4, first['written'])
+        stats = self.store.stats()
+        self.assertEqual(2, stats['parcels'])
+        self.assertLess(stats['stored'], stats['size'] * 2 // 3)
+
+    def test_gc(self):
+        self.store.add(self._save('1.0'))
+        self.store.add(self._save('1.1', b'more'))
+        self.store.remove('foo-1.0.pcl')
+        removed, _ = self.store.gc()
+        self.assertGreater(removed, 0)
+        self.assertEqual(0, self.store.gc()[0])
+        self.store.load_parcel('foo-1.1.pcl')
+
+    def test_corrupt_chunk(self):
+        recipe = self.store.add(self._save('1.0'))
+        digest = recipe['chunks'][0]
+        path = pathjoin(self.store.chunks_path, digest[:2], digest)
+        compressor = self.store.compression.compressor()
+        with open(path, 'wb') as f:
+            f.write(compressor.compress(b'forged') + compressor.flush())
+        with self.assertRaises(BadSignatureError):
+            self.store.load_parcel('foo-1.0.pcl')
+
+    def _forged(self):
+        "A parcel with the signature of another message."
+        with open(self._save('1.0'), 'rb') as f:
+            _, format, pubkey, _, message = archive.read_message(f)
+        signature = archive.sign(self.key, format, BytesIO(b'forged'))
+        path = pathjoin(self.tmp.name, 'forged.pcl')
+        with message, open(path, 'wb') as f:
+            archive.write(f, format, pubkey, signature, message)
+        return path
+
+    def test_bad_signature(self):
+        path = self._forged()
+        with self.assertRaises(BadSignatureError):
+            self.store.add(path)
+        self.assertEqual(0, self.store.stats()['chunks'])
+        self.assertEqual([], self.store.names())
+
+    def test_store_command(self):
+        path = self._forged()
+        with self.assertRaises(SystemExit) as e, \
+                redirect_stderr(StringIO()) as stderr:
+            main(['parcel', 'store', self.store.path, path])
+        self.assertEqual(1, e.exception.code)
+        self.assertIn('signature', stderr.getvalue())
+        self.assertEqual(0, self.store.stats()['chunks'])
+
+    def test_invalid(self):
+        with self.assertRaises(AssertionError):
+            self.store.add(self._save('1.0', format=archive.FORMAT_INDEXED))
+        with self.assertRaises(AssertionError):
+            self.store.recipe('../foo')
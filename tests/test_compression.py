@@ -0,0 +1,88 @@
+import os
+import tarfile
+from io import BytesIO
+from unittest import TestCase
+from unittest.mock import patch
+from os.path import join as pathjoin, dirname
+
+from parameterized import parameterized
+
+from parcel import archive
+from parcel.compression import Compression, CODECS, detect, reader
+from parcel.parcel import Parcel
+
+
+EXAMPLE_YML = pathjoin(dirname(__file__), 'example.yml')
+EXAMPLE_CFG = pathjoin(dirname(__file__), 'example.cfg')
+
+
+class CompressionTestCase(TestCase):
+    def _parcel(self):
+        parcel = Parcel(name='example', version='1.0.8',
+                        service_definition=EXAMPLE_YML)
+        parcel.add_file(EXAMPLE_CFG)
+        return parcel
+
+    @parameterized.expand([
+        (codec, format)
+        for codec in CODECS
+        for format in (archive.FORMAT_STREAMING, archive.FORMAT_INDEXED)
+    ])
+    def test_codec(self, codec, format):
+        parcel, bio = self._parcel(), BytesIO()
+        parcel.save_parcel(bio, format=format,
+                           compression=Compression(codec, level=1))
+        bio.seek(0)
+        if format != archive.FORMAT_INDEXED:
+            self.assertEqual(codec, detect(bio))
+        loaded = Parcel.load_parcel(bio)
+        self.assertEqual(parcel.uuid, loaded.uuid)
+        self.assertEqual(parcel.get_file('example.cfg').read(),
+                         loaded.get_file('example.cfg').read())
+
+    @patch('parcel.compression.BLOCK_SIZE', 1000)
+    def test_parallel_gzip(self):
+        data = os.urandom(4000) + b'x' * 10000
+        bio = BytesIO()
+        with Compression(threads=4).writer(bio) as z:
+            for i in range(0, len(data), 999):
+                z.write(data[i:i + 999])
+        bio.seek(0)
+        self.assertEqual(data, reader(bio).read())
+
+    def test_parallel_gzip_tarfile(self):
+        parcel, bio = self._parcel(), BytesIO()
+        parcel.save_parcel(bio, compression=Compression(threads=4))
+        bio.seek(0)
+        # Stock tarfile reads the concatenated gzip members.
+        with tarfile.open(fileobj=bio, mode='r:gz') as outer:
+            self.assertEqual(
+                ['format', 'pubkey', 'signature', 'message'],
+                outer.getnames())
+        bio.seek(0)
+        self.assertEqual(parcel.uuid, Parcel.load_parcel(bio).uuid)
+
+    @parameterized.expand([(codec,) for codec in CODECS])
+    def test_open_outer(self, codec):
+        parcel, bio = self._parcel(), BytesIO()
+        parcel.save_parcel(bio, compression=Compression(codec, level=1))
+        bio.seek(0)
+        with archive.open_outer(bio) as outer:
+            z = outer.fileobj
+            self.assertEqual(archive.FORMAT_STREAMING,
+                             archive.read_header(outer)[0])
+        self.assertTrue(z.closed)
+        self.assertFalse(bio.closed)
+
+    @patch('parcel.compression.os.cpu_count', return_value=4)
+    def test_all_cpus(self, cpu_count):
+        self.assertEqual(4, Compression(threads=0).threads)
+        for codec in CODECS:
+            if codec != 'gzip':
+                self.assertEqual(1, Compression(codec, threads=0).threads)
+
+    def test_invalid(self):
+        with self.assertRaises(AssertionError):
+            Compression('foo')
+        with self.assertRaises(AssertionError):
+            Compression('xz', threads=2)
@@ -1,13 +1,19 @@
+import mmap
+import tarfile
+import tempfile
 from unittest import TestCase
-from os.path import join as pathjoin, dirname
+from unittest.mock import patch
+from os.path import join as pathjoin, dirname, getsize
 from io import BytesIO
 
+from nacl.exceptions import BadSignatureError
 from parameterized import parameterized
 
-from parcel import Version
+from parcel import Version, archive
 from parcel.parcel import Parcel, Manifest
-from parcel.attrs import Setting, Option
+from parcel.attrs import Setting, Option, File
 from parcel.spec import Spec
+from parcel.utils import spool
 
 
 EXAMPLE_JSON = pathjoin(dirname(__file__), 'example.json')
@@ -117,6 +123,40 @@ class ParcelCreateTestCase(TestCase):
         self.assertEqual(Version('1.0.8'), obj.version)
 
 
+@patch('parcel.utils.SPILL_SIZE', 128)
+@patch('parcel.attrs.SPILL_SIZE', 128)
+class FileTestCase(TestCase):
+    def test_path_lazy(self):
+        file = File(EXAMPLE_CFG)
+        self.assertFalse(file.loaded)
+        self.assertEqual(getsize(EXAMPLE_CFG), file.size)
+        self.assertFalse(file.loaded)
+        # Larger than the spill size, so mapped.
+        self.assertIsInstance(file.value, mmap.mmap)
+        with open(EXAMPLE_CFG, 'rb') as f:
+            self.assertEqual(f.read(), file.read())
+
+    def test_spill(self):
+        small, large = File('small', b'x' * 128), File('large', b'x' * 129)
+        self.assertIsInstance(small.value, BytesIO)
+        self.assertNotIsInstance(large.value, BytesIO)
+        self.assertEqual(129, large.size)
+        self.assertEqual(b'x' * 129, large.read())
+
+    def test_save_load(self):
+        parcel = Parcel(name='example', version='1.0.8',
+                        service_definition=EXAMPLE_YML)
+        parcel.add_file(EXAMPLE_CFG)
+        bio = BytesIO()
+        parcel.save_parcel(bio)
+        bio.seek(0)
+        loaded = Parcel.load_parcel(bio)
+        self.assertNotIsInstance(loaded.get_file('example.cfg').value, BytesIO)
+        self.assertEqual(
+            parcel.get_file('example.cfg').read(),
+            loaded.get_file('example.cfg').read())
+
+
 class ParcelSaveTestCase(TestCase):
     def test_save_parcel(self):
         parcel = Parcel(name='example', version='1.0.8',
@@ -145,3 +185,86 @@ class ParcelSaveTestCase(TestCase):
         self.assertEqual(parcel.version, loaded.version)
         self.assertEqual(parcel.uuid, loaded.uuid)
         self.assertEqual(2, len(parcel.files))
+
+    @parameterized.expand([(format,) for format in archive.FORMATS])
+    def test_save_format(self, format):
+        parcel = Parcel(name='example', version='1.0.8',
+                        service_definition=EXAMPLE_YML)
+        parcel.add_file(EXAMPLE_CFG)
+        bio = BytesIO()
+        parcel.save_parcel(bio, format=format)
+
+        for lazy in (False, True):
+            bio.seek(0)
+            self.assertEqual(format == archive.FORMAT_INDEXED,
+                             archive.is_indexed(bio))
+            bio.seek(0)
+            loaded = Parcel.load_parcel(bio, lazy=lazy)
+            self.assertEqual(parcel.uuid, loaded.uuid)
+            self.assertEqual(
+                parcel.get_file('example.cfg').read(),
+                loaded.get_file('example.cfg').read())
+
+    def test_save_tampered(self):
+        parcel = Parcel(name='example', version='1.0.8')
+        bio = BytesIO()
+        parcel.save_parcel(bio)
+        bio.seek(0)
+        with tarfile.open(fileobj=bio, mode='r:gz') as outer:
+            _, pubkey, _ = archive.read_header(outer)
+
+        # A valid signature, but of another message.
+        other = BytesIO()
+        Parcel(name='example', version='1.0.9').save_parcel(other)
+        other.seek(0)
+        with tarfile.open(fileobj=other, mode='r:gz') as outer:
+            _, _, signature = archive.read_header(outer)
+            message = spool(archive.open_message(outer))
+
+        forged = BytesIO()
+        archive.write(forged, archive.FORMAT_STREAMING, pubkey, signature,
+                      message)
+        forged.seek(0)
+        with self.assertRaises(BadSignatureError):
+            Parcel.load_parcel(forged)
+        forged.seek(0)
+        self.assertEqual(
+            '1.0.9', str(Parcel.load_parcel(forged, verify=False).version))
+
+    def test_save_indexed(self):
+        parcel = Parcel(name='example', version='1.0.8',
+                        service_definition=EXAMPLE_YML)
+        parcel.add_file(EXAMPLE_CFG)
+        bio = BytesIO()
+        parcel.save_parcel(bio, format=archive.FORMAT_INDEXED)
+
+        bio.seek(0)
+        index = archive.Index(bio)
+        index.verify()
+        self.assertEqual(
+            ['manifest.json', 'example.cfg', 'example.yml'],
+            list(index.members))
+        with open(EXAMPLE_CFG, 'rb') as f:
+            self.assertEqual(f.read(), index.read(bio, 'example.cfg').read())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathjoin(tmp, 'example.pcl')
+            with open(path, 'wb') as f:
+                f.write(bio.getvalue())
+            loaded = Parcel.load_parcel(path, lazy=True)
+            self.assertFalse(any(f.loaded for f in loaded.files))
+            self.assertEqual(parcel.get_file('example.cfg').read(),
+                             loaded.get_file('example.cfg').read())
+
+        # Corrupt the compressed example.cfg, other members still read.
+        entry = index.members['example.cfg']
+        data = bytearray(bio.getvalue())
+        data[index.data_offset + entry['offset'] + entry['length'] // 2] ^= 1
+        corrupt = BytesIO(data)
+        loaded = Parcel.load_parcel(corrupt, lazy=True)
+        self.assertEqual('example', loaded.name)
+        with self.assertRaises(Exception):
+            loaded.get_file('example.cfg').read()
+        corrupt.seek(0)
+        with self.assertRaises(Exception):
+            Parcel.load_parcel(corrupt)
@@ -0,0 +1,112 @@
+import lzma
+import os
+import tempfile
+from io import BytesIO
+from unittest import TestCase
+from os.path import join as pathjoin
+
+from nacl.exceptions import BadSignatureError
+from nacl.signing import SigningKey
+from parameterized import parameterized
+
+from parcel import archive
+from parcel.delta import make_delta, apply_delta
+from parcel.keyring import Keyring, UntrustedKey
+from parcel.parcel import Parcel
+
+
+UUID = '8c4c8d2e-5a44-4a3c-9d7b-1f0f7a1c2b3d'
+AUTHOR = 'foo@example.com'
+CONFIG = ''.join(f'option_{i} = {i * 7919 % 10007}\n' for i in range(4000))
+DATA = bytes(range(256)) * 1024
+
+
+class DeltaTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.key = SigningKey.generate()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _save(self, version, config, format=archive.DEFAULT_FORMAT):
+        parcel = Parcel(name='foo', version=version, uuid=UUID)
+        parcel.author = AUTHOR
+        for name, data in (('app.cfg', config.encode()), ('app.bin', DATA)):
+            path = pathjoin(self.tmp.name, name)
+            with open(path, 'wb') as f:
+                f.write(data)
+            parcel.add_file(path)
+        path = pathjoin(self.tmp.name, f'foo-{version}.pcl')
+        parcel.save_parcel(path, key=self.key, format=format, overwrite=True)
+        return path
+
+    def _paths(self, format=archive.DEFAULT_FORMAT):
+        old = self._save('1.0', CONFIG, format)
+        new = self._save(
+            '1.1', CONFIG.replace('option_10 =', 'option_10 = 1 +'), format)
+        return old, new
+
+    @parameterized.expand([(archive.FORMAT_LEGACY,),
+                           (archive.FORMAT_STREAMING,)])
+    def test_round_trip(self, format):
+        old, new = self._paths(format)
+        delta = BytesIO()
+        inserted = make_delta(old, new, delta)
+        # The changed line and the blocks around it, not the whole file.
+        self.assertLess(inserted, 4 * 1024)
+        self.assertLess(len(delta.getvalue()) * 10, os.path.getsize(new))
+
+        delta.seek(0)
+        rebuilt = pathjoin(self.tmp.name, 'rebuilt.pcl')
+        apply_delta(old, delta, rebuilt)
+        with open(new, 'rb') as a, open(rebuilt, 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+        parcel = Parcel.load_parcel(rebuilt)
+        self.assertEqual('1.1', str(parcel.version))
+
+    def test_wrong_parcel(self):
+        old, new = self._paths()
+        delta = BytesIO()
+        make_delta(old, new, delta)
+        delta.seek(0)
+        with self.assertRaises(AssertionError):
+            apply_delta(new, delta, BytesIO())
+
+    def test_tampered(self):
+        old, new = self._paths()
+        delta = BytesIO()
+        make_delta(old, new, delta)
+        data = lzma.decompress(delta.getvalue())
+        self.assertIn(b'option_10 = 1 +', data)
+        forged = BytesIO(lzma.compress(
+            data.replace(b'option_10 = 1 +', b'option_10 = 2 +')))
+        with self.assertRaises(BadSignatureError):
+            apply_delta(old, forged, BytesIO())
+
+    def test_other_key(self):
+        old, _ = self._paths()
+        self.key = SigningKey.generate()
+        new = self._save('1.1', CONFIG)
+        delta = BytesIO()
+        make_delta(old, new, delta)
+
+        rebuilt = pathjoin(self.tmp.name, 'rebuilt.pcl')
+        delta.seek(0)
+        with self.assertRaises(BadSignatureError):
+            apply_delta(old, delta, rebuilt)
+        self.assertFalse(os.path.exists(rebuilt))
+
+        # Unless the new key is trusted for the author.
+        keyring = Keyring()
+        delta.seek(0)
+        with self.assertRaises(UntrustedKey):
+            apply_delta(old, delta, rebuilt, keyring=keyring)
+        keyring.add(AUTHOR, self.key.verify_key.encode())
+        delta.seek(0)
+        apply_delta(old, delta, rebuilt, keyring=keyring)
+
+    def test_indexed(self):
+        old, new = self._paths(archive.FORMAT_INDEXED)
+        with self.assertRaises(AssertionError):
+            make_delta(old, new, BytesIO())
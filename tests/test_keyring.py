@@ -0,0 +1,88 @@
+from io import BytesIO, StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from nacl.exceptions import BadSignatureError
+from nacl.signing import SigningKey
+
+from parcel.keyring import Keyring, UntrustedKey, VerifyCache, verify_key
+from parcel.parcel import Parcel
+
+
+class VerifyCacheTestCase(TestCase):
+    def setUp(self):
+        self.key = SigningKey.generate()
+        self.pubkey = self.key.verify_key.encode()
+
+    def _sign(self, data):
+        return self.key.sign(data).signature
+
+    def test_cached(self):
+        cache = VerifyCache()
+        signature = self._sign(b'data')
+        with patch('parcel.keyring.verify_key', wraps=verify_key) as vk:
+            cache.verify(self.pubkey, b'data', signature)
+            cache.verify(self.pubkey, b'data', signature)
+        self.assertEqual(1, vk.call_count)
+        self.assertEqual(1, len(cache))
+
+    def test_bad_signature(self):
+        cache = VerifyCache()
+        signature = self._sign(b'data')
+        for _ in range(2):
+            with self.assertRaises(BadSignatureError):
+                cache.verify(self.pubkey, b'other', signature)
+        self.assertEqual(0, len(cache))
+
+    def test_eviction(self):
+        cache = VerifyCache(size=2)
+        signatures = {data: self._sign(data) for data in (b'a', b'b', b'c')}
+        cache.verify(self.pubkey, b'a', signatures[b'a'])
+        cache.verify(self.pubkey, b'b', signatures[b'b'])
+        # a is used again, so b is the least recently used.
+        cache.verify(self.pubkey, b'a', signatures[b'a'])
+        cache.verify(self.pubkey, b'c', signatures[b'c'])
+        self.assertEqual(2, len(cache))
+        with patch('parcel.keyring.verify_key', wraps=verify_key) as vk:
+            cache.verify(self.pubkey, b'a', signatures[b'a'])
+            cache.verify(self.pubkey, b'c', signatures[b'c'])
+            self.assertEqual(0, vk.call_count)
+            cache.verify(self.pubkey, b'b', signatures[b'b'])
+            self.assertEqual(1, vk.call_count)
+
+
+class KeyringTestCase(TestCase):
+    def setUp(self):
+        self.key = SigningKey.generate()
+        self.pubkey = self.key.verify_key.encode()
+        self.keyring = Keyring({'Author@Example.com': [self.pubkey]})
+
+    def test_trusts(self):
+        self.assertTrue(
+            self.keyring.trusts(' author@example.com', self.pubkey))
+        self.assertFalse(self.keyring.trusts('other@example.com', self.pubkey))
+        self.assertFalse(self.keyring.trusts(None, self.pubkey))
+        other = SigningKey.generate().verify_key.encode()
+        with self.assertRaises(UntrustedKey):
+            self.keyring.check('author@example.com', other)
+
+    def test_save_load(self):
+        f = StringIO()
+        self.keyring.save(f)
+        f.seek(0)
+        keyring = Keyring.load(f)
+        self.assertEqual([self.pubkey], keyring.keys('author@example.com'))
+
+    def test_load_parcel(self):
+        parcel = Parcel(name='example', version='1.0.8')
+        parcel.author = 'author@example.com'
+        bio = BytesIO()
+        parcel.save_parcel(bio, key=self.key)
+
+        bio.seek(0)
+        loaded = Parcel.load_parcel(bio, keyring=self.keyring)
+        self.assertEqual('author@example.com', loaded.author)
+
+        bio.seek(0)
+        with self.assertRaises(UntrustedKey):
+            Parcel.load_parcel(bio, keyring=Keyring())
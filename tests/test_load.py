@@ -3,12 +3,14 @@ import tempfile
 
 from io import BytesIO
 from unittest import TestCase
+from unittest.mock import patch
 from os.path import dirname, getsize, join as pathjoin
 
-from pkg_resources import parse_version
+from nacl.exceptions import BadSignatureError
 
+from parcel import archive, parse_version
 from parcel.parcel import path_or_file, Manifest, Parcel
-from parcel.attrs import Setting
+from parcel.attrs import File, Setting
 
 
 EXAMPLE_JSON = pathjoin(dirname(__file__), 'example.json')
@@ -57,6 +59,21 @@ class ParcelTestCase(TestCase):
         self.assertEqual("example.cfg", parcel.files[0].name)
         self.assertEqual(Setting("SHANTY_OAUTH_TOKEN"), parcel.settings[0])
 
+    def test_load_lazy(self):
+        eager = Parcel.load_parcel(EXAMPLE_PCL)
+        with open(EXAMPLE_PCL, 'rb') as f:
+            data = f.read()
+        for source in (lambda: EXAMPLE_PCL, lambda: BytesIO(data)):
+            for verify in (True, False):
+                parcel = Parcel.load_parcel(
+                    source(), verify=verify, lazy=True)
+                self.assertEqual('example', parcel.name)
+                self.assertFalse(any(f.loaded for f in parcel.files))
+                self.assertIsNone(parcel.lint())
+                self.assertEqual(
+                    {f.name: f.read() for f in eager.files},
+                    {f.name: f.read() for f in parcel.files})
+
     def test_load_corrupt(self):
         size, bio = getsize(EXAMPLE_PCL), BytesIO()
         with open(EXAMPLE_PCL, 'rb') as f:
@@ -79,3 +96,33 @@ class ParcelTestCase(TestCase):
                     # Should not load successfully
                     with self.assertRaises(Exception):
                         Parcel.load(bio)
+
+    def test_load_lazy_replaced(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathjoin(tmp, 'example.pcl')
+            original = Parcel.load_parcel(EXAMPLE_PCL)
+            original.save_parcel(path)
+            parcel = Parcel.load_parcel(path, lazy=True)
+
+            # Replaced once verified, by a parcel signed by someone else.
+            original.files[0].value = b'replaced'
+            original.save_parcel(path, overwrite=True)
+            with self.assertRaises(BadSignatureError):
+                parcel.files[0].read()
+
+    def test_load_lazy_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathjoin(tmp, 'example.pcl')
+            eager = Parcel.load_parcel(EXAMPLE_PCL)
+            for i in range(10):
+                eager.add_file(File(f'{i}.cfg', value=str(i).encode()))
+            eager.save_parcel(path)
+
+            parcel = Parcel.load_parcel(path, lazy=True)
+            files = sorted(parcel.files, key=lambda f: f.name)
+            with patch.object(archive, 'open_outer',
+                              wraps=archive.open_outer) as open_outer:
+                self.assertEqual(
+                    {f.name: f.read() for f in eager.files},
+                    {f.name: f.read() for f in files})
+            open_outer.assert_called_once()
@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from parcel.pallet import Pallet
+from parcel.spec import Spec
+
+
+VERSIONS = ['1.0', '0.9', '2.0', '1.1', '1.0.1']
+
+
+class PalletTestCase(TestCase):
+    def setUp(self):
+        self.pallet = Pallet()
+        for version in VERSIONS:
+            self.pallet.add_spec(Spec('foo', version, oper='=='))
+        self.pallet.add_spec(Spec('bar', '1.0', oper='=='))
+
+    def test_versions_ordered(self):
+        versions = [
+            str(self.pallet.get(id).version)
+            for id in self.pallet.versions('foo')
+        ]
+        self.assertEqual(['0.9', '1.0', '1.0.1', '1.1', '2.0'], versions)
+
+    def test_duplicate_version(self):
+        self.pallet.add_spec(Spec('bar', '1.0', oper='=='))
+        self.assertEqual([len(self.pallet)], self.pallet.versions('bar'))
+
+    @parameterized.expand([
+        ('foo', ['0.9', '1.0', '1.0.1', '1.1', '2.0']),
+        ('foo==1.0', ['1.0']),
+        ('foo>=1.0.1', ['1.0.1', '1.1', '2.0']),
+        ('foo<=1.0.1', ['0.9', '1.0', '1.0.1']),
+        ('foo>1.0.1', ['1.1', '2.0']),
+        ('foo<1.0.1', ['0.9', '1.0']),
+        ('foo!=1.0.1', ['0.9', '1.0', '1.1', '2.0']),
+        ('foo>=3.0', []),
+        ('foo==1.0.5', []),
+        ('baz', []),
+    ])
+    def test_search(self, query, expected):
+        query = Spec.parse(query)
+        found = [str(spec.version) for _, spec in self.pallet.search(query)]
+        self.assertEqual(expected, found)
+        # Must agree with satisfies() for every version.
+        matches = [
+            str(spec.version) for _, spec in self.pallet.all()
+            if spec.satisfies(query)
+        ]
+        self.assertEqual(sorted(expected), sorted(matches))
+
+    def test_rank(self):
+        ranks = [self.pallet.rank(id) for id in self.pallet.versions('foo')]
+        self.assertEqual([0, 1, 2, 3, 4], ranks)
+        # Adding an older version shifts the ranks.
+        self.pallet.add_spec(Spec('foo', '0.1', oper='=='))
+        self.assertEqual(0, self.pallet.rank(len(self.pallet)))
+        self.assertEqual(5, self.pallet.rank(self.pallet.versions('foo')[-1]))
+
+    @parameterized.expand([
+        ('foo==1.0', (1, 2)),
+        ('foo==1.0.0', (1, 2)),
+        ('foo==1.0.5', (3, 3)),
+        ('foo==9.0', (5, 5)),
+    ])
+    def test_ranks(self, query, expected):
+        self.assertEqual(expected, self.pallet.ranks(Spec.parse(query)))
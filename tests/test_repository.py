@@ -0,0 +1,92 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from os.path import join as pathjoin
+
+from parcel.parcel import Parcel
+from parcel.repository import Repository, file_digest
+from parcel.solver import Solver
+from parcel.spec import Spec
+
+
+PARCELS = [
+    ('foo', '1.0', ['bar==1.0']),
+    ('foo', '2.0', ['bar==2.0']),
+    ('bar', '1.0', []),
+    ('bar', '2.0', []),
+]
+
+
+class RepositoryTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+        for name, version, requires in PARCELS:
+            self._save(name, version, requires)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _save(self, name, version, requires=None):
+        parcel = Parcel(name=name, version=version)
+        parcel.requires = requires or []
+        path = pathjoin(self.path, f'{name}-{version}.pcl')
+        parcel.save_parcel(path, overwrite=True)
+        return path
+
+    def test_update(self):
+        repository = Repository(self.path)
+        self.assertEqual((4, 0), repository.update())
+        entry = repository.entries()['foo-2.0.pcl']
+        self.assertEqual('foo', entry['name'])
+        self.assertEqual(['bar==2.0'], entry['requires'])
+        self.assertEqual(
+            file_digest(repository.filename('foo-2.0.pcl')), entry['digest'])
+
+        # Nothing changed, nothing is opened.
+        with patch.object(Parcel, 'load_parcel') as load_parcel:
+            self.assertEqual((0, 0), repository.update())
+            load_parcel.assert_not_called()
+
+        os.remove(pathjoin(self.path, 'bar-1.0.pcl'))
+        path = self._save('foo', '1.0', ['bar==2.0'])
+        os.utime(path, ns=(0, 0))
+        with open(pathjoin(self.path, 'broken.pcl'), 'wb') as f:
+            f.write(b'not a parcel')
+        self.assertEqual((1, 1), repository.update())
+        self.assertEqual(3, len(repository))
+        self.assertEqual(
+            ['bar==2.0'], repository.entries()['foo-1.0.pcl']['requires'])
+
+    def test_load_solver(self):
+        Repository(self.path).update()
+
+        # A new repository loads the index without opening any parcel.
+        with patch.object(Parcel, 'load_parcel') as load_parcel:
+            repository = Repository(self.path)
+            self.assertEqual(4, len(repository.load_pallet()))
+            solver = repository.load_solver()
+            load_parcel.assert_not_called()
+
+        solutions = list(solver.solve([], [Spec.parse('foo==2.0')]))
+        self.assertEqual(1, len(solutions))
+        install, remove = solutions[0]
+        self.assertEqual([], remove)
+        self.assertEqual(['bar==2.0', 'foo==2.0'],
+                         sorted(str(spec) for spec in install))
+
+    def test_catalogue(self):
+        repository = Repository(self.path)
+        repository.update()
+        repository.save_catalogue()
+        catalogue = repository.load_catalogue()
+        try:
+            self.assertEqual(4, len(catalogue))
+            solver = Solver(pallet=catalogue)
+            install, remove = next(solver.solve([], [Spec.parse('foo')]))
+            self.assertEqual(['bar==2.0', 'foo==2.0'],
+                             sorted(str(spec) for spec in install))
+
+        finally:
+            catalogue.close()
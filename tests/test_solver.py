@@ -1,8 +1,11 @@
 from unittest import TestCase
 from pprint import pprint
 
+from parameterized import parameterized
+
 from parcel.manifest import Manifest
-from parcel.solver import Solver
+from parcel.solver import Solver, BudgetExceeded
+from parcel.spec import Spec
 
 
 PACKAGES = [
@@ -72,3 +75,195 @@ class SolverTestCase(TestCase):
         install, remove = solutions[0]
         self.assertEqual(2, len(install))
         self.assertEqual(2, len(remove))
+
+    def test_cone(self):
+        for i in range(50):
+            self.solver.add_spec(Manifest({
+                'name': f'unrelated{i}',
+                'version': '1.0',
+                'requires': ['foo'],
+            }))
+        solutions = list(self.solver.solve(INSTALLED, [PACKAGES[1]]))
+        self.assertEqual(1, len(solutions))
+        # Only foo and bar versions are encoded.
+        self.assertEqual(4, self.solver.stats['packages'])
+
+    def test_incremental(self):
+        list(self.solver.solve(INSTALLED, [PACKAGES[1]]))
+        self.assertEqual(4, self.solver.stats['compiled'])
+        # Nothing changed, nothing compiled.
+        list(self.solver.solve(INSTALLED, [PACKAGES[1]]))
+        self.assertEqual(0, self.solver.stats['compiled'])
+        # Specs mentioning bar and the new spec are compiled.
+        self.solver.add_spec(Manifest({
+            'name': 'bar',
+            'version': '3.0',
+            'requires': ['foo==2.0'],
+        }))
+        solutions = list(self.solver.solve(INSTALLED, [PACKAGES[1]]))
+        self.assertEqual(3, self.solver.stats['compiled'])
+        self.assertEqual(1, len(solutions))
+        # Changes made directly to the pallet recompile everything.
+        self.solver.pallet.add_spec(Manifest({
+            'name': 'foo',
+            'version': '3.0',
+        }))
+        list(self.solver.solve(INSTALLED, [PACKAGES[1]]))
+        self.assertEqual(6, self.solver.stats['compiled'])
+
+
+ENCODINGS = [
+    ('pairwise', 'direct'),
+    ('pairwise', 'order'),
+    ('sequential', 'direct'),
+    ('sequential', 'order'),
+]
+
+
+def _catalogue(versions):
+    # Each version of "app" requires a range of "lib" and conflicts with the
+    # oldest "tool".
+    packages = []
+    for i in range(1, versions + 1):
+        packages.append(Manifest({
+            'name': 'app',
+            'version': f'{i}.0',
+            'requires': [f'lib>={i // 2}.0', f'lib<{i + 2}.0'],
+            'conflicts': ['tool<2.0'],
+        }))
+        packages.append(Manifest({'name': 'lib', 'version': f'{i}.0'}))
+        packages.append(Manifest({
+            'name': 'tool',
+            'version': f'{i}.0',
+            'requires': [f'lib!={i}.0'],
+        }))
+    return packages
+
+
+def _solutions(solver, installed, selected):
+    return {
+        (frozenset(map(str, install)), frozenset(map(str, remove)))
+        for install, remove in solver.solve(installed, selected)
+    }
+
+
+class SolverEncodingTestCase(TestCase):
+    def _solver(self, amo, ranges, packages):
+        solver = Solver(amo=amo, ranges=ranges)
+        for manifest in packages:
+            solver.add_spec(manifest)
+        return solver
+
+    @parameterized.expand(ENCODINGS)
+    def test_same_solutions(self, amo, ranges):
+        packages = _catalogue(4)
+        installed = [packages[1]]
+        selected = [Manifest({'name': 'app', 'version': '3.0'})]
+        expected = _solutions(
+            self._solver('pairwise', 'direct', packages), installed, selected)
+        self.assertNotEqual(0, len(expected))
+        self.assertEqual(expected, _solutions(
+            self._solver(amo, ranges, packages), installed, selected))
+
+    def test_invalid_encoding(self):
+        with self.assertRaises(AssertionError):
+            Solver(amo='bogus')
+        with self.assertRaises(AssertionError):
+            Solver(ranges='bogus')
+
+    def test_stats(self):
+        packages = _catalogue(100)
+        selected = [Manifest({'name': 'app', 'version': '50.0'})]
+        sizes = {}
+        for amo, ranges in ENCODINGS:
+            solver = self._solver(amo, ranges, packages)
+            solver.encode([], selected)
+            sizes[(amo, ranges)] = solver.stats
+        self.assertEqual(300, sizes[('pairwise', 'direct')]['variables'])
+        self.assertLess(
+            sizes[('sequential', 'direct')]['clauses'],
+            sizes[('pairwise', 'direct')]['clauses'] / 5)
+        self.assertLess(
+            sizes[('sequential', 'order')]['literals'],
+            sizes[('sequential', 'direct')]['literals'] / 5)
+
+
+class SolverBestTestCase(TestCase):
+    def setUp(self):
+        self.packages = []
+        for i in range(1, 6):
+            self.packages.append(Manifest({
+                'name': 'foo',
+                'version': f'{i}.0',
+                'requires': [f'lib>={i}.0'],
+            }))
+            self.packages.append(Manifest({
+                'name': 'lib',
+                'version': f'{i}.0',
+            }))
+        # foo-2.0 and lib-3.0
+        self.installed = [self.packages[2], self.packages[5]]
+
+    def _solver(self, amo, ranges):
+        solver = Solver(amo=amo, ranges=ranges)
+        for manifest in self.packages:
+            solver.add_spec(manifest)
+        return solver
+
+    @parameterized.expand(ENCODINGS)
+    def test_fewest_changes(self, amo, ranges):
+        solver = self._solver(amo, ranges)
+        install, remove = solver.solve_best(
+            self.installed, [Spec.parse('foo>=1.0')])
+        self.assertEqual(['foo==2.0', 'lib==3.0'], sorted(map(str, install)))
+        self.assertEqual([], remove)
+        self.assertEqual(0, solver.stats['cost'])
+
+    @parameterized.expand(ENCODINGS)
+    def test_newest(self, amo, ranges):
+        solver = self._solver(amo, ranges)
+        install, remove = solver.solve_best(
+            self.installed, [Spec.parse('foo<5.0')], objective='newest')
+        self.assertEqual(['foo==4.0', 'lib==5.0'], sorted(map(str, install)))
+        self.assertEqual(['foo==2.0', 'lib==3.0'], sorted(map(str, remove)))
+        self.assertEqual(1, solver.stats['cost'])
+
+    def test_unsatisfiable(self):
+        solver = self._solver('pairwise', 'direct')
+        self.assertIsNone(
+            solver.solve_best(self.installed, [Spec.parse('foo>9.0')]))
+
+
+class SolverBudgetTestCase(TestCase):
+    def setUp(self):
+        self.solver = Solver()
+        for manifest in _catalogue(30):
+            self.solver.add_spec(manifest)
+        self.selected = [Spec.parse('app==10.0')]
+
+    def test_max_solutions(self):
+        solutions = list(self.solver.solve([], self.selected))
+        self.assertLess(5, len(solutions))
+        self.assertEqual(5, len(list(
+            self.solver.solve([], self.selected, max_solutions=5))))
+
+    def test_timeout(self):
+        with self.assertRaises(BudgetExceeded) as ctx:
+            list(self.solver.solve([], self.selected, timeout=0))
+        self.assertEqual('timeout', ctx.exception.reason)
+
+    def test_prop_limit(self):
+        with self.assertRaises(BudgetExceeded) as ctx:
+            list(self.solver.solve([], self.selected, prop_limit=1))
+        self.assertEqual('prop_limit', ctx.exception.reason)
+        # A generous limit finds every solution.
+        self.assertEqual(
+            len(list(self.solver.solve([], self.selected))),
+            len(list(self.solver.solve(
+                [], self.selected, prop_limit=10 ** 7))))
+
+    def test_best_timeout(self):
+        with self.assertRaises(BudgetExceeded) as ctx:
+            self.solver.solve_best([], self.selected, timeout=0)
+        self.assertEqual('timeout', ctx.exception.reason)
+        self.assertIsNone(ctx.exception.best)
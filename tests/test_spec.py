@@ -65,3 +65,26 @@ class SpecTestCase(TestCase):
             self.assertGreater(spec1, spec2)
         with self.assertRaises(AssertionError):
             self.assertLess(spec1, spec2)
+
+    def test_hash(self):
+        specs = {Spec.parse('foobar==1.0'), Spec.parse('foobar==1.0.0'),
+                 Spec.parse('foobar>=1.0'), Spec.parse('foobar==1.0')}
+        self.assertEqual(2, len(specs))
+        self.assertEqual(Spec.parse('foobar==1.0'), Spec.parse('foobar=1.0'))
+
+    def test_parse_not_equal(self):
+        spec = Spec.parse('foobar!=1.0')
+        self.assertEqual('foobar', spec.name)
+        self.assertEqual('!=', spec.oper)
+
+    def test_parse_copies(self):
+        spec = Spec.parse('foobar==1.0')
+        spec.name = 'barfoo'
+        self.assertEqual('foobar', Spec.parse('foobar==1.0').name)
+
+    def test_uuid(self):
+        spec = Spec.parse('foobar==1.0')
+        self.assertIsNone(spec._uuid)
+        self.assertEqual(spec.uuid, spec.uuid)
+        self.assertEqual('abc', Spec('foobar', '1.0', uuid='abc').uuid)
+        self.assertFalse(hasattr(spec, '__dict__'))
@@ -0,0 +1,128 @@
+import os
+import stat
+import tempfile
+from io import BytesIO
+from unittest import TestCase
+from unittest.mock import patch
+from os.path import join as pathjoin, dirname
+
+from parameterized import parameterized
+
+from parcel import template
+from parcel.attrs import File
+from parcel.parcel import Parcel
+from parcel.template import Template, encode_value
+
+
+EXAMPLE_JSON = pathjoin(dirname(__file__), 'example.json')
+SERVICE_YML = b'''services:
+  example:
+    environment:
+      - TOKEN=${SHANTY_OAUTH_TOKEN}
+      - ENABLED=${OPTION_A_ENABLED}
+      - PRICE=$$5
+      - HOST=${HOSTNAME}
+'''
+CONFIG = b'url=${other-service.OTHER_SETTING}/api\n'
+
+
+def _render(data, values):
+    f = BytesIO()
+    Template(data).render(
+        {name: encode_value(value) for name, value in values.items()}, f)
+    return f.getvalue()
+
+
+class TemplateTestCase(TestCase):
+    @parameterized.expand([
+        (b'', {}, b''),
+        (b'no variables', {}, b'no variables'),
+        (b'${A}', {'A': 'x'}, b'x'),
+        (b'a${A}b${B}c', {'A': 1, 'B': 2}, b'a1b2c'),
+        (b'${A}${A}', {'A': 'x'}, b'xx'),
+        (b'$$ $${A} $$$', {'A': 'x'}, b'$ ${A} $$'),
+        (b'${UNKNOWN} $A ${', {}, b'${UNKNOWN} $A ${'),
+        (b'${A}', {'A': True}, b'true'),
+        (b'${A}', {'A': False}, b'false'),
+        ('${A}'.encode(), {'A': 'café'}, 'café'.encode()),
+    ])
+    def test_render(self, data, values, expected):
+        self.assertEqual(expected, _render(data, values))
+
+    def test_names(self):
+        self.assertEqual({'A', 'b.c-d'},
+                         Template(b'${A} $${X} ${b.c-d} ${A}').names)
+
+
+class GenerateTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.parcel = Parcel.load_manifest(EXAMPLE_JSON)
+        self.parcel.service_definition = File(
+            'example.yml', value=SERVICE_YML)
+        self.parcel.del_file('example.cfg')
+        self.parcel.add_file(File('example.cfg', value=CONFIG))
+        self.settings = {
+            'SHANTY_OAUTH_TOKEN': 'secret',
+            'other-service.OTHER_SETTING': 'http://other',
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _read(self, name):
+        with open(pathjoin(self.tmp.name, name), 'rb') as f:
+            return f.read()
+
+    def test_generate(self):
+        self.parcel.configure({}, self.settings)
+        paths = self.parcel.generate(self.tmp.name)
+        self.assertEqual(
+            sorted(['example.yml', 'example.cfg']),
+            sorted(os.path.basename(path) for path in paths))
+        yml = self._read('example.yml')
+        self.assertIn(b'TOKEN=secret\n', yml)
+        self.assertIn(b'ENABLED=true\n', yml)
+        self.assertIn(b'PRICE=$5\n', yml)
+        self.assertIn(b'HOST=${HOSTNAME}\n', yml)
+        self.assertEqual(b'url=http://other/api\n',
+                         self._read('example.cfg'))
+        self.assertEqual(sorted(['example.yml', 'example.cfg']),
+                         sorted(os.listdir(self.tmp.name)))
+
+    def test_mode(self):
+        self.parcel.configure({}, self.settings)
+        with patch('parcel.utils._UMASK', 0o022):
+            paths = self.parcel.generate(self.tmp.name)
+        for path in paths:
+            self.assertEqual(0o644, stat.S_IMODE(os.stat(path).st_mode))
+
+    def test_compiled_once(self):
+        self.parcel.configure({}, self.settings)
+        self.parcel.generate(self.tmp.name)
+        with patch.object(template.Template, '__init__') as init:
+            self.parcel.configure({'OPTION_A_ENABLED': False}, self.settings)
+            self.parcel.generate(self.tmp.name)
+            init.assert_not_called()
+        self.assertIn(b'ENABLED=false\n', self._read('example.yml'))
+
+        # A replaced file is compiled again.
+        self.parcel.del_file('example.cfg')
+        self.parcel.add_file(File('example.cfg', value=b'changed'))
+        self.parcel.generate(self.tmp.name)
+        self.assertEqual(b'changed', self._read('example.cfg'))
+
+        # So is a file whose value is replaced.
+        self.parcel.get_file('example.cfg').value = b'${OPTION_A_ENABLED}'
+        self.parcel.generate(self.tmp.name)
+        self.assertEqual(b'false', self._read('example.cfg'))
+
+    def test_configure(self):
+        with self.assertRaises(AssertionError):
+            self.parcel.configure({'UNKNOWN': 1}, self.settings)
+        with self.assertRaises(AssertionError):
+            self.parcel.configure({}, {'SHANTY_OAUTH_TOKEN': 'secret'})
+        with self.assertRaises(AssertionError):
+            self.parcel.generate(self.tmp.name)
+        with self.assertRaises(AssertionError):
+            self.parcel.generate(pathjoin(self.tmp.name, 'missing'))
@@ -0,0 +1,270 @@
+import os
+import stat
+import tempfile
+import threading
+from contextlib import redirect_stderr, redirect_stdout
+from functools import partial
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+from os.path import join as pathjoin
+
+from nacl.exceptions import BadSignatureError
+from nacl.signing import SigningKey
+from parameterized import parameterized
+
+from parcel.__main__ import main
+from parcel.keyring import Keyring, UntrustedKey
+from parcel.parcel import Parcel
+from parcel.repository import Repository
+from parcel.solver import Solver
+from parcel.spec import Spec
+from parcel.transport import (
+    DirectoryTransport, HTTPTransport, Transport, TransportError, PART_SUFFIX,
+    download, fetch_all, plan, upload_all, verify_entry,
+)
+
+
+PARCELS = [
+    ('foo', '1.0', ['bar==1.0']),
+    ('bar', '1.0', []),
+    ('baz', '1.0', []),
+]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        path = pathjoin(self.server.root, self.path.lstrip('/'))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+        start = 0
+        range = self.headers.get('Range')
+        if range and self.server.ranges:
+            start = int(range[len('bytes='):].rstrip('-'))
+            self.send_response(206)
+            self.send_header(
+                'Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        self.server.sent += len(data) - start
+        self.wfile.write(data[start:])
+
+    def do_PUT(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        with open(pathjoin(self.server.root, self.path.lstrip('/')),
+                  'wb') as f:
+            f.write(data)
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class TransportTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathjoin(self.tmp.name, 'repo')
+        self.dest = pathjoin(self.tmp.name, 'dest')
+        os.makedirs(self.root)
+        os.makedirs(self.dest)
+        for name, version, requires in PARCELS:
+            parcel = Parcel(name=name, version=version)
+            parcel.author = f'{name}@example.com'
+            parcel.requires = requires
+            parcel.save_parcel(pathjoin(self.root, f'{name}-{version}.pcl'))
+        self.repository = Repository(self.root)
+        self.repository.update()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.root = self.root
+        self.server.ranges = True
+        self.server.connections = 0
+        self.server.sent = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.tmp.cleanup()
+
+    def _transport(self, kind):
+        if kind == 'http':
+            return HTTPTransport(self.url, connections=2)
+        return DirectoryTransport(self.root)
+
+    @parameterized.expand([('http',), ('directory',)])
+    def test_fetch_plan(self, kind):
+        with self._transport(kind) as transport:
+            entries = transport.index()
+            self.assertEqual(self.repository.entries(), entries)
+
+            solver = Solver(pallet=self.repository.load_pallet())
+            install, _ = solver.solve_best([], [Spec.parse('foo')])
+            files = plan(entries, install)
+            self.assertEqual(['bar-1.0.pcl', 'foo-1.0.pcl'],
+                             sorted(name for name, _ in files))
+            paths = fetch_all(transport, files, self.dest)
+
+        for path in paths:
+            Parcel.load_parcel(path)
+        self.assertEqual(['bar-1.0.pcl', 'foo-1.0.pcl'],
+                         sorted(os.listdir(self.dest)))
+
+    def test_keep_alive(self):
+        with HTTPTransport(self.url, connections=1) as transport:
+            transport.index()
+            fetch_all(transport, self.repository.entries().items(),
+                      self.dest, workers=3)
+        self.assertEqual(1, self.server.connections)
+
+    def _partial(self, name):
+        with open(pathjoin(self.root, name), 'rb') as f:
+            data = f.read()
+        with open(pathjoin(self.dest, name + PART_SUFFIX), 'wb') as f:
+            f.write(data[:100])
+        return len(data)
+
+    @parameterized.expand([(True,), (False,)])
+    def test_resume(self, ranges):
+        self.server.ranges = ranges
+        size = self._partial('foo-1.0.pcl')
+        entry = self.repository.entries()['foo-1.0.pcl']
+        with HTTPTransport(self.url) as transport:
+            path = download(transport, 'foo-1.0.pcl',
+                            pathjoin(self.dest, 'foo-1.0.pcl'),
+                            entry['digest'])
+        self.assertEqual(size - 100 if ranges else size, self.server.sent)
+        Parcel.load_parcel(path)
+        self.assertFalse(os.path.exists(path + PART_SUFFIX))
+
+        # Already downloaded.
+        with HTTPTransport(self.url) as transport:
+            download(transport, 'foo-1.0.pcl', path, entry['digest'])
+        self.assertEqual(size - 100 if ranges else size, self.server.sent)
+
+    def test_stale_partial(self):
+        with open(pathjoin(self.dest, 'foo-1.0.pcl' + PART_SUFFIX),
+                  'wb') as f:
+            f.write(b'x' * 100)
+        entry = self.repository.entries()['foo-1.0.pcl']
+        with HTTPTransport(self.url) as transport:
+            path = download(transport, 'foo-1.0.pcl',
+                            pathjoin(self.dest, 'foo-1.0.pcl'),
+                            entry['digest'])
+        Parcel.load_parcel(path)
+
+    def test_bad_digest(self):
+        path = pathjoin(self.dest, 'foo-1.0.pcl')
+        with HTTPTransport(self.url) as transport:
+            with self.assertRaises(BadSignatureError):
+                download(transport, 'foo-1.0.pcl', path, '00' * 64)
+        self.assertEqual([], os.listdir(self.dest))
+
+    def test_not_found(self):
+        with HTTPTransport(self.url) as transport:
+            with self.assertRaises(TransportError):
+                download(transport, 'missing.pcl',
+                         pathjoin(self.dest, 'missing.pcl'))
+            with self.assertRaises(AssertionError):
+                download(transport, '../index.json',
+                         pathjoin(self.dest, 'index.json'))
+
+    def test_escape(self):
+        entry = self.repository.entries()['foo-1.0.pcl']
+        with DirectoryTransport(self.root) as transport:
+            with self.assertRaises(AssertionError):
+                fetch_all(transport, [('../escape.pcl', entry)], self.dest)
+        self.assertNotIn('escape.pcl.part', os.listdir(self.tmp.name))
+
+    @parameterized.expand([('http',), ('directory',)])
+    def test_upload(self, kind):
+        parcel = Parcel(name='qux', version='1.0')
+        path = pathjoin(self.dest, 'qux-1.0.pcl')
+        parcel.save_parcel(path)
+        with self._transport(kind) as transport:
+            upload_all(transport, [path])
+        self.assertEqual(parcel.uuid, Parcel.load_parcel(
+            pathjoin(self.root, 'qux-1.0.pcl')).uuid)
+
+    def test_upload_mode(self):
+        path = pathjoin(self.dest, 'qux-1.0.pcl')
+        Parcel(name='qux', version='1.0').save_parcel(path)
+        with patch('parcel.utils._UMASK', 0o022), \
+                DirectoryTransport(self.root) as transport:
+            upload_all(transport, [path])
+        self.assertEqual(0o644, stat.S_IMODE(
+            os.stat(pathjoin(self.root, 'qux-1.0.pcl')).st_mode))
+
+    def test_abstract(self):
+        class Incomplete(Transport):
+            def get(self, name, f, offset=0):
+                pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def _tamper(self, key):
+        "Replaces foo by one signed with key, and updates the index."
+        parcel = Parcel.load_parcel(pathjoin(self.root, 'foo-1.0.pcl'))
+        parcel.save_parcel(pathjoin(self.root, 'foo-1.0.pcl'), key=key,
+                           overwrite=True)
+        self.repository.update()
+
+    @parameterized.expand([('http',), ('directory',)])
+    def test_untrusted(self, kind):
+        key = SigningKey.generate()
+        keyring = Keyring()
+        keyring.add('foo@example.com', key.verify_key.encode())
+        self._tamper(SigningKey.generate())
+
+        with self._transport(kind) as transport:
+            entries = transport.index()
+            files = [('foo-1.0.pcl', entries['foo-1.0.pcl'])]
+            with self.assertRaises(UntrustedKey):
+                fetch_all(transport, files, self.dest,
+                          check=partial(verify_entry, keyring=keyring))
+        self.assertEqual([], os.listdir(self.dest))
+
+    def test_download_command(self):
+        keyring = Keyring()
+        for name in ('foo', 'bar'):
+            keyring.add(f'{name}@example.com', Parcel.load_parcel(
+                pathjoin(self.root, f'{name}-1.0.pcl')).pubkey)
+        path = pathjoin(self.tmp.name, 'keyring.json')
+        keyring.save(path)
+        self._tamper(SigningKey.generate())
+
+        args = ['--dest', self.dest, '--keyring', path]
+        with redirect_stdout(StringIO()):
+            main(['parcel', 'download', self.root, 'bar'] + args)
+        with self.assertRaises(SystemExit) as e, \
+                redirect_stderr(StringIO()):
+            main(['parcel', 'download', self.root, 'foo'] + args)
+        self.assertEqual(1, e.exception.code)
+        self.assertEqual(['bar-1.0.pcl'], os.listdir(self.dest))
+
+    def test_not_entry(self):
+        entry = dict(self.repository.entries()['foo-1.0.pcl'],
+                     name='bar')
+        with HTTPTransport(self.url) as transport:
+            with self.assertRaises(BadSignatureError):
+                fetch_all(transport, [('foo-1.0.pcl', entry)], self.dest,
+                          check=verify_entry)
+        self.assertEqual([], os.listdir(self.dest))
@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from parcel.spec import Spec
+from parcel.version import (
+    Version, LegacyVersion, InvalidVersion, parse_version,
+)
+
+
+class VersionTestCase(TestCase):
+    @parameterized.expand([
+        ('1.0', '1.0'),
+        ('v1.0', '1.0'),
+        ('1.0-1', '1.0.post1'),
+        ('1.0alpha2', '1.0a2'),
+        ('1.0-preview', '1.0rc0'),
+        ('1!2.0.DEV3', '1!2.0.dev3'),
+        ('1.0+Local_5', '1.0+local.5'),
+    ])
+    def test_normalize(self, version, expected):
+        self.assertEqual(expected, str(Version(version)))
+
+    @parameterized.expand([
+        ('1.0.dev0', '1.0a1'),
+        ('1.0a1', '1.0b1'),
+        ('1.0b1', '1.0rc1'),
+        ('1.0rc1', '1.0'),
+        ('1.0', '1.0.post1'),
+        ('1.0', '1.0+local'),
+        ('1.0+abc', '1.0+5'),
+        ('1.9', '1.10'),
+        ('9.0', '1!1.0'),
+    ])
+    def test_order(self, lower, higher):
+        self.assertLess(Version(lower), Version(higher))
+        self.assertGreater(Version(higher), Version(lower))
+
+    def test_equal(self):
+        self.assertEqual(Version('1.0'), Version('1.0.0'))
+        self.assertEqual(hash(Version('1.0')), hash(Version('1.0.0')))
+        self.assertIs(parse_version('1.2'), parse_version('1.2'))
+
+    def test_invalid(self):
+        with self.assertRaises(InvalidVersion):
+            Version('one')
+
+    @parameterized.expand([('latest',), ('1.0-foo',), ('snapshot-20200101',)])
+    def test_legacy(self, version):
+        parsed = parse_version(version)
+        self.assertIsInstance(parsed, LegacyVersion)
+        self.assertEqual(version, str(parsed))
+        self.assertFalse(parsed.is_prerelease)
+        self.assertTrue(Spec('foo', version, oper='==').satisfies(
+            Spec.parse(f'foo=={version}')))
+
+    def test_legacy_order(self):
+        # As pkg_resources.parse_version() from setuptools.
+        versions = ['foo', 'latest', 'snapshot-20200101', '1.0-dev-x',
+                    '1.0-bar', '1.0-foo', '1.0foo', '2.0-foo', '0.1',
+                    '1.0-rc', '1.0']
+        self.assertEqual(versions, sorted(reversed(versions),
+                                          key=parse_version))
+        self.assertEqual(parse_version('1.0-foo'), parse_version('1.0.0-foo'))